@@ -158,6 +158,107 @@ SIMPLE_JWT = {
 # CORS 配置
 CORS_ALLOW_ALL_ORIGINS = True  # 仅在开发环境使用，生产环境应该设置具体的源
 
+# 缓存配置：CACHE_BACKEND 可选 locmem（进程内，仅适用于开发环境）、file（同一服务器的多个工作进程共享）、
+# redis（多台服务器共享，需要安装 redis 依赖）。验证码、版本戳和接口响应缓存均保存在此缓存中。
+# CACHE_KEY_PREFIX 区分共用同一缓存的多个部署，修改 CACHE_VERSION 可使全部缓存失效
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKEND_CLASSES = {
+    'locmem': 'push.cache_backends.StatsLocMemCache',
+    'file': 'push.cache_backends.StatsFileBasedCache',
+    'redis': 'push.cache_backends.StatsRedisCache',
+}
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': 'lightning-push',
+    'file': str(BASE_DIR / 'cache'),
+    'redis': 'redis://127.0.0.1:6379/0',
+}
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND_CLASSES[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'lightning_push'),
+        'VERSION': int(os.environ.get('CACHE_VERSION', 1)),
+        'TIMEOUT': 300,
+    }
+}
+
+# 进程内路由表和分发规则缓存的最长使用时间（秒），到期后即使版本戳未变化也重新加载，
+# 使 queryset.update() 等不触发信号的修改以及 locmem 缓存下其他进程的修改最终生效；0 表示只依赖版本戳
+PROCESS_CACHE_MAX_AGE = int(os.environ.get('PROCESS_CACHE_MAX_AGE', 30))
+
+# 消息推送配置
+# 已编译jinja2模板的LRU缓存容量
+TEMPLATE_CACHE_SIZE = 256
+# Webhook连接池：每个主机的最大连接数与连接/读取超时（秒）
+WEBHOOK_POOL_SIZE = int(os.environ.get('WEBHOOK_POOL_SIZE', 10))
+WEBHOOK_CONNECT_TIMEOUT = float(os.environ.get('WEBHOOK_CONNECT_TIMEOUT', 3))
+WEBHOOK_READ_TIMEOUT = float(os.environ.get('WEBHOOK_READ_TIMEOUT', 10))
+# 异步发送：默认使用异步模式的接口（URL名称），请求参数 ?async=true/false 可单独覆盖
+ASYNC_PUSH_ENDPOINTS = [
+    # 'public-message-push',
+    # 'public-message-push-by-name',
+    # 'template-direct-push',
+    # 'distribution-push',
+]
+# 进程内发送线程数；设置 ASYNC_PUSH_IN_PROCESS_WORKERS=False 时改由 process_delivery_queue 命令消费队列
+ASYNC_PUSH_WORKERS = int(os.environ.get('ASYNC_PUSH_WORKERS', 4))
+ASYNC_PUSH_IN_PROCESS_WORKERS = os.environ.get('ASYNC_PUSH_IN_PROCESS_WORKERS', 'true').lower() == 'true'
+ASYNC_PUSH_POLL_INTERVAL = 5
+# 发送中的消息超过该时间（秒）仍未完成视为中断：发送队列认领的消息由 process_delivery_queue --requeue-stale 重新排队，
+# 同步发送的消息由数据保留任务标记为失败
+DELIVERY_STALE_SECONDS = int(os.environ.get('DELIVERY_STALE_SECONDS', 300))
+# 分发推送：单次请求的最大并发发送数，以及每个机器人的最大并发发送数
+DISTRIBUTION_PUSH_CONCURRENCY = int(os.environ.get('DISTRIBUTION_PUSH_CONCURRENCY', 8))
+DISTRIBUTION_ROBOT_CONCURRENCY = int(os.environ.get('DISTRIBUTION_ROBOT_CONCURRENCY', 2))
+# 发送频率限制：各平台机器人每分钟最多发送的消息数（可在机器人上单独配置），超过后消息排队等待
+ROBOT_RATE_LIMITS = {
+    'wechat': int(os.environ.get('WECHAT_RATE_LIMIT', 20)),
+    'feishu': int(os.environ.get('FEISHU_RATE_LIMIT', 100)),
+    'dingtalk': int(os.environ.get('DINGTALK_RATE_LIMIT', 20)),
+}
+# 超过发送频率限制时在发送线程中最多等待的秒数，需要等待更久的消息重新排队到下一个可用时间
+ROBOT_RATE_LIMIT_MAX_WAIT = float(os.environ.get('ROBOT_RATE_LIMIT_MAX_WAIT', 1))
+# 各平台单条消息内容的最大字节数（UTF-8），合并发送时超过该大小拆分为多条
+ROBOT_MESSAGE_SIZE_LIMITS = {
+    'wechat': 4096,
+    'feishu': 18000,
+    'dingtalk': 18000,
+}
+# 发送重试：各平台的最大发送次数（包含首次发送），超时、5xx、频率限制等可重试的错误按指数退避（秒，带随机抖动）重试，
+# 次数用尽后写入死信表，可通过 /api/dead-letters/replay/ 重新发送
+DELIVERY_MAX_ATTEMPTS = {
+    'wechat': int(os.environ.get('WECHAT_MAX_ATTEMPTS', 5)),
+    'feishu': int(os.environ.get('FEISHU_MAX_ATTEMPTS', 5)),
+    'dingtalk': int(os.environ.get('DINGTALK_MAX_ATTEMPTS', 5)),
+}
+DELIVERY_RETRY_BASE_DELAY = float(os.environ.get('DELIVERY_RETRY_BASE_DELAY', 5))
+DELIVERY_RETRY_MAX_DELAY = float(os.environ.get('DELIVERY_RETRY_MAX_DELAY', 300))
+# 熔断器：按Webhook主机（host）或按Webhook地址即每个机器人（url）熔断，off 表示关闭；
+# 窗口期（秒）内请求数达到最小请求数且失败率或慢请求（毫秒）比例超过阈值时打开，打开指定秒数后放行一个探测请求
+CIRCUIT_BREAKER_SCOPE = os.environ.get('CIRCUIT_BREAKER_SCOPE', 'host')
+CIRCUIT_BREAKER_WINDOW = int(os.environ.get('CIRCUIT_BREAKER_WINDOW', 60))
+CIRCUIT_BREAKER_MIN_REQUESTS = int(os.environ.get('CIRCUIT_BREAKER_MIN_REQUESTS', 10))
+CIRCUIT_BREAKER_ERROR_RATE = float(os.environ.get('CIRCUIT_BREAKER_ERROR_RATE', 0.5))
+CIRCUIT_BREAKER_SLOW_RATE = float(os.environ.get('CIRCUIT_BREAKER_SLOW_RATE', 0.5))
+CIRCUIT_BREAKER_SLOW_MS = float(os.environ.get('CIRCUIT_BREAKER_SLOW_MS', 5000))
+CIRCUIT_BREAKER_OPEN_SECONDS = int(os.environ.get('CIRCUIT_BREAKER_OPEN_SECONDS', 30))
+# 告警去重：窗口期（秒）内重复的告警只计数，不写入告警记录也不推送，默认 0 表示不去重；
+# 按 Alertmanager 的告警指纹（fingerprint）或标签集合（labels）去重，ALERT_DEDUP_LABELS 为空时使用全部标签
+ALERT_DEDUP_WINDOW = int(os.environ.get('ALERT_DEDUP_WINDOW', 0))
+ALERT_DEDUP_KEY = os.environ.get('ALERT_DEDUP_KEY', 'fingerprint')
+ALERT_DEDUP_LABELS = [name for name in os.environ.get('ALERT_DEDUP_LABELS', '').split(',') if name]
+# 压缩存储：超过该长度（字符数）的格式化消息内容压缩后保存
+COMPRESSED_TEXT_THRESHOLD = int(os.environ.get('COMPRESSED_TEXT_THRESHOLD', 1024))
+# 数据保留：消息日志和告警记录的保留天数，0 表示永久保留；清理时每批删除的记录数
+MESSAGE_LOG_RETENTION_DAYS = int(os.environ.get('MESSAGE_LOG_RETENTION_DAYS', 90))
+ALERT_RECORD_RETENTION_DAYS = int(os.environ.get('ALERT_RECORD_RETENTION_DAYS', 30))
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 1000))
+# 未被引用的原始数据最近一次写入或复用超过该时间（秒）后才清理，避免删除正要被新记录引用的数据
+PAYLOAD_ORPHAN_GRACE_SECONDS = int(os.environ.get('PAYLOAD_ORPHAN_GRACE_SECONDS', 3600))
+# 接口响应缓存时间（秒）：仪表盘接口和模板信息接口，相关数据变化时缓存立即失效
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 30))
+TEMPLATE_INFO_CACHE_TTL = int(os.environ.get('TEMPLATE_INFO_CACHE_TTL', 600))
+
 # 日志配置
 LOGGING = {
     'version': 1,
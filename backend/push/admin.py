@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Template, Robot, MessageLog, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel
+from .models import (
+    Template, Robot, MessageLog, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel, DeadLetter
+)
 
 
 @admin.register(Template)
@@ -20,7 +22,10 @@ class RobotAdmin(admin.ModelAdmin):
 class MessageLogAdmin(admin.ModelAdmin):
     list_display = ('template', 'robot', 'status', 'created_by', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('content', 'raw_data', 'error_message')
+    # 格式化内容可能压缩保存，不支持模糊查询
+    search_fields = ('template__name', 'robot__name', 'error_message')
+    exclude = ('content_payload', 'raw_payload')
+    readonly_fields = ('content', 'raw_data')
 
 
 @admin.register(DistributionRule)
@@ -38,6 +43,9 @@ class InstanceMappingAdmin(admin.ModelAdmin):
     search_fields = ('instance_name',)
     filter_horizontal = ('distribution_channels',)  # 更新为分发通道的多对多字段
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('distribution_channels')
+    
     def channel_count(self, obj):
         return obj.channel_count
     channel_count.short_description = '分发通道数量'
@@ -55,5 +63,14 @@ class DistributionChannelAdmin(admin.ModelAdmin):
 class AlertRecordAdmin(admin.ModelAdmin):
     list_display = ('instance_mapping', 'rule_name', 'processed', 'alert_time')
     list_filter = ('processed', 'alert_time')
-    search_fields = ('instance_mapping__instance_name', 'alert_content')
-    readonly_fields = ('alert_time',)
+    search_fields = ('instance_mapping__instance_name', 'rule_name')
+    exclude = ('raw_payload',)
+    readonly_fields = ('alert_time', 'raw_data')
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('message_log', 'robot', 'attempts', 'last_error', 'created_by', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('robot__name', 'last_error')
+    raw_id_fields = ('message_log',)
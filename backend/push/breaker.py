@@ -0,0 +1,189 @@
+import time
+import hashlib
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """熔断器打开时直接拒绝请求
+
+    属于连接错误，发送方法将其作为可重试的错误返回，消息进入重试队列。
+    """
+
+
+class CircuitBreaker:
+    """Webhook熔断器
+
+    按目标主机（或按完整的Webhook地址，即每个机器人）统计时间窗口内的请求数、失败数和慢请求数，
+    失败率或慢请求率超过阈值时打开熔断器，之后的请求不再等待连接和读取超时而是立即失败。
+    打开一段时间后进入半开状态，只放行一个探测请求：成功则关闭，失败则重新打开。
+
+    熔断状态和窗口计数保存在共享缓存中，所有工作进程共用同一个熔断器。
+    查询接口列出的熔断器由机器人表中的Webhook地址得出，不需要在缓存中登记。
+    """
+
+    def __init__(self, scope='host', window=60, min_requests=10, error_rate=0.5, slow_rate=0.5,
+                 slow_ms=5000, open_seconds=30):
+        self.scope = scope
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def enabled(self):
+        return self.scope in ('host', 'url')
+
+    def get_key(self, url, host):
+        """熔断器的键：按主机，或按Webhook地址（地址中包含密钥，只使用其哈希）"""
+        if self.scope == 'url':
+            return f"{host}#{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}"
+        return host
+
+    def _counter_keys(self, key, bucket):
+        prefix = f'breaker_{key}_{bucket}'
+        return f'{prefix}_total', f'{prefix}_errors', f'{prefix}_slow'
+
+    def get_state(self, key, opened_at=None):
+        """熔断器当前状态"""
+        if opened_at is None:
+            opened_at = cache.get(f'breaker_state_{key}')
+        if opened_at is None:
+            return CLOSED
+        return OPEN if time.time() - opened_at < self.open_seconds else HALF_OPEN
+
+    def check(self, key):
+        """熔断器打开时抛出 CircuitOpenError
+
+        只读取状态，不占用半开状态的探测名额，用于在消耗发送配额等资源之前提前拒绝。
+        """
+        if self.get_state(key) == OPEN:
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{key} 熔断中，请求已被拒绝")
+
+    def before_request(self, key):
+        """请求前检查熔断器，拒绝时抛出 CircuitOpenError，返回请求时的状态"""
+        state = self.get_state(key)
+        # 半开状态只放行一个探测请求，探测请求异常退出时在打开时长后可再次探测
+        if state == OPEN or (state == HALF_OPEN and not cache.add(f'breaker_probe_{key}', 1, self.open_seconds)):
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{key} 熔断中，请求已被拒绝")
+        return state
+
+    def after_request(self, key, state, latency_ms, failed):
+        """记录请求结果，更新熔断器状态"""
+        slow = latency_ms >= self.slow_ms
+        if state == HALF_OPEN:
+            cache.delete(f'breaker_probe_{key}')
+            if failed or slow:
+                self._open(key)
+            else:
+                # 清空打开前的窗口计数，避免关闭后立即再次打开
+                cache.delete_many([
+                    f'breaker_state_{key}', *self._counter_keys(key, int(time.time() // self.window))
+                ])
+                logger.info(f"{key} 探测请求成功，熔断器关闭")
+            return
+
+        total_key, errors_key, slow_key = self._counter_keys(key, int(time.time() // self.window))
+        total = self._incr(total_key)
+        if failed:
+            self._incr(errors_key)
+        if slow:
+            self._incr(slow_key)
+        if total < self.min_requests or not (failed or slow):
+            return
+
+        counts = cache.get_many([errors_key, slow_key])
+        if counts.get(errors_key, 0) / total >= self.error_rate or counts.get(slow_key, 0) / total >= self.slow_rate:
+            self._open(key)
+
+    def _incr(self, key):
+        cache.add(key, 0, self.window * 2)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # 计数在 add 和 incr 之间过期
+            cache.set(key, 1, self.window * 2)
+            return 1
+
+    def _open(self, key):
+        cache.set(f'breaker_state_{key}', time.time(), None)
+        with self._lock:
+            self.trips += 1
+        logger.warning(f"{key} 失败率或慢请求率过高，熔断器打开 {self.open_seconds} 秒")
+
+    def get_keys(self):
+        """所有机器人的Webhook地址对应的熔断器键"""
+        from .models import Robot
+        from .transport import WebhookSessionPool
+
+        return sorted({
+            self.get_key(url, WebhookSessionPool.get_host(url))
+            for url in Robot.objects.values_list('webhook_url', flat=True)
+        })
+
+    def status(self, key):
+        """单个熔断器的状态和当前窗口的计数"""
+        opened_at = cache.get(f'breaker_state_{key}')
+        total_key, errors_key, slow_key = self._counter_keys(key, int(time.time() // self.window))
+        counts = cache.get_many([total_key, errors_key, slow_key])
+        total = counts.get(total_key, 0)
+        return {
+            'key': key,
+            'state': self.get_state(key, opened_at),
+            'opened_at': opened_at,
+            'requests': total,
+            'errors': counts.get(errors_key, 0),
+            'slow': counts.get(slow_key, 0),
+            'error_rate': round(counts.get(errors_key, 0) / total, 4) if total else 0.0,
+        }
+
+    def stats(self):
+        """所有熔断器的状态"""
+        with self._lock:
+            rejected, trips = self.rejected, self.trips
+        return {
+            'scope': self.scope,
+            'rejected': rejected,
+            'trips': trips,
+            'breakers': [self.status(key) for key in self.get_keys()],
+        }
+
+    def reset(self, key=None):
+        """关闭熔断器并清空当前窗口的计数，未指定键时重置全部熔断器，返回重置的键"""
+        keys = [key] if key else self.get_keys()
+        bucket = int(time.time() // self.window)
+        for item in keys:
+            cache.delete_many([
+                f'breaker_state_{item}', f'breaker_probe_{item}', *self._counter_keys(item, bucket)
+            ])
+        return keys
+
+
+circuit_breaker = CircuitBreaker(
+    scope=getattr(settings, 'CIRCUIT_BREAKER_SCOPE', 'host'),
+    window=getattr(settings, 'CIRCUIT_BREAKER_WINDOW', 60),
+    min_requests=getattr(settings, 'CIRCUIT_BREAKER_MIN_REQUESTS', 10),
+    error_rate=getattr(settings, 'CIRCUIT_BREAKER_ERROR_RATE', 0.5),
+    slow_rate=getattr(settings, 'CIRCUIT_BREAKER_SLOW_RATE', 0.5),
+    slow_ms=getattr(settings, 'CIRCUIT_BREAKER_SLOW_MS', 5000),
+    open_seconds=getattr(settings, 'CIRCUIT_BREAKER_OPEN_SECONDS', 30),
+)
@@ -0,0 +1,101 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+# 版本戳名称：单个模板（按模板ID）、全部模板、机器人列表、仪表盘（按用户ID）
+TEMPLATE_VERSION = 'template_{}'
+TEMPLATES_VERSION = 'templates'
+ROBOTS_VERSION = 'robots'
+DASHBOARD_VERSION = 'dashboard_{}'
+
+
+def store_captcha(captcha_key, text, timeout=300):
+    """保存验证码文本，默认5分钟过期"""
+    cache.set(f'captcha_{captcha_key}', text, timeout)
+
+
+def get_captcha(captcha_key):
+    """获取验证码文本，不存在或已过期时返回None"""
+    return cache.get(f'captcha_{captcha_key}')
+
+
+def consume_captcha(captcha_key):
+    """删除验证码，保证每个验证码只能验证成功一次
+
+    多个工作进程同时验证同一个验证码时只有一个删除成功。
+    """
+    return cache.delete(f'captcha_{captcha_key}')
+
+
+def cache_stats():
+    """共享缓存的后端类型和命中统计"""
+    if hasattr(cache, 'stats'):
+        return cache.stats()
+    return {'backend': cache.__class__.__name__}
+
+
+def _version_key(name):
+    return f'version_{name}'
+
+
+def get_version(name):
+    """获取版本戳，不存在时初始化
+
+    版本戳保存在共享缓存中，用于通知各进程内的本地缓存重新加载。
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def get_versions(names):
+    """批量获取多个版本戳，一次读取缓存"""
+    keys = [_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    return [versions.get(key) or get_version(name) for key, name in zip(keys, names)]
+
+
+def bump_version(name):
+    """更新版本戳，使依赖该版本的本地缓存失效"""
+    version = uuid.uuid4().hex
+    cache.set(_version_key(name), version, None)
+    return version
+
+
+def cached_response(request, key, versions, build, timeout, private=False):
+    """带 ETag 的接口响应缓存
+
+    缓存渲染后的JSON和对应的ETag，缓存键包含 versions 中各版本戳，
+    相关数据变化时更新版本戳即可使缓存失效。命中缓存时不查询数据库也不重新序列化，
+    请求头 If-None-Match 与ETag一致时返回304。
+
+    build 返回DRF的Response，只有状态码为200的响应会被缓存。
+    """
+    version = ':'.join(get_versions(versions))
+    cache_key = 'response_' + hashlib.md5(f'{key}|{version}'.encode('utf-8')).hexdigest()
+
+    entry = cache.get(cache_key)
+    if entry is None:
+        response = build()
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        body = JSONRenderer().render(response.data)
+        entry = (f'"{hashlib.md5(body).hexdigest()}"', body)
+        cache.set(cache_key, entry, timeout)
+
+    etag, body = entry
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    # 客户端每次使用前需通过ETag向服务端确认
+    response['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
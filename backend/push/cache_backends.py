@@ -0,0 +1,154 @@
+import os
+import time
+import pickle
+import zlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+_MISSING = object()
+
+
+class CacheStats:
+    """缓存命中统计（进程内）
+
+    Django 为每个线程创建独立的缓存后端实例，统计数据保存在进程级的共享对象中。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.writes = 0
+            self.deletes = 0
+
+    def record(self, hits=0, misses=0, writes=0, deletes=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.writes += writes
+            self.deletes += deletes
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'writes': self.writes,
+                'deletes': self.deletes,
+            }
+
+
+cache_stats = CacheStats()
+
+
+class StatsMixin:
+    """为缓存后端记录读取命中、写入和删除次数"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            cache_stats.record(misses=1)
+            return default
+        cache_stats.record(hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        if super().get_many.__func__ is BaseCache.get_many:
+            # 默认实现逐个调用 get，已在 get 中统计
+            return super().get_many(keys, version)
+        keys = list(keys)
+        result = super().get_many(keys, version)
+        cache_stats.record(hits=len(result), misses=len(keys) - len(result))
+        return result
+
+    def set(self, key, value, timeout=None, version=None):
+        cache_stats.record(writes=1)
+        return super().set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=None, version=None):
+        cache_stats.record(writes=1)
+        return super().add(key, value, timeout, version)
+
+    def delete(self, key, version=None):
+        cache_stats.record(deletes=1)
+        return super().delete(key, version)
+
+    def stats(self):
+        return {'backend': self.__class__.__name__, **cache_stats.snapshot()}
+
+
+class StatsLocMemCache(StatsMixin, LocMemCache):
+    """进程内缓存，仅适用于开发环境或单进程部署"""
+
+
+class StatsFileBasedCache(StatsMixin, FileBasedCache):
+    """文件缓存，同一台服务器上的多个工作进程共享
+
+    限流锁、告警去重和熔断器依赖 add 只有一个调用方成功、incr 不丢失计数。
+    Django 的文件缓存先检查再写入、先读取再写回，多个进程同时操作同一个键时会互相覆盖，
+    这里在文件锁内执行 add 和 incr。锁文件按缓存文件名的前两位分为256个，不随键的数量增长。
+    """
+
+    lock_suffix = '.lock'
+
+    @contextmanager
+    def _key_lock(self, fname):
+        """缓存文件对应的进程间排他锁"""
+        self._createdir()
+        lock_path = os.path.join(self._dir, os.path.basename(fname)[:2] + self.lock_suffix)
+        with open(lock_path, 'ab') as f:
+            locks.lock(f, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(f)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._key_lock(self._key_to_file(key, version)):
+            return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        """在文件锁内读取并写回，保留原有的过期时间"""
+        fname = self._key_to_file(key, version)
+        with self._key_lock(fname):
+            try:
+                with open(fname, 'rb') as f:
+                    expiry = pickle.load(f)
+                    value = pickle.loads(zlib.decompress(f.read()))
+            except (FileNotFoundError, EOFError):
+                expiry, value = 0, None
+            if value is None or (expiry is not None and expiry < time.time()):
+                raise ValueError(f"Key '{key}' not found")
+
+            value += delta
+            fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+            renamed = False
+            try:
+                with open(fd, 'wb') as f:
+                    f.write(pickle.dumps(expiry, self.pickle_protocol))
+                    f.write(zlib.compress(pickle.dumps(value, self.pickle_protocol)))
+                file_move_safe(tmp_path, fname, allow_overwrite=True)
+                renamed = True
+            finally:
+                if not renamed:
+                    os.remove(tmp_path)
+        cache_stats.record(writes=1)
+        return value
+
+
+class StatsRedisCache(StatsMixin, RedisCache):
+    """Redis缓存，多台服务器共享，需要安装 redis 依赖"""
@@ -1,59 +1,84 @@
 import datetime
 import calendar
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 
-from .models import Template, Robot, MessageLog, RobotType
+from .models import Robot, MessageLog, MessageLogDailyRollup, RobotType, DeliveryStatus
 from .serializers import MessageLogSerializer
+from .stats import StatsService
+from .cache import cached_response, DASHBOARD_VERSION
 
 
-class DashboardStatsView(APIView):
+class DashboardCacheMixin:
+    """仪表盘接口的响应缓存
+
+    按用户和查询参数缓存，用户的消息、模板、机器人变化时通过版本戳失效，
+    并在 DASHBOARD_CACHE_TTL 秒后过期以更新按当前日期计算的时间范围。
+    """
+    
+    def get(self, request):
+        key = f'{request.resolver_match.url_name}_{request.user.pk}_{request.GET.urlencode()}'
+        return cached_response(
+            request,
+            key,
+            [DASHBOARD_VERSION.format(request.user.pk)],
+            lambda: self.build_response(request),
+            getattr(settings, 'DASHBOARD_CACHE_TTL', 30),
+            private=True
+        )
+
+
+class DashboardStatsView(DashboardCacheMixin, APIView):
     """仪表盘数据统计视图"""
     permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request):
-        # 获取当前用户创建的模板总数
-        template_count = Template.objects.filter(created_by=request.user).count()
-        
-        # 获取当前用户创建的机器人总数
-        robot_count = Robot.objects.filter(created_by=request.user).count()
-        
-        # 获取当前月份
-        today = timezone.now()
-        first_day = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # 获取本月消息发送总数
-        current_month_messages = MessageLog.objects.filter(
-            created_by=request.user,
-            created_at__gte=first_day
-        ).count()
-        
-        # 构建响应数据
-        response_data = {
-            "template_count": template_count,
-            "robot_count": robot_count,
-            "current_month_messages": current_month_messages
-        }
+    def build_response(self, request):
+        # 模板数、机器人数和本月消息数读取增量维护的计数表，与日志数量无关
+        response_data = StatsService.get_dashboard_stats(request.user)
         
         return Response(response_data, status=status.HTTP_200_OK)
 
 
-class DashboardChartView(APIView):
-    """仪表盘图表数据视图"""
+class DashboardChartView(DashboardCacheMixin, APIView):
+    """仪表盘图表数据视图
+    
+    GET /api/dashboard/charts/?time_range=week|month|custom&granularity=day|hour&start_date=YYYY-MM-DD&end_date=YYYY-MM-DD
+    """
     permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request):
+    # 不同粒度下允许查询的最大天数，避免一次生成过多数据点
+    MAX_DAYS = {'day': 366, 'hour': 31}
+    
+    def build_response(self, request):
         time_range = request.query_params.get('time_range', 'week')
+        granularity = request.query_params.get('granularity', 'day')
+        
+        if granularity not in self.MAX_DAYS:
+            return Response({"error": "granularity 仅支持 day 或 hour"}, status=status.HTTP_400_BAD_REQUEST)
         
         if time_range == 'week':
             # 获取本周数据
-            chart_data = self._get_week_data(request.user)
+            start_date, end_date, label_format = self._get_week_range()
+        elif time_range == 'custom':
+            # 获取自定义日期范围数据
+            try:
+                start_date, end_date = self._parse_date_range(request.query_params, granularity)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            label_format = '%m-%d'
         else:
             # 获取本月数据
-            chart_data = self._get_month_data(request.user)
+            start_date, end_date, label_format = self._get_month_range()
+        
+        if granularity == 'hour':
+            label_format = '%H:00' if start_date == end_date else '%m-%d %H:00'
+        
+        chart_data = self._get_trend_data(request.user, start_date, end_date, granularity, label_format)
         
         # 获取机器人类型占比
         robot_type_stats = self._get_robot_type_stats(request.user)
@@ -65,83 +90,110 @@ class DashboardChartView(APIView):
         
         return Response(response_data, status=status.HTTP_200_OK)
     
-    def _get_week_data(self, user):
-        """获取本周数据"""
-        today = timezone.now()
-        # 计算本周的起始日期（周一）
+    @staticmethod
+    def _get_week_range():
+        """本周（周一到周日）的日期范围"""
+        today = timezone.localdate()
         start_of_week = today - datetime.timedelta(days=today.weekday())
-        start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # 准备7天数据存储结构
-        days = []
-        success_data = [0] * 7
-        fail_data = [0] * 7
-        
-        # 生成周一到周日的日期
-        for i in range(7):
-            day = start_of_week + datetime.timedelta(days=i)
-            days.append(day.strftime('%m-%d'))
-            
-            # 查询当天成功消息数
-            success_count = MessageLog.objects.filter(
-                created_by=user,
-                created_at__date=day.date(),
-                status=True
-            ).count()
-            success_data[i] = success_count
-            
-            # 查询当天失败消息数
-            fail_count = MessageLog.objects.filter(
-                created_by=user,
-                created_at__date=day.date(),
-                status=False
-            ).count()
-            fail_data[i] = fail_count
-        
-        return {
-            "categories": days,
-            "series": [
-                {"name": "成功", "data": success_data},
-                {"name": "失败", "data": fail_data}
-            ]
-        }
+        return start_of_week, start_of_week + datetime.timedelta(days=6), '%m-%d'
     
-    def _get_month_data(self, user):
-        """获取本月数据"""
-        today = timezone.now()
-        # 获取本月第一天
-        first_day = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        # 获取本月天数
+    @staticmethod
+    def _get_month_range():
+        """本月的日期范围"""
+        today = timezone.localdate()
         _, last_day = calendar.monthrange(today.year, today.month)
-        
-        # 准备每天数据存储结构
-        days = []
-        success_data = [0] * last_day
-        fail_data = [0] * last_day
-        
-        # 生成每一天的日期
-        for i in range(last_day):
-            day = first_day + datetime.timedelta(days=i)
-            days.append(day.strftime('%d'))
-            
-            # 查询当天成功消息数
-            success_count = MessageLog.objects.filter(
-                created_by=user,
-                created_at__date=day.date(),
-                status=True
-            ).count()
-            success_data[i] = success_count
-            
-            # 查询当天失败消息数
-            fail_count = MessageLog.objects.filter(
-                created_by=user,
-                created_at__date=day.date(),
-                status=False
-            ).count()
-            fail_data[i] = fail_count
+        return today.replace(day=1), today.replace(day=last_day), '%d'
+    
+    def _parse_date_range(self, params, granularity):
+        """解析自定义日期范围，结束日期包含在内"""
+        try:
+            start_date = datetime.date.fromisoformat(params.get('start_date', ''))
+            end_date = datetime.date.fromisoformat(params.get('end_date', ''))
+        except ValueError:
+            raise ValueError("start_date 和 end_date 必须为 YYYY-MM-DD 格式")
+        
+        if start_date > end_date:
+            raise ValueError("start_date 不能晚于 end_date")
+        
+        max_days = self.MAX_DAYS[granularity]
+        if (end_date - start_date).days + 1 > max_days:
+            raise ValueError(f"查询范围不能超过 {max_days} 天")
+        return start_date, end_date
+    
+    @staticmethod
+    def get_trend_queryset(user, start, end, granularity):
+        """[start, end) 内已完成发送的消息按天或小时分组的成功/失败数"""
+        current_tz = timezone.get_current_timezone()
+        if granularity == 'hour':
+            bucket = TruncHour('created_at', tzinfo=current_tz)
+        else:
+            bucket = TruncDate('created_at', tzinfo=current_tz)
+        
+        return MessageLog.objects.filter(
+            created_by=user,
+            created_at__gte=start,
+            created_at__lt=end,
+            delivery_status=DeliveryStatus.DONE
+        ).order_by().annotate(bucket=bucket).values('bucket').annotate(
+            success=Count('id', filter=Q(status=True)),
+            fail=Count('id', filter=Q(status=False))
+        )
+    
+    @staticmethod
+    def _get_trend_data(user, start_date, end_date, granularity, label_format):
+        """按天或小时统计成功/失败消息数
+        
+        使用一次分组聚合查询，时间条件为 created_at 上的范围比较以便使用索引，
+        没有消息的时间段在Python中补零。按天统计时合并已清理日志的日汇总数据，
+        日汇总没有小时信息，按小时统计时不包含已清理的日志。
+        排队、发送中和等待重试的消息还没有结果，不计入成功或失败数。
+        """
+        current_tz = timezone.get_current_timezone()
+        start = datetime.datetime.combine(start_date, datetime.time.min, tzinfo=current_tz)
+        end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min, tzinfo=current_tz)
+        
+        step = datetime.timedelta(hours=1) if granularity == 'hour' else datetime.timedelta(days=1)
+        rows = DashboardChartView.get_trend_queryset(user, start, end, granularity)
+        
+        counts = {}
+        for row in rows:
+            key = row['bucket']
+            if granularity == 'hour':
+                key = timezone.localtime(key, current_tz).replace(tzinfo=None)
+            counts[key] = (row['success'], row['fail'])
+        
+        if granularity == 'day':
+            rollups = MessageLogDailyRollup.objects.filter(
+                user=user,
+                date__gte=start_date,
+                date__lte=end_date
+            ).order_by().values('date').annotate(
+                success=Sum('count', filter=Q(status=True)),
+                fail=Sum('count', filter=Q(status=False))
+            )
+            for row in rollups:
+                success, fail = counts.get(row['date'], (0, 0))
+                counts[row['date']] = (success + (row['success'] or 0), fail + (row['fail'] or 0))
+        
+        # 生成完整的时间序列，缺失的时间段补零
+        categories = []
+        success_data = []
+        fail_data = []
+        if granularity == 'hour':
+            current = datetime.datetime.combine(start_date, datetime.time.min)
+            last = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+        else:
+            current = start_date
+            last = end_date + datetime.timedelta(days=1)
+        while current < last:
+            success, fail = counts.get(current, (0, 0))
+            categories.append(current.strftime(label_format))
+            success_data.append(success)
+            fail_data.append(fail)
+            current += step
         
         return {
-            "categories": days,
+            "categories": categories,
             "series": [
                 {"name": "成功", "data": success_data},
                 {"name": "失败", "data": fail_data}
@@ -170,15 +222,22 @@ class DashboardChartView(APIView):
         return result
 
 
-class DashboardRecentLogsView(APIView):
+class DashboardRecentLogsView(DashboardCacheMixin, APIView):
     """仪表盘最近消息记录视图"""
     permission_classes = [permissions.IsAuthenticated]
     
-    def get(self, request):
-        # 获取最近5条消息记录
-        recent_logs = MessageLog.objects.filter(
-            created_by=request.user
+    @staticmethod
+    def get_recent_logs(user):
+        """用户最近5条消息记录"""
+        return MessageLog.objects.filter(
+            created_by=user
+        ).select_related(
+            'template', 'robot', 'created_by', 'content_payload', 'raw_payload'
         ).order_by('-created_at')[:5]
+    
+    def build_response(self, request):
+        # 获取最近5条消息记录
+        recent_logs = self.get_recent_logs(request.user)
         
         # 序列化数据
         serializer = MessageLogSerializer(recent_logs, many=True)
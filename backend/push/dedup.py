@@ -0,0 +1,99 @@
+import json
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class AlertDeduplicator:
+    """告警去重
+
+    Alertmanager 每隔 repeat_interval 重复发送仍在触发的告警，高可用部署的每个副本也会各发送一次。
+    按告警指纹（或标签集合的哈希）在共享缓存中登记，窗口期内重复的告警不再写入告警记录、
+    不再推送，只累加重复次数。告警状态（firing/resolved）参与计算，恢复通知不会被当作重复告警。
+
+    只处理 Alertmanager 格式（包含 alerts 数组）的数据，其他格式的数据原样通过。
+    告警在处理前登记，处理失败时需调用 release 撤销登记，否则副本重发的同一告警会被当作重复告警丢弃。
+    """
+
+    def __init__(self, window=0, key='fingerprint', labels=None):
+        self.window = window
+        self.key = key
+        self.labels = labels or []
+        self._lock = threading.Lock()
+        self.received = 0
+        self.duplicates = 0
+
+    def get_fingerprint(self, alert):
+        """计算告警指纹：优先使用 Alertmanager 提供的 fingerprint，否则为标签集合的哈希"""
+        status = alert.get('status', '')
+        if self.key == 'fingerprint' and alert.get('fingerprint'):
+            return f"{alert['fingerprint']}:{status}"
+
+        labels = alert.get('labels') or {}
+        if self.labels:
+            labels = {name: labels.get(name) for name in self.labels}
+        digest = hashlib.sha1(json.dumps(labels, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f"{digest}:{status}"
+
+    def filter(self, document, scope):
+        """过滤窗口期内重复的告警
+
+        scope 区分不同的接口，同一条告警发往不同接口时分别去重。
+        返回 (去重后的数据, 重复告警数)，全部重复时数据的 alerts 为空数组；
+        非 Alertmanager 格式的数据（包括无法解析为JSON的文本告警）原样返回，重复告警数为0。
+        """
+        if not self.window or not isinstance(document, dict) or not isinstance(document.get('alerts'), list):
+            return document, 0
+
+        alerts = document['alerts']
+        fresh = [
+            alert for alert in alerts
+            if not isinstance(alert, dict)
+            # cache.add 只在键不存在时写入，多个进程同时收到同一告警时只有一个成功
+            or cache.add(f'alert_dedup_{scope}_{self.get_fingerprint(alert)}', 1, self.window)
+        ]
+        duplicates = len(alerts) - len(fresh)
+        self._record(len(alerts), duplicates)
+
+        if not duplicates:
+            return document, 0
+        return {**document, 'alerts': fresh}, duplicates
+
+    def release(self, document, scope):
+        """撤销 filter 返回的数据中告警的登记，窗口期内再次收到时重新处理"""
+        if not self.window or not isinstance(document, dict) or not isinstance(document.get('alerts'), list):
+            return
+        cache.delete_many([
+            f'alert_dedup_{scope}_{self.get_fingerprint(alert)}'
+            for alert in document['alerts'] if isinstance(alert, dict)
+        ])
+
+    def _record(self, received, duplicates):
+        """累加本进程和共享缓存中的重复告警数"""
+        with self._lock:
+            self.received += received
+            self.duplicates += duplicates
+        if duplicates:
+            cache.add('alert_dedup_duplicates', 0, None)
+            cache.incr('alert_dedup_duplicates', duplicates)
+
+    def stats(self):
+        with self._lock:
+            received, duplicates = self.received, self.duplicates
+        return {
+            'window': self.window,
+            'key': self.key,
+            'received': received,
+            'duplicates': duplicates,
+            'duplicate_rate': round(duplicates / received, 4) if received else 0.0,
+            'total_duplicates': cache.get('alert_dedup_duplicates', 0),
+        }
+
+
+alert_deduplicator = AlertDeduplicator(
+    window=getattr(settings, 'ALERT_DEDUP_WINDOW', 0),
+    key=getattr(settings, 'ALERT_DEDUP_KEY', 'fingerprint'),
+    labels=getattr(settings, 'ALERT_DEDUP_LABELS', None),
+)
@@ -0,0 +1,274 @@
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import MessageLog, DeliveryStatus, DeadLetter
+from .retry import RetryScheduled
+from .services import MessagePushService
+from .stats import StatsService
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryQueue:
+    """基于数据库的异步发送队列
+
+    排队中的消息日志即为队列中的任务，无需额外的消息中间件。
+    任务通过条件更新认领，多个线程或进程可以同时消费同一个队列。
+
+    开启消息合并的分发通道，消息排队到合并窗口结束（或排队数达到最大合并条数）后，
+    与同一通道的其他排队消息一起认领并合并为一条发送。
+    """
+
+    def __init__(self, workers=4, poll_interval=5, stale_after=300):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self._threads = []
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    def enqueue(self, template, robot, data, user=None, channel=None):
+        """将消息加入队列，返回排队中的消息日志
+
+        channel 开启了消息合并时，消息在合并窗口结束后发送。
+        """
+        if channel is None or not channel.coalesce_window:
+            message_log = MessagePushService.create_message_log(template, robot, data, user=user, queued=True)
+            self.notify()
+            return message_log
+
+        message_log = MessagePushService.create_message_log(
+            template, robot, data, user=user, queued=True, channel=channel,
+            scheduled_at=timezone.now() + timedelta(seconds=channel.coalesce_window)
+        )
+        pending = MessageLog.objects.filter(
+            self.fresh_filter(), channel=channel, delivery_status=DeliveryStatus.QUEUED
+        )
+        if pending.count() >= max(channel.coalesce_max_batch, 1):
+            # 达到最大合并条数，不再等待窗口结束
+            pending.update(scheduled_at=timezone.now())
+        self.notify()
+        return message_log
+
+    def notify(self):
+        """唤醒工作线程处理新任务"""
+        if getattr(settings, 'ASYNC_PUSH_IN_PROCESS_WORKERS', True):
+            self.start()
+        self._event.set()
+
+    def start(self):
+        """启动进程内工作线程"""
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(
+                    target=self._run_worker,
+                    name=f'delivery-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    @staticmethod
+    def due_filter():
+        """已到计划发送时间的排队消息"""
+        return Q(scheduled_at__isnull=True) | Q(scheduled_at__lte=timezone.now())
+
+    @staticmethod
+    def fresh_filter():
+        """尚未发送过的消息，计划发送时间只是合并窗口
+
+        等待退避重试或因发送频率限制推迟的消息已被认领过，不属于此类。
+        """
+        return Q(attempts=0, claimed_at__isnull=True)
+
+    def due_messages(self):
+        """已到计划发送时间的排队消息，按加入队列的顺序排列"""
+        return MessageLog.objects.filter(
+            self.due_filter(), delivery_status=DeliveryStatus.QUEUED
+        ).order_by('created_at', 'id')
+
+    @staticmethod
+    def _claim(message_id):
+        """认领指定的排队消息，条件更新保证同一条消息只会被一个消费者认领"""
+        return MessageLog.objects.filter(
+            pk=message_id, delivery_status=DeliveryStatus.QUEUED
+        ).update(delivery_status=DeliveryStatus.PROCESSING, claimed_at=timezone.now())
+
+    def claim_next(self):
+        """认领下一条已到计划发送时间的排队消息，没有任务时返回None"""
+        while True:
+            message_id = self.due_messages().values_list('id', flat=True).first()
+            if message_id is None:
+                return None
+
+            if self._claim(message_id):
+                return MessageLog.objects.select_related(
+                    'template', 'robot', 'raw_payload', 'channel__robot'
+                ).get(pk=message_id)
+
+    def claim_batch(self, message_log):
+        """认领同一分发通道中与该消息合并发送的其他排队消息
+
+        尚未发送过的消息不必等到合并窗口结束；等待退避重试或因发送频率限制推迟的消息
+        只在到计划发送时间后认领，不会被新消息提前带出。
+        """
+        channel = message_log.channel
+        message_ids = MessageLog.objects.filter(
+            self.due_filter() | self.fresh_filter(), channel=channel, delivery_status=DeliveryStatus.QUEUED
+        ).order_by('created_at', 'id').values_list('id', flat=True)[:max(channel.coalesce_max_batch, 1) - 1]
+        claimed = [message_id for message_id in message_ids if self._claim(message_id)]
+        batch = MessageLog.objects.select_related('template', 'robot', 'raw_payload').filter(pk__in=claimed)
+        return [message_log, *batch.order_by('created_at', 'id')]
+
+    def process(self, message_log):
+        """发送一条已认领的消息，所属分发通道开启了消息合并时与其他排队消息合并发送"""
+        if message_log.channel is not None and message_log.channel.coalesce_window:
+            batch = self.claim_batch(message_log)
+            with self._lock:
+                self.coalesced += len(batch) - 1
+            return MessagePushService.deliver_batch(batch, message_log.channel)
+
+        if message_log.template is None or message_log.robot is None:
+            return self._fail(message_log, "模板或机器人已被删除")
+
+        try:
+            data = json.loads(message_log.raw_data or '{}')
+        except json.JSONDecodeError as e:
+            return self._fail(message_log, f"消息数据解析失败: {str(e)}")
+
+        return MessagePushService.deliver(message_log, message_log.template, message_log.robot, data)
+
+    @staticmethod
+    def _fail(message_log, error_msg):
+        """将消息标记为发送失败"""
+        message_log.status = False
+        message_log.delivery_status = DeliveryStatus.DONE
+        message_log.error_message = error_msg
+        message_log.save()
+        StatsService.record_message(message_log)
+        return False, error_msg
+
+    def drain(self, limit=None):
+        """处理队列中的消息直到队列为空，返回处理数量"""
+        count = 0
+        while limit is None or count < limit:
+            message_log = self.claim_next()
+            if message_log is None:
+                break
+            try:
+                success, error_msg = self.process(message_log)
+            except Exception as e:
+                logger.error(f"异步发送消息 {message_log.pk} 失败: {str(e)}")
+                MessageLog.objects.filter(pk=message_log.pk).update(
+                    status=False,
+                    delivery_status=DeliveryStatus.DONE,
+                    error_message=f"异步发送失败: {str(e)}"
+                )
+                message_log.status = False
+                StatsService.record_message(message_log)
+                success, error_msg = False, None
+            with self._lock:
+                self.processed += 1
+                # 重新排队等待重试的消息不计为失败
+                if not success and not isinstance(error_msg, RetryScheduled):
+                    self.failed += 1
+            count += 1
+        return count
+
+    def replay(self, dead_letters):
+        """将死信消息重新放回队列并从第1次重新计数，返回重新排队的数量"""
+        message_ids = list(dead_letters.values_list('message_log_id', flat=True))
+        if not message_ids:
+            return 0
+        message_logs = MessageLog.objects.filter(pk__in=message_ids)
+        with transaction.atomic():
+            StatsService.revert_failures(message_logs)
+            message_logs.update(delivery_status=DeliveryStatus.QUEUED, scheduled_at=None, attempts=0)
+            DeadLetter.objects.filter(message_log_id__in=message_ids).delete()
+        self.notify()
+        return len(message_ids)
+
+    def requeue_stale(self, stale_after=None):
+        """将认领超过 stale_after 秒仍未完成的消息重新放回队列，用于工作进程异常退出后的恢复
+
+        正常发送一条消息远用不了这么久，其他仍在运行的工作进程正在发送的消息不会被重复发送。
+        同步发送的消息（没有认领时间）由请求线程负责，请求中断后遗留的消息由数据保留任务标记为失败。
+        """
+        stale_after = self.stale_after if stale_after is None else stale_after
+        return MessageLog.objects.filter(
+            delivery_status=DeliveryStatus.PROCESSING,
+            claimed_at__lt=timezone.now() - timedelta(seconds=stale_after)
+        ).update(delivery_status=DeliveryStatus.QUEUED)
+
+    def next_due_in(self):
+        """距离下一条等待合并的消息到计划发送时间的秒数，没有时返回None"""
+        scheduled_at = MessageLog.objects.filter(
+            delivery_status=DeliveryStatus.QUEUED, scheduled_at__isnull=False
+        ).aggregate(next=Min('scheduled_at'))['next']
+        if scheduled_at is None:
+            return None
+        return max((scheduled_at - timezone.now()).total_seconds(), 0)
+
+    def _run_worker(self):
+        """工作线程主循环"""
+        timeout = self.poll_interval
+        while True:
+            self._event.wait(timeout)
+            self._event.clear()
+            timeout = self.poll_interval
+            try:
+                self.drain()
+                # 合并窗口先于下一次轮询结束时提前唤醒
+                due_in = self.next_due_in()
+                if due_in is not None:
+                    timeout = min(timeout, due_in)
+            except Exception as e:
+                logger.error(f"发送队列处理出错: {str(e)}")
+            finally:
+                close_old_connections()
+
+    def stats(self):
+        """队列统计信息"""
+        return {
+            'workers': len(self._threads),
+            'queued': MessageLog.objects.filter(delivery_status=DeliveryStatus.QUEUED).count(),
+            'processing': MessageLog.objects.filter(delivery_status=DeliveryStatus.PROCESSING).count(),
+            'processed': self.processed,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'retrying': MessageLog.objects.filter(delivery_status=DeliveryStatus.QUEUED, attempts__gt=0).count(),
+            'dead_letters': DeadLetter.objects.count(),
+        }
+
+
+delivery_queue = DeliveryQueue(
+    workers=getattr(settings, 'ASYNC_PUSH_WORKERS', 4),
+    poll_interval=getattr(settings, 'ASYNC_PUSH_POLL_INTERVAL', 5),
+    stale_after=getattr(settings, 'DELIVERY_STALE_SECONDS', 300),
+)
+
+
+def use_async_delivery(request):
+    """判断当前请求是否使用异步发送
+
+    请求参数 async 优先，其次按 ASYNC_PUSH_ENDPOINTS 中配置的URL名称决定。
+    """
+    value = request.query_params.get('async')
+    if value is not None:
+        return value.lower() in ('1', 'true', 'yes')
+    url_name = request.resolver_match.url_name if request.resolver_match else None
+    return url_name in getattr(settings, 'ASYNC_PUSH_ENDPOINTS', ())
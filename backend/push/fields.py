@@ -0,0 +1,59 @@
+import base64
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+
+class CompressedTextField(models.TextField):
+    """透明压缩的文本字段
+
+    超过阈值的文本以 "zlib:" 前缀加 base64(zlib压缩数据) 的形式保存，
+    较短的文本和压缩后没有变小的文本按原样保存。读取时自动解压，
+    序列化器和业务代码看到的始终是原始文本。
+
+    压缩后的内容无法在数据库中进行模糊查询。
+    """
+    PREFIX = 'zlib:'
+
+    def __init__(self, *args, threshold=None, **kwargs):
+        self.threshold = threshold
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.threshold is not None:
+            kwargs['threshold'] = self.threshold
+        return name, path, args, kwargs
+
+    def get_threshold(self):
+        if self.threshold is not None:
+            return self.threshold
+        return getattr(settings, 'COMPRESSED_TEXT_THRESHOLD', 1024)
+
+    @classmethod
+    def compress(cls, value, threshold):
+        """压缩文本，返回数据库中保存的形式"""
+        # 以前缀开头的原始文本必须压缩保存，否则读取时会被误认为压缩数据
+        if len(value) <= threshold and not value.startswith(cls.PREFIX):
+            return value
+        compressed = cls.PREFIX + base64.b64encode(zlib.compress(value.encode('utf-8'))).decode('ascii')
+        if len(compressed) >= len(value) and not value.startswith(cls.PREFIX):
+            return value
+        return compressed
+
+    @classmethod
+    def decompress(cls, value):
+        """还原数据库中保存的文本"""
+        if value is None or not value.startswith(cls.PREFIX):
+            return value
+        return zlib.decompress(base64.b64decode(value[len(cls.PREFIX):])).decode('utf-8')
+
+    def from_db_value(self, value, expression, connection):
+        return self.decompress(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return value
+        return self.compress(value, self.get_threshold())
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from push.retention import RetentionService
+
+
+class Command(BaseCommand):
+    help = '按保留天数清理过期的消息日志和告警记录，消息日志删除前按天汇总，适合通过cron每天执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--message-days', type=int, help='消息日志保留天数，默认使用 MESSAGE_LOG_RETENTION_DAYS')
+        parser.add_argument('--alert-days', type=int, help='告警记录保留天数，默认使用 ALERT_RECORD_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, help='每批删除的记录数，默认使用 RETENTION_BATCH_SIZE')
+        parser.add_argument('--dry-run', action='store_true', help='只统计待清理的记录数，不删除数据')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            counts = RetentionService.pending_counts(options['message_days'], options['alert_days'])
+            self.stdout.write(f"待清理消息日志: {counts['message_logs']} 条")
+            self.stdout.write(f"待清理告警记录: {counts['alert_records']} 条")
+            return
+
+        result = RetentionService.run(options['message_days'], options['alert_days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"已将中断的发送标记为失败 {result['stuck_message_logs']} 条、已清理消息日志 {result['message_logs']} 条、告警记录 {result['alert_records']} 条、"
+            f"未引用的原始数据 {result['payloads']} 条"
+        ))
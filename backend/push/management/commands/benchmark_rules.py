@@ -0,0 +1,84 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from push.models import DistributionRule
+from push.rules import CompiledRule, parse_alert_document
+
+
+class Command(BaseCommand):
+    help = '基准测试：对比每条规则各自解析JSON与单次解析共用时，每条告警的CPU耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', default='1,5,10,20,50', help='规则数量列表，逗号分隔')
+        parser.add_argument('--alerts', type=int, default=40, help='每条告警数据中包含的告警数')
+        parser.add_argument('--iterations', type=int, default=200, help='每组测试的重复次数')
+
+    @staticmethod
+    def build_payload(alert_count):
+        """构造一份Alertmanager风格的告警数据"""
+        return json.dumps({
+            'receiver': 'lightning',
+            'status': 'firing',
+            'alerts': [
+                {
+                    'status': 'firing',
+                    'labels': {
+                        'alertname': 'ContainerAbsent',
+                        'instance': f'node-{index}:9100',
+                        'job': 'node-exporter',
+                        'severity': 'critical',
+                    },
+                    'annotations': {
+                        'summary': f'node-{index} 容器已停止',
+                        'description': '容器已停止运行超过5分钟，请及时处理。' * 4,
+                    },
+                    'startsAt': '2025-01-01T12:00:00Z',
+                    'fingerprint': f'{index:016x}',
+                }
+                for index in range(alert_count)
+            ],
+            'commonLabels': {'job': 'node-exporter'},
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def build_rules(rule_count):
+        """构造未保存的JSON规则"""
+        paths = ['alerts[].labels.instance', 'alerts[].labels.job', 'commonLabels.job', 'alerts[].fingerprint']
+        return [
+            CompiledRule(DistributionRule(name=f'rule-{index}', type='json', extract_path=paths[index % len(paths)]))
+            for index in range(rule_count)
+        ]
+
+    @staticmethod
+    def measure(func, iterations):
+        """返回单次调用的平均CPU耗时（微秒）"""
+        start = time.process_time()
+        for _ in range(iterations):
+            func()
+        return (time.process_time() - start) / iterations * 1_000_000
+
+    def handle(self, *args, **options):
+        raw_data = self.build_payload(options['alerts'])
+        iterations = options['iterations']
+        rule_counts = [int(count) for count in options['rules'].split(',') if count.strip()]
+
+        self.stdout.write(f'告警数据大小: {len(raw_data.encode("utf-8"))} 字节, 重复次数: {iterations}')
+        self.stdout.write(f'{"规则数":>8} {"逐规则解析(us)":>16} {"单次解析(us)":>14} {"加速比":>8}')
+
+        for rule_count in rule_counts:
+            rules = self.build_rules(rule_count)
+
+            def parse_per_rule():
+                for rule in rules:
+                    rule.extract(raw_data)
+
+            def parse_once():
+                document = parse_alert_document(raw_data)
+                for rule in rules:
+                    rule.extract(raw_data, document)
+
+            per_rule = self.measure(parse_per_rule, iterations)
+            once = self.measure(parse_once, iterations)
+            self.stdout.write(f'{rule_count:>8} {per_rule:>16.1f} {once:>14.1f} {per_rule / once:>7.1f}x')
@@ -0,0 +1,74 @@
+import datetime
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from push.dashboard import DashboardChartView, DashboardRecentLogsView
+from push.delivery import delivery_queue
+from push.rules import rule_registry
+from push.stats import StatsService
+from push.views import InstanceMappingViewSet, MessageLogViewSet, RobotViewSet
+
+
+class Command(BaseCommand):
+    help = '输出热点查询的执行计划（EXPLAIN QUERY PLAN），用于发现全表扫描等性能回退'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='用于构造查询条件的用户ID，默认取第一个用户')
+        parser.add_argument('--fail-on-scan', action='store_true', help='存在全表扫描时以非零状态退出')
+
+    def hot_queries(self, user):
+        """热点查询列表: (名称, 查询集)
+
+        查询集取自视图和服务中实际执行的代码，修改查询后无需同步修改此处。
+        模板和机器人由路由表整表加载到进程内，按ID、名称和默认机器人查找不再查询数据库。
+        """
+        request = SimpleNamespace(user=user, query_params={})
+        today = timezone.localdate()
+        start_of_week = datetime.datetime.combine(
+            today - datetime.timedelta(days=today.weekday()), datetime.time.min, tzinfo=timezone.get_current_timezone()
+        )
+
+        return [
+            ('消息日志列表', MessageLogViewSet(action='list', request=request).get_queryset()[:10]),
+            ('仪表盘最近消息', DashboardRecentLogsView.get_recent_logs(user)),
+            ('仪表盘本月消息数', StatsService.get_monthly_stats(user)),
+            ('仪表盘趋势数据', DashboardChartView.get_trend_queryset(
+                user, start_of_week, start_of_week + datetime.timedelta(days=7), 'day'
+            )),
+            ('异步发送队列', delivery_queue.due_messages().values('id')[:1]),
+            ('实例告警记录', InstanceMappingViewSet.get_alert_records(1)),
+            ('启用的分发规则', rule_registry.get_queryset()),
+            ('机器人列表', RobotViewSet(action='list', request=request).get_queryset()),
+        ]
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('用户不存在，请通过 --user 指定用户ID')
+
+        scans = []
+        for name, queryset in self.hot_queries(user):
+            plan = queryset.explain()
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name}'))
+            self.stdout.write(str(queryset.query))
+            for line in plan.splitlines():
+                # SQLite 中 "SCAN 表名" 表示全表扫描，"SCAN 表名 USING INDEX" 为索引扫描
+                if ' SCAN ' in f' {line} ' and 'USING' not in line and 'SUBQUERY' not in line:
+                    self.stdout.write(self.style.WARNING(f'{line}  <-- 全表扫描'))
+                    scans.append(name)
+                else:
+                    self.stdout.write(line)
+            self.stdout.write('')
+
+        if scans:
+            self.stdout.write(self.style.WARNING(f'存在全表扫描的查询: {", ".join(scans)}'))
+            if options['fail_on_scan']:
+                raise CommandError('热点查询存在全表扫描')
+        else:
+            self.stdout.write(self.style.SUCCESS('所有热点查询均使用了索引'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from push.delivery import delivery_queue
+
+
+class Command(BaseCommand):
+    help = '处理异步发送队列中的消息'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续运行，轮询队列中的新消息')
+        parser.add_argument('--interval', type=float, default=2, help='轮询间隔（秒）')
+        parser.add_argument('--requeue-stale', action='store_true', help='启动前将认领超过 DELIVERY_STALE_SECONDS 秒仍未完成的消息重新放回队列')
+
+    def handle(self, *args, **options):
+        if options['requeue_stale']:
+            count = delivery_queue.requeue_stale()
+            self.stdout.write(f'已重新排队 {count} 条消息')
+
+        while True:
+            count = delivery_queue.drain()
+            if count:
+                self.stdout.write(f'已处理 {count} 条消息')
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,79 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Length, Substr
+
+from push.fields import CompressedTextField
+
+
+class Command(BaseCommand):
+    help = '分批压缩历史数据中超过阈值、仍按原文保存的压缩文本字段'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每批处理的记录数')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要压缩的记录数，不写入数据库')
+
+    @staticmethod
+    def compressed_fields():
+        """push 应用中所有压缩文本字段: (模型, 字段)"""
+        for model in apps.get_app_config('push').get_models():
+            for field in model._meta.get_fields():
+                if isinstance(field, CompressedTextField):
+                    yield model, field
+
+    @staticmethod
+    def pending_queryset(model, field):
+        """超过阈值且未压缩保存的记录
+
+        通过数据库函数读取保存的原始值，避免字段自动解压和查询参数被压缩。
+        """
+        prefix = CompressedTextField.PREFIX
+        return model.objects.annotate(
+            stored_length=Length(field.name),
+            stored_prefix=Substr(field.name, 1, len(prefix), output_field=models.TextField()),
+        ).filter(
+            stored_length__gt=field.get_threshold()
+        ).exclude(stored_prefix=prefix).order_by('pk')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        for model, field in self.compressed_fields():
+            label = f'{model._meta.label}.{field.name}'
+            queryset = self.pending_queryset(model, field)
+
+            if options['dry_run']:
+                self.stdout.write(f'{label}: {queryset.count()} 条记录待压缩')
+                continue
+
+            total = 0
+            original_size = 0
+            stored_size = 0
+            last_pk = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).only('pk', field.name)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                # 压缩后没有变小的文本仍按原文保存，无需更新
+                changed = []
+                for obj in batch:
+                    value = getattr(obj, field.name)
+                    stored = field.compress(value, field.get_threshold())
+                    if stored != value:
+                        changed.append(obj)
+                        original_size += len(value)
+                        stored_size += len(stored)
+                if changed:
+                    # 每批单独提交，避免长时间锁表
+                    with transaction.atomic():
+                        model.objects.bulk_update(changed, [field.name])
+                    total += len(changed)
+                    self.stdout.write(f'{label}: 已压缩 {total} 条记录')
+
+            if total:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{label}: 共压缩 {total} 条记录，{original_size} 字符 -> {stored_size} 字符'
+                ))
+            else:
+                self.stdout.write(f'{label}: 没有需要压缩的记录')
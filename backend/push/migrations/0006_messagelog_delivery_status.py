@@ -0,0 +1,24 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0005_remove_instancemapping_robots_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='delivery_status',
+            field=models.CharField(choices=[('queued', '排队中'), ('processing', '发送中'), ('done', '已完成')], default='done', max_length=20, verbose_name='投递状态'),
+        ),
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['delivery_status', 'created_at'], name='messagelog_queue_idx'),
+        ),
+    ]
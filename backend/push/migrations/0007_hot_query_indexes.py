@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0006_messagelog_delivery_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alertrecord',
+            index=models.Index(fields=['instance_mapping', '-alert_time'], name='alertrecord_instance_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='distributionrule',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='rule_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['created_by', 'created_at', 'status'], name='messagelog_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robot',
+            index=models.Index(fields=['created_by', 'created_at'], name='robot_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robot',
+            index=models.Index(fields=['robot_type', 'created_by', 'updated_at'], name='robot_type_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robot',
+            index=models.Index(condition=models.Q(('is_default', True)), fields=['created_by', 'updated_at'], name='robot_user_default_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='robot',
+            index=models.Index(condition=models.Q(('is_default', True)), fields=['updated_at'], name='robot_default_idx'),
+        ),
+    ]
@@ -0,0 +1,146 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:51
+
+import hashlib
+import zlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def store_payload(Payload, cache, text):
+    """保存文本并返回Payload的ID，cache 为本次迁移中已保存内容的摘要到ID映射"""
+    if text is None:
+        return None
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    if digest not in cache:
+        encoded = text.encode('utf-8')
+        payload, _ = Payload.objects.get_or_create(
+            digest=digest,
+            defaults={'data': zlib.compress(encoded), 'size': len(encoded)}
+        )
+        cache[digest] = payload.pk
+    return cache[digest]
+
+
+def backfill_payloads(apps, schema_editor):
+    """将已有的消息日志和告警记录原始数据迁移到Payload表，相同内容只保存一份"""
+    Payload = apps.get_model('push', 'Payload')
+    MessageLog = apps.get_model('push', 'MessageLog')
+    AlertRecord = apps.get_model('push', 'AlertRecord')
+    cache = {}
+
+    batch = []
+    for log in MessageLog.objects.only('id', 'content', 'raw_data').iterator(chunk_size=BATCH_SIZE):
+        log.content_payload_id = store_payload(Payload, cache, log.content)
+        log.raw_payload_id = store_payload(Payload, cache, log.raw_data)
+        batch.append(log)
+        if len(batch) >= BATCH_SIZE:
+            MessageLog.objects.bulk_update(batch, ['content_payload', 'raw_payload'])
+            batch = []
+    MessageLog.objects.bulk_update(batch, ['content_payload', 'raw_payload'])
+
+    batch = []
+    for record in AlertRecord.objects.only('id', 'raw_data').iterator(chunk_size=BATCH_SIZE):
+        record.raw_payload_id = store_payload(Payload, cache, record.raw_data)
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            AlertRecord.objects.bulk_update(batch, ['raw_payload'])
+            batch = []
+    AlertRecord.objects.bulk_update(batch, ['raw_payload'])
+
+
+def restore_payloads(apps, schema_editor):
+    """回滚时将Payload内容写回消息日志和告警记录"""
+    Payload = apps.get_model('push', 'Payload')
+    MessageLog = apps.get_model('push', 'MessageLog')
+    AlertRecord = apps.get_model('push', 'AlertRecord')
+
+    def load(payload_id):
+        if payload_id is None:
+            return None
+        return zlib.decompress(bytes(Payload.objects.get(pk=payload_id).data)).decode('utf-8')
+
+    for log in MessageLog.objects.iterator(chunk_size=BATCH_SIZE):
+        log.content = load(log.content_payload_id) or ''
+        log.raw_data = load(log.raw_payload_id)
+        log.save(update_fields=['content', 'raw_data'])
+
+    for record in AlertRecord.objects.iterator(chunk_size=BATCH_SIZE):
+        record.raw_data = load(record.raw_payload_id) or ''
+        record.alert_content = record.raw_data[:1000]
+        record.save(update_fields=['raw_data', 'alert_content'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='内容摘要')),
+                ('data', models.BinaryField(verbose_name='压缩数据')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='原始大小')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+            ],
+            options={
+                'verbose_name': '原始数据',
+                'verbose_name_plural': '原始数据',
+            },
+        ),
+        migrations.AddField(
+            model_name='alertrecord',
+            name='raw_payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='alert_records', to='push.payload', verbose_name='原始数据'),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='content_payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='content_message_logs', to='push.payload', verbose_name='发送内容'),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='raw_payload',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='message_logs', to='push.payload', verbose_name='原始数据'),
+        ),
+        migrations.RunPython(backfill_payloads, restore_payloads),
+        # 删除前先为非空字段设置默认值，回滚时才能在已有数据的表上重新添加这些字段
+        migrations.AlterField(
+            model_name='alertrecord',
+            name='alert_content',
+            field=models.TextField(default='', verbose_name='告警内容'),
+        ),
+        migrations.AlterField(
+            model_name='alertrecord',
+            name='raw_data',
+            field=models.TextField(default='', verbose_name='原始数据'),
+        ),
+        migrations.AlterField(
+            model_name='messagelog',
+            name='content',
+            field=models.TextField(default='', verbose_name='发送内容'),
+        ),
+        migrations.RemoveField(
+            model_name='alertrecord',
+            name='alert_content',
+        ),
+        migrations.RemoveField(
+            model_name='alertrecord',
+            name='raw_data',
+        ),
+        migrations.RemoveField(
+            model_name='messagelog',
+            name='content',
+        ),
+        migrations.RemoveField(
+            model_name='messagelog',
+            name='raw_data',
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:53
+
+import push.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0008_payload_storage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messagelog',
+            name='formatted_content',
+            field=push.fields.CompressedTextField(blank=True, null=True, verbose_name='格式化后内容'),
+        ),
+    ]
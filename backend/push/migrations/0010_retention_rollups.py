@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0009_compressed_formatted_content'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageLogDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('status', models.BooleanField(default=False, verbose_name='发送状态')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='消息数')),
+            ],
+            options={
+                'verbose_name': '消息日志汇总',
+                'verbose_name_plural': '消息日志汇总',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alertrecord',
+            index=models.Index(fields=['alert_time'], name='alertrecord_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='messagelog',
+            index=models.Index(fields=['created_at'], name='messagelog_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='messagelogdailyrollup',
+            name='robot',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='message_log_rollups', to='push.robot', verbose_name='发送机器人'),
+        ),
+        migrations.AddField(
+            model_name='messagelogdailyrollup',
+            name='template',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='message_log_rollups', to='push.template', verbose_name='使用模板'),
+        ),
+        migrations.AddField(
+            model_name='messagelogdailyrollup',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='message_log_rollups', to=settings.AUTH_USER_MODEL, verbose_name='创建者'),
+        ),
+        migrations.AddIndex(
+            model_name='messagelogdailyrollup',
+            index=models.Index(fields=['user', 'date'], name='rollup_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    """根据已有的模板、机器人、消息日志和日汇总初始化计数表"""
+    Template = apps.get_model('push', 'Template')
+    Robot = apps.get_model('push', 'Robot')
+    MessageLog = apps.get_model('push', 'MessageLog')
+    MessageLogDailyRollup = apps.get_model('push', 'MessageLogDailyRollup')
+    UserStats = apps.get_model('push', 'UserStats')
+    UserDailyStats = apps.get_model('push', 'UserDailyStats')
+
+    stats = {}
+    for model, field in ((Template, 'template_count'), (Robot, 'robot_count')):
+        rows = model.objects.filter(created_by__isnull=False).order_by().values('created_by').annotate(count=Count('id'))
+        for row in rows:
+            stats.setdefault(row['created_by'], {})[field] = row['count']
+    UserStats.objects.bulk_create([UserStats(user_id=user_id, **counts) for user_id, counts in stats.items()])
+
+    daily = {}
+    logs = MessageLog.objects.filter(created_by__isnull=False, delivery_status='done').annotate(
+        date=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+    ).order_by().values('created_by', 'date').annotate(
+        success=Count('id', filter=Q(status=True)), fail=Count('id', filter=Q(status=False))
+    )
+    rollups = MessageLogDailyRollup.objects.filter(user__isnull=False).order_by().values('user', 'date').annotate(
+        success=Sum('count', filter=Q(status=True)), fail=Sum('count', filter=Q(status=False))
+    )
+    for user_field, rows in (('created_by', logs), ('user', rollups)):
+        for row in rows:
+            counts = daily.setdefault((row[user_field], row['date']), [0, 0])
+            counts[0] += row['success'] or 0
+            counts[1] += row['fail'] or 0
+    UserDailyStats.objects.bulk_create([
+        UserDailyStats(user_id=user_id, date=date, success_count=success, fail_count=fail)
+        for (user_id, date), (success, fail) in daily.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0010_retention_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template_count', models.IntegerField(default=0, verbose_name='模板数')),
+                ('robot_count', models.IntegerField(default=0, verbose_name='机器人数')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='push_stats', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户统计',
+                'verbose_name_plural': '用户统计',
+            },
+        ),
+        migrations.CreateModel(
+            name='UserDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('success_count', models.IntegerField(default=0, verbose_name='成功数')),
+                ('fail_count', models.IntegerField(default=0, verbose_name='失败数')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='push_daily_stats', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '用户每日统计',
+                'verbose_name_plural': '用户每日统计',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='user_daily_stats_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
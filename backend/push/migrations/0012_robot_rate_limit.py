@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0011_user_stats_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='robot',
+            name='rate_limit',
+            field=models.PositiveIntegerField(blank=True, help_text='每分钟最多发送的消息数，为空时使用平台默认值，0 表示不限制', null=True, verbose_name='发送频率限制'),
+        ),
+    ]
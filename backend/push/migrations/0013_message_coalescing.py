@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0012_robot_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='distributionchannel',
+            name='batch_template',
+            field=models.TextField(blank=True, help_text='jinja2模板，可使用 messages（各条消息格式化后的内容）、alerts（各条消息的数据）和 count 变量，为空时用分隔线连接各条消息', verbose_name='批量消息模板'),
+        ),
+        migrations.AddField(
+            model_name='distributionchannel',
+            name='coalesce_max_batch',
+            field=models.PositiveIntegerField(default=20, help_text='排队消息达到该数量时立即发送', verbose_name='最大合并条数'),
+        ),
+        migrations.AddField(
+            model_name='distributionchannel',
+            name='coalesce_window',
+            field=models.PositiveIntegerField(default=0, help_text='单位秒，窗口内发往该通道的消息合并为一条发送，0 表示不合并', verbose_name='合并窗口'),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='channel',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='message_logs', to='push.distributionchannel', verbose_name='分发通道'),
+        ),
+        migrations.AddField(
+            model_name='messagelog',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='计划发送时间'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0013_message_coalescing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0, verbose_name='发送次数'),
+        ),
+        migrations.CreateModel(
+            name='DeliveryAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempt', models.PositiveIntegerField(verbose_name='第几次发送')),
+                ('success', models.BooleanField(default=False, verbose_name='是否成功')),
+                ('retryable', models.BooleanField(default=False, verbose_name='是否可重试')),
+                ('error_message', models.TextField(blank=True, null=True, verbose_name='错误信息')),
+                ('latency_ms', models.FloatField(blank=True, null=True, verbose_name='耗时（毫秒）')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='发送时间')),
+                ('message_log', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_attempts', to='push.messagelog', verbose_name='消息日志')),
+            ],
+            options={
+                'verbose_name': '发送记录',
+                'verbose_name_plural': '发送记录',
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeadLetter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(verbose_name='发送次数')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='最后一次错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dead_letters', to=settings.AUTH_USER_MODEL, verbose_name='创建者')),
+                ('message_log', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dead_letter', to='push.messagelog', verbose_name='消息日志')),
+                ('robot', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dead_letters', to='push.robot', verbose_name='发送机器人')),
+            ],
+            options={
+                'verbose_name': '死信消息',
+                'verbose_name_plural': '死信消息',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_by', 'created_at'], name='deadletter_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0014_delivery_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagelog',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='认领时间'),
+        ),
+    ]
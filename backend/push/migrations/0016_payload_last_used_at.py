@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_last_used_at(apps, schema_editor):
+    """已有数据的最近使用时间取创建时间"""
+    Payload = apps.get_model('push', 'Payload')
+    Payload.objects.update(last_used_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push', '0015_messagelog_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payload',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='最近使用时间'),
+        ),
+        migrations.RunPython(backfill_last_used_at, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+import hashlib
 import uuid
+import zlib
+from datetime import timedelta
+
+from .fields import CompressedTextField
 
 
 class RobotType(models.TextChoices):
@@ -10,6 +16,113 @@ class RobotType(models.TextChoices):
     DINGTALK = 'dingtalk', '钉钉'
 
 
+class DeliveryStatus(models.TextChoices):
+    """消息投递状态"""
+    QUEUED = 'queued', '排队中'
+    PROCESSING = 'processing', '发送中'
+    DONE = 'done', '已完成'
+
+
+class Payload(models.Model):
+    """按内容寻址的原始数据
+
+    以文本的SHA-256摘要为键保存zlib压缩后的内容，相同内容只保存一份，
+    由消息日志和告警记录引用。复用已有内容时更新最近使用时间，
+    数据清理任务据此判断是否可能正要被引用。
+    """
+    # 最近使用时间的更新间隔（秒），避免每次复用都写数据库
+    TOUCH_INTERVAL = 60
+
+    digest = models.CharField(max_length=64, unique=True, verbose_name="内容摘要")
+    data = models.BinaryField(verbose_name="压缩数据")
+    size = models.PositiveIntegerField(default=0, verbose_name="原始大小")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    last_used_at = models.DateTimeField(default=timezone.now, verbose_name="最近使用时间")
+
+    class Meta:
+        verbose_name = "原始数据"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.digest
+
+    @staticmethod
+    def compute_digest(text):
+        """计算文本的内容摘要"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def store(cls, text):
+        """保存文本并返回对应的Payload，内容已存在时直接复用并更新最近使用时间"""
+        if text is None:
+            return None
+        digest = cls.compute_digest(text)
+        payload = cls.objects.filter(digest=digest).first()
+        if payload is not None:
+            now = timezone.now()
+            if now - payload.last_used_at > timedelta(seconds=cls.TOUCH_INTERVAL):
+                cls.objects.filter(pk=payload.pk).update(last_used_at=now)
+                payload.last_used_at = now
+        else:
+            encoded = text.encode('utf-8')
+            # 并发写入相同内容时由唯一约束保证只保存一份
+            payload, _ = cls.objects.get_or_create(
+                digest=digest,
+                defaults={'data': zlib.compress(encoded), 'size': len(encoded)}
+            )
+        return payload
+
+    @property
+    def text(self):
+        """解压后的文本"""
+        if not hasattr(self, '_text'):
+            self._text = zlib.decompress(bytes(self.data)).decode('utf-8')
+        return self._text
+
+
+def payload_property(field_name, default=None, doc=None):
+    """通过Payload外键读写文本的模型属性
+
+    赋值时只记录文本，保存模型时再写入Payload表，读取时需要 select_related 外键以避免额外查询。
+    """
+    def getter(self):
+        pending = self.__dict__.get('_pending_payloads', {})
+        if field_name in pending:
+            return pending[field_name]
+        payload = getattr(self, field_name)
+        return payload.text if payload is not None else default
+
+    def setter(self, value):
+        self.__dict__.setdefault('_pending_payloads', {})[field_name] = value
+
+    return property(getter, setter, doc=doc)
+
+
+class PayloadModel(models.Model):
+    """引用Payload保存大段文本的模型基类"""
+
+    class Meta:
+        abstract = True
+
+    def store_payloads(self):
+        """将赋值的文本写入Payload表，返回更新的外键字段名"""
+        pending = self.__dict__.pop('_pending_payloads', {})
+        stored = {}
+        for field_name, text in pending.items():
+            # 同一条记录的多个字段内容相同时只保存一次
+            if text not in stored:
+                stored[text] = Payload.store(text)
+            setattr(self, field_name, stored[text])
+        return list(pending)
+
+    def save(self, *args, **kwargs):
+        stored_fields = self.store_payloads()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and stored_fields:
+            kwargs['update_fields'] = {*update_fields, *stored_fields}
+        super().save(*args, **kwargs)
+
+
 class Template(models.Model):
     """消息模板"""
     name = models.CharField(max_length=100, verbose_name="模板名称")
@@ -43,6 +156,10 @@ class Robot(models.Model):
         verbose_name="机器人类型"
     )
     is_default = models.BooleanField(default=False, verbose_name="是否为默认机器人")
+    rate_limit = models.PositiveIntegerField(
+        blank=True, null=True, verbose_name="发送频率限制",
+        help_text="每分钟最多发送的消息数，为空时使用平台默认值，0 表示不限制"
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='robots', verbose_name="创建者")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
@@ -51,20 +168,45 @@ class Robot(models.Model):
         verbose_name = "机器人配置"
         verbose_name_plural = verbose_name
         ordering = ['-updated_at']
+        indexes = [
+            # 机器人列表
+            models.Index(fields=['created_by', 'created_at'], name='robot_user_created_idx'),
+            # 按模板类型匹配机器人
+            models.Index(fields=['robot_type', 'created_by', 'updated_at'], name='robot_type_user_idx'),
+            # 默认机器人（部分索引，布尔条件无法使用普通索引）：按创建者查找、全局查找
+            models.Index(fields=['created_by', 'updated_at'], condition=models.Q(is_default=True),
+                         name='robot_user_default_idx'),
+            models.Index(fields=['updated_at'], condition=models.Q(is_default=True), name='robot_default_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class MessageLog(models.Model):
+class MessageLog(PayloadModel):
     """消息发送日志"""
     template = models.ForeignKey(Template, on_delete=models.SET_NULL, null=True, related_name='message_logs', verbose_name="使用模板")
     robot = models.ForeignKey(Robot, on_delete=models.SET_NULL, null=True, related_name='message_logs', verbose_name="发送机器人")
-    content = models.TextField(verbose_name="发送内容")
-    raw_data = models.TextField(blank=True, null=True, verbose_name="原始数据")
-    formatted_content = models.TextField(blank=True, null=True, verbose_name="格式化后内容")
+    content_payload = models.ForeignKey(Payload, on_delete=models.PROTECT, null=True, blank=True,
+                                        related_name='content_message_logs', verbose_name="发送内容")
+    raw_payload = models.ForeignKey(Payload, on_delete=models.PROTECT, null=True, blank=True,
+                                    related_name='message_logs', verbose_name="原始数据")
+    formatted_content = CompressedTextField(blank=True, null=True, verbose_name="格式化后内容")
     status = models.BooleanField(default=False, verbose_name="发送状态")
+    delivery_status = models.CharField(
+        max_length=20,
+        choices=DeliveryStatus.choices,
+        default=DeliveryStatus.DONE,
+        verbose_name="投递状态"
+    )
     error_message = models.TextField(blank=True, null=True, verbose_name="错误信息")
+    # 开启消息合并的分发通道：排队到计划发送时间后与同一通道的其他排队消息合并发送
+    channel = models.ForeignKey('DistributionChannel', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='message_logs', verbose_name="分发通道")
+    scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name="计划发送时间")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="发送次数")
+    # 发送队列认领的时间，同步发送的消息为空
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="认领时间")
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='message_logs', verbose_name="创建者")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     
@@ -72,11 +214,122 @@ class MessageLog(models.Model):
         verbose_name = "消息日志"
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
+        indexes = [
+            # 消息日志列表、仪表盘统计按创建者和时间范围查询，包含status便于只扫描索引完成计数
+            models.Index(fields=['created_by', 'created_at', 'status'], name='messagelog_user_created_idx'),
+            # 异步发送队列按投递状态和创建时间取任务
+            models.Index(fields=['delivery_status', 'created_at'], name='messagelog_queue_idx'),
+            # 数据保留策略按创建时间清理过期日志
+            models.Index(fields=['created_at'], name='messagelog_created_idx'),
+        ]
+
+    content = payload_property('content_payload', default='', doc="发送内容")
+    raw_data = payload_property('raw_payload', doc="原始数据")
 
     def __str__(self):
         return f"{self.template} - {self.created_at}"
 
 
+class DeliveryAttempt(models.Model):
+    """消息的单次发送记录"""
+    message_log = models.ForeignKey(MessageLog, on_delete=models.CASCADE, related_name='delivery_attempts', verbose_name="消息日志")
+    attempt = models.PositiveIntegerField(verbose_name="第几次发送")
+    success = models.BooleanField(default=False, verbose_name="是否成功")
+    retryable = models.BooleanField(default=False, verbose_name="是否可重试")
+    error_message = models.TextField(blank=True, null=True, verbose_name="错误信息")
+    latency_ms = models.FloatField(null=True, blank=True, verbose_name="耗时（毫秒）")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="发送时间")
+
+    class Meta:
+        verbose_name = "发送记录"
+        verbose_name_plural = verbose_name
+        # 死信重新发送后从第1次重新计数，按发送时间排序
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.message_log_id} #{self.attempt}"
+
+
+class DeadLetter(models.Model):
+    """重试次数用尽仍发送失败的消息，平台恢复后可重新发送"""
+    message_log = models.OneToOneField(MessageLog, on_delete=models.CASCADE, related_name='dead_letter', verbose_name="消息日志")
+    robot = models.ForeignKey(Robot, on_delete=models.SET_NULL, null=True, related_name='dead_letters', verbose_name="发送机器人")
+    attempts = models.PositiveIntegerField(verbose_name="发送次数")
+    last_error = models.TextField(blank=True, null=True, verbose_name="最后一次错误信息")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='dead_letters', verbose_name="创建者")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+
+    class Meta:
+        verbose_name = "死信消息"
+        verbose_name_plural = verbose_name
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', 'created_at'], name='deadletter_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.message_log_id} - {self.last_error}"
+
+
+class MessageLogDailyRollup(models.Model):
+    """消息日志按天汇总
+
+    过期的消息日志在删除前按日期、用户、机器人、模板和发送状态汇总到此表，
+    保留仪表盘的历史统计数据。
+    """
+    date = models.DateField(verbose_name="日期")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='message_log_rollups', verbose_name="创建者")
+    robot = models.ForeignKey(Robot, on_delete=models.SET_NULL, null=True, related_name='message_log_rollups', verbose_name="发送机器人")
+    template = models.ForeignKey(Template, on_delete=models.SET_NULL, null=True, related_name='message_log_rollups', verbose_name="使用模板")
+    status = models.BooleanField(default=False, verbose_name="发送状态")
+    count = models.PositiveIntegerField(default=0, verbose_name="消息数")
+
+    class Meta:
+        verbose_name = "消息日志汇总"
+        verbose_name_plural = verbose_name
+        ordering = ['-date']
+        indexes = [
+            # 仪表盘按用户和日期范围统计
+            models.Index(fields=['user', 'date'], name='rollup_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.count}"
+
+
+class UserStats(models.Model):
+    """用户资源计数，创建或删除模板、机器人时增量更新"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='push_stats', verbose_name="用户")
+    template_count = models.IntegerField(default=0, verbose_name="模板数")
+    robot_count = models.IntegerField(default=0, verbose_name="机器人数")
+
+    class Meta:
+        verbose_name = "用户统计"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.user} - 模板 {self.template_count} / 机器人 {self.robot_count}"
+
+
+class UserDailyStats(models.Model):
+    """用户每日消息计数，消息发送完成时增量更新"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='push_daily_stats', verbose_name="用户")
+    date = models.DateField(verbose_name="日期")
+    success_count = models.IntegerField(default=0, verbose_name="成功数")
+    fail_count = models.IntegerField(default=0, verbose_name="失败数")
+
+    class Meta:
+        verbose_name = "用户每日统计"
+        verbose_name_plural = verbose_name
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='user_daily_stats_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.date}"
+
+
 class DistributionRule(models.Model):
     """分发规则"""
     RULE_TYPE_CHOICES = [
@@ -97,6 +350,10 @@ class DistributionRule(models.Model):
         verbose_name = "分发规则"
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
+        indexes = [
+            # 启用的规则（部分索引）
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='rule_active_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -121,34 +378,51 @@ class InstanceMapping(models.Model):
     def __str__(self):
         return self.instance_name
     
+    def _prefetched_channels(self):
+        """返回预取的分发通道列表，未预取时返回None"""
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if 'distribution_channels' in prefetched:
+            return list(prefetched['distribution_channels'])
+        return None
+    
     @property
     def channel_names(self):
         """获取关联的分发通道名称列表"""
+        channels = self._prefetched_channels()
+        if channels is not None:
+            return [channel.name for channel in channels]
         return list(self.distribution_channels.values_list('name', flat=True))
     
     @property
     def channel_count(self):
         """获取关联的分发通道数量"""
+        channels = self._prefetched_channels()
+        if channels is not None:
+            return len(channels)
         return self.distribution_channels.count()
     
     @property
     def robot_names(self):
         """获取关联的机器人名称列表（保持向后兼容）"""
+        channels = self._prefetched_channels()
+        if channels is not None:
+            return [channel.robot.name for channel in channels]
         return list(self.distribution_channels.values_list('robot__name', flat=True))
     
     @property
     def robot_count(self):
         """获取关联的机器人数量（保持向后兼容）"""
-        return self.distribution_channels.count()
+        return self.channel_count
 
 
-class AlertRecord(models.Model):
+class AlertRecord(PayloadModel):
     """告警记录"""
     instance_mapping = models.ForeignKey(InstanceMapping, on_delete=models.CASCADE, 
                                        related_name='alert_records', verbose_name="关联实例")
     rule_name = models.CharField(max_length=100, verbose_name="规则名称")
-    alert_content = models.TextField(verbose_name="告警内容")
-    raw_data = models.TextField(verbose_name="原始数据")
+    # 同一次告警提取出的多个实例共用一份原始数据
+    raw_payload = models.ForeignKey(Payload, on_delete=models.PROTECT, null=True, blank=True,
+                                    related_name='alert_records', verbose_name="原始数据")
     extracted_values = models.JSONField(default=list, verbose_name="提取的值")
     alert_time = models.DateTimeField(auto_now_add=True, verbose_name="告警时间")
     processed = models.BooleanField(default=False, verbose_name="是否已处理")
@@ -157,7 +431,20 @@ class AlertRecord(models.Model):
         verbose_name = "告警记录"
         verbose_name_plural = verbose_name
         ordering = ['-alert_time']
+        indexes = [
+            # 实例的最近告警记录
+            models.Index(fields=['instance_mapping', '-alert_time'], name='alertrecord_instance_time_idx'),
+            # 数据保留策略按告警时间清理过期记录
+            models.Index(fields=['alert_time'], name='alertrecord_time_idx'),
+        ]
     
+    raw_data = payload_property('raw_payload', default='', doc="原始数据")
+
+    @property
+    def alert_content(self):
+        """告警内容摘要，取原始数据的前1000个字符"""
+        return self.raw_data[:1000]
+
     def __str__(self):
         return f"{self.instance_mapping.instance_name} - {self.alert_time}"
 
@@ -169,6 +456,18 @@ class DistributionChannel(models.Model):
     template = models.ForeignKey(Template, on_delete=models.CASCADE, related_name='distribution_channels', verbose_name="绑定模板")
     description = models.TextField(blank=True, verbose_name="通道描述")
     is_active = models.BooleanField(default=True, verbose_name="是否启用")
+    coalesce_window = models.PositiveIntegerField(
+        default=0, verbose_name="合并窗口",
+        help_text="单位秒，窗口内发往该通道的消息合并为一条发送，0 表示不合并"
+    )
+    coalesce_max_batch = models.PositiveIntegerField(
+        default=20, verbose_name="最大合并条数", help_text="排队消息达到该数量时立即发送"
+    )
+    batch_template = models.TextField(
+        blank=True, verbose_name="批量消息模板",
+        help_text="jinja2模板，可使用 messages（各条消息格式化后的内容）、alerts（各条消息的数据）和 count 变量，"
+                  "为空时用分隔线连接各条消息"
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='distribution_channels', verbose_name="创建者")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
@@ -0,0 +1,18 @@
+from rest_framework.pagination import CursorPagination
+
+
+class MessageLogCursorPagination(CursorPagination):
+    """消息日志游标分页
+
+    按 (created_at, id) 定位下一页，不执行 COUNT(*) 和 OFFSET，
+    翻到任意深度的页面耗时都相同。id 用于区分同一时间创建的日志。
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 10
+    page_size_query_param = 'size'
+    max_page_size = 100
+
+    @classmethod
+    def is_requested(cls, request):
+        """请求携带 cursor 参数或 pagination=cursor 时使用游标分页"""
+        return cls.cursor_query_param in request.query_params or request.query_params.get('pagination') == 'cursor'
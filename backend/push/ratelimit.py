@@ -0,0 +1,189 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 平台默认限制（每分钟消息数）：企业微信、钉钉每个机器人每分钟20条，飞书每分钟100条
+DEFAULT_RATE_LIMITS = {
+    'wechat': 20,
+    'feishu': 100,
+    'dingtalk': 20,
+}
+
+
+class RateLimitExceeded(Exception):
+    """需要等待的时间超过上限，消息应在 retry_at（时间戳）之后重新发送"""
+
+    def __init__(self, message, retry_at):
+        super().__init__(message)
+        self.retry_at = retry_at
+
+
+class RobotRateLimiter:
+    """机器人发送限流
+
+    各平台按机器人限制每分钟的消息数，超过后消息被拒绝。限流器按机器人维护令牌桶，
+    每次发送消耗一个令牌，令牌在使用60秒后恢复，任意60秒内的发送数不超过限制。
+    令牌耗尽时不丢弃消息：等待时间不超过 max_wait 秒时在当前线程等待，
+    否则不占用令牌，抛出 RateLimitExceeded，由调用方将消息重新排队到下一个可用时间。
+
+    令牌桶状态（最近60秒内及已预约的发送时间）保存在共享缓存中，
+    使用 cache.add 实现的锁保证多个工作进程对同一机器人的预约互斥。
+    """
+
+    WINDOW = 60
+    LOCK_TIMEOUT = 5
+
+    def __init__(self, limits=None, lock_wait=5, max_wait=1):
+        self.limits = {**DEFAULT_RATE_LIMITS, **(limits or {})}
+        self.lock_wait = lock_wait
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def get_limit(self, robot):
+        """获取机器人每分钟的消息数限制，机器人未单独配置时使用平台默认值，0 表示不限制"""
+        if robot.rate_limit is not None:
+            return robot.rate_limit
+        return self.limits.get(robot.robot_type, 0)
+
+    @staticmethod
+    def _bucket_key(robot_id):
+        return f'ratelimit_{robot_id}'
+
+    @contextmanager
+    def _locked(self, robot_id):
+        """获取机器人的跨进程锁，持有锁的进程异常退出时锁在超时后自动释放
+
+        等待超过 lock_wait 秒仍未获得锁时抛出 RateLimitExceeded，不在锁外预约令牌。
+        """
+        key = f'ratelimit_lock_{robot_id}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(key, token, self.LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                logger.warning(f"机器人 {robot_id} 限流锁等待超时")
+                raise RateLimitExceeded("发送频率限制锁等待超时", time.time() + self.LOCK_TIMEOUT)
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def _window(self, robot_id, now):
+        """最近60秒内及已预约的发送时间，按时间升序排列"""
+        return [t for t in cache.get(self._bucket_key(robot_id), []) if t > now - self.WINDOW]
+
+    def reserve(self, robot, max_wait=None):
+        """预约一个令牌，返回需要等待的秒数
+
+        预约时间不早于已有的预约，保证消息按顺序发送；
+        令牌耗尽时取倒数第 limit 次发送的60秒后，保证任意60秒内不超过限制。
+        指定 max_wait 且需要等待的时间超过它时不预约，抛出 RateLimitExceeded。
+        """
+        limit = self.get_limit(robot)
+        if not limit:
+            return 0.0
+
+        with self._locked(robot.pk):
+            now = time.time()
+            window = self._window(robot.pk, now)
+            slot = max(now, window[-1]) if window else now
+            if len(window) >= limit:
+                slot = max(slot, window[-limit] + self.WINDOW)
+            if max_wait is not None and slot - now > max_wait:
+                self._record(robot, limit, None)
+                raise RateLimitExceeded(f"机器人 {robot.name} 超过发送频率限制", slot)
+            window.append(slot)
+            cache.set(self._bucket_key(robot.pk), window, int(slot - now) + self.WINDOW + 1)
+
+        wait = slot - now
+        self._record(robot, limit, wait)
+        return wait
+
+    def acquire(self, robot):
+        """获取令牌，返回等待的秒数
+
+        只在等待时间不超过 max_wait 时阻塞当前线程，否则抛出 RateLimitExceeded，
+        发送线程（请求线程、并发推送线程、队列工作线程）不会被长时间占用。
+        """
+        wait = self.reserve(robot, max_wait=self.max_wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def _record(self, robot, limit, wait):
+        """记录单次获取令牌的指标，wait 为None表示未获取到令牌、消息需要重新排队"""
+        with self._lock:
+            metrics = self._metrics.get(robot.pk)
+            if metrics is None:
+                metrics = self._metrics[robot.pk] = {
+                    'name': robot.name,
+                    'acquired': 0,
+                    'delayed': 0,
+                    'deferred': 0,
+                    'total_wait_seconds': 0.0,
+                    'max_wait_seconds': 0.0,
+                }
+            metrics['limit'] = limit
+            if wait is None:
+                metrics['deferred'] += 1
+                return
+            metrics['acquired'] += 1
+            if wait > 0:
+                metrics['delayed'] += 1
+                metrics['total_wait_seconds'] += wait
+                metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], wait)
+
+    def bucket(self, robot_id, limit):
+        """机器人令牌桶的当前状态：可用令牌数和已排队等待的消息数"""
+        now = time.time()
+        window = self._window(robot_id, now)
+        used = sum(1 for t in window if t <= now)
+        queued = len(window) - used
+        return {
+            'available': max(limit - len(window), 0),
+            'fill': round(max(limit - len(window), 0) / limit, 4) if limit else 1.0,
+            'queued': queued,
+            'next_slot_seconds': round(max(window[-1] - now, 0.0), 2) if queued else 0.0,
+        }
+
+    def stats(self):
+        """按机器人汇总的令牌桶状态与等待时间（本进程发送过的机器人）"""
+        with self._lock:
+            snapshot = {robot_id: dict(metrics) for robot_id, metrics in self._metrics.items()}
+
+        result = {}
+        for robot_id, metrics in snapshot.items():
+            acquired = metrics['acquired']
+            result[robot_id] = {
+                **metrics,
+                'avg_wait_seconds': round(metrics['total_wait_seconds'] / acquired, 3) if acquired else 0.0,
+                'total_wait_seconds': round(metrics['total_wait_seconds'], 3),
+                'max_wait_seconds': round(metrics['max_wait_seconds'], 3),
+                **self.bucket(robot_id, metrics['limit']),
+            }
+        return result
+
+    def reset(self, robot_id=None):
+        """清空令牌桶状态和指标"""
+        with self._lock:
+            robot_ids = [robot_id] if robot_id is not None else list(self._metrics)
+            for key in robot_ids:
+                self._metrics.pop(key, None)
+        for key in robot_ids:
+            cache.delete(self._bucket_key(key))
+
+
+rate_limiter = RobotRateLimiter(
+    limits=getattr(settings, 'ROBOT_RATE_LIMITS', None),
+    lock_wait=getattr(settings, 'ROBOT_RATE_LIMIT_LOCK_WAIT', 5),
+    max_wait=getattr(settings, 'ROBOT_RATE_LIMIT_MAX_WAIT', 1),
+)
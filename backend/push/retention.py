@@ -0,0 +1,167 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import MessageLog, AlertRecord, Payload, MessageLogDailyRollup, DeliveryStatus
+from .stats import StatsService
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """数据保留服务
+
+    按保留天数分批删除过期的消息日志和告警记录，每批在独立的短事务中完成，
+    避免长时间锁表。消息日志删除前先按天汇总到 MessageLogDailyRollup。
+    """
+
+    @staticmethod
+    def get_cutoff(days):
+        """保留期限的起点：当前本地日期往前 days 天的零点，按整天清理以便汇总"""
+        start_of_today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        return start_of_today - datetime.timedelta(days=days)
+
+    @staticmethod
+    def expired_message_logs(cutoff):
+        """过期的消息日志，排队和发送中的消息不清理"""
+        return MessageLog.objects.filter(created_at__lt=cutoff, delivery_status=DeliveryStatus.DONE)
+
+    @staticmethod
+    def expired_alert_records(cutoff):
+        return AlertRecord.objects.filter(alert_time__lt=cutoff)
+
+    @staticmethod
+    def orphan_payloads(grace_seconds=None):
+        """没有被消息日志或告警记录引用、且超过宽限期未被使用的原始数据
+
+        Payload 先于引用它的记录写入或复用，宽限期内写入或复用的数据可能正要被引用，不视为孤立数据。
+        宽限期应大于 Payload.TOUCH_INTERVAL。
+        """
+        if grace_seconds is None:
+            grace_seconds = getattr(settings, 'PAYLOAD_ORPHAN_GRACE_SECONDS', 3600)
+        return Payload.objects.filter(
+            ~Exists(MessageLog.objects.filter(raw_payload=OuterRef('pk'))),
+            ~Exists(MessageLog.objects.filter(content_payload=OuterRef('pk'))),
+            ~Exists(AlertRecord.objects.filter(raw_payload=OuterRef('pk'))),
+            last_used_at__lt=timezone.now() - datetime.timedelta(seconds=grace_seconds),
+        )
+
+    @staticmethod
+    def stuck_message_logs(stale_seconds=None):
+        """同步发送中断（请求线程异常退出）后一直处于发送中的消息日志"""
+        if stale_seconds is None:
+            stale_seconds = getattr(settings, 'DELIVERY_STALE_SECONDS', 300)
+        return MessageLog.objects.filter(
+            delivery_status=DeliveryStatus.PROCESSING,
+            claimed_at__isnull=True,
+            created_at__lt=timezone.now() - datetime.timedelta(seconds=stale_seconds),
+        )
+
+    @classmethod
+    def fail_stuck_message_logs(cls, stale_seconds=None):
+        """将中断的同步发送标记为失败，返回处理数量"""
+        count = 0
+        for message_log in cls.stuck_message_logs(stale_seconds):
+            # 条件更新，请求线程恰好在此时完成发送的消息不受影响
+            updated = MessageLog.objects.filter(pk=message_log.pk, delivery_status=DeliveryStatus.PROCESSING).update(
+                status=False, delivery_status=DeliveryStatus.DONE, error_message="发送中断"
+            )
+            if updated:
+                message_log.status = False
+                StatsService.record_message(message_log)
+                count += 1
+        return count
+
+    @staticmethod
+    def rollup_message_logs(ids):
+        """将一批消息日志按天汇总"""
+        rows = MessageLog.objects.filter(pk__in=ids).annotate(
+            date=TruncDate('created_at', tzinfo=timezone.get_current_timezone())
+        ).order_by().values('date', 'created_by_id', 'robot_id', 'template_id', 'status').annotate(count=Count('id'))
+
+        for row in rows:
+            key = {
+                'date': row['date'],
+                'user_id': row['created_by_id'],
+                'robot_id': row['robot_id'],
+                'template_id': row['template_id'],
+                'status': row['status'],
+            }
+            updated = MessageLogDailyRollup.objects.filter(**key).update(count=F('count') + row['count'])
+            if not updated:
+                MessageLogDailyRollup.objects.create(count=row['count'], **key)
+
+    @staticmethod
+    def delete_in_batches(queryset, batch_size, before_delete=None):
+        """分批删除查询集中的记录，返回删除数量
+
+        before_delete 在同一事务中、删除前调用，参数为本批记录的ID列表。
+        本批记录在事务中加锁，删除时再次按查询集的条件检查，期间被其他请求引用的原始数据不会被删除。
+        """
+        total = 0
+        while True:
+            with transaction.atomic():
+                ids = list(queryset.select_for_update().order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                if before_delete is not None:
+                    before_delete(ids)
+                _, deleted = queryset.filter(pk__in=ids).delete()
+            total += deleted.get(queryset.model._meta.label, 0)
+        return total
+
+    @classmethod
+    def purge_message_logs(cls, days=None, batch_size=None):
+        """汇总并删除过期的消息日志"""
+        days = getattr(settings, 'MESSAGE_LOG_RETENTION_DAYS', 90) if days is None else days
+        if days <= 0:
+            return 0
+        batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+        return cls.delete_in_batches(
+            cls.expired_message_logs(cls.get_cutoff(days)), batch_size, before_delete=cls.rollup_message_logs
+        )
+
+    @classmethod
+    def purge_alert_records(cls, days=None, batch_size=None):
+        """删除过期的告警记录，实例的告警次数保存在实例映射中，不受影响"""
+        days = getattr(settings, 'ALERT_RECORD_RETENTION_DAYS', 30) if days is None else days
+        if days <= 0:
+            return 0
+        batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+        return cls.delete_in_batches(cls.expired_alert_records(cls.get_cutoff(days)), batch_size)
+
+    @classmethod
+    def purge_orphan_payloads(cls, batch_size=None):
+        """删除不再被引用的原始数据"""
+        batch_size = batch_size or getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+        return cls.delete_in_batches(cls.orphan_payloads(), batch_size)
+
+    @classmethod
+    def pending_counts(cls, message_days=None, alert_days=None):
+        """统计待清理的记录数，不删除数据"""
+        message_days = getattr(settings, 'MESSAGE_LOG_RETENTION_DAYS', 90) if message_days is None else message_days
+        alert_days = getattr(settings, 'ALERT_RECORD_RETENTION_DAYS', 30) if alert_days is None else alert_days
+        return {
+            'message_logs': cls.expired_message_logs(cls.get_cutoff(message_days)).count() if message_days > 0 else 0,
+            'alert_records': cls.expired_alert_records(cls.get_cutoff(alert_days)).count() if alert_days > 0 else 0,
+        }
+
+    @classmethod
+    def run(cls, message_days=None, alert_days=None, batch_size=None):
+        """执行全部清理任务，返回各类数据的删除数量"""
+        result = {
+            'stuck_message_logs': cls.fail_stuck_message_logs(),
+            'message_logs': cls.purge_message_logs(message_days, batch_size),
+            'alert_records': cls.purge_alert_records(alert_days, batch_size),
+        }
+        result['payloads'] = cls.purge_orphan_payloads(batch_size)
+        logger.info(
+            f"数据清理完成: 中断的发送 {result['stuck_message_logs']} 条, 消息日志 {result['message_logs']} 条, "
+            f"告警记录 {result['alert_records']} 条, 原始数据 {result['payloads']} 条"
+        )
+        return result
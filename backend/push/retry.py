@@ -0,0 +1,98 @@
+import random
+
+import requests
+from django.conf import settings
+
+
+class RetryableError(str):
+    """可重试的发送错误
+
+    作为发送方法返回的错误信息使用，与普通错误信息一样可以直接写入消息日志。
+    超时、连接失败、HTTP 5xx/429 以及平台的频率限制、系统繁忙错误属于此类。
+    """
+
+
+class DeferredError(RetryableError):
+    """需要推迟到 retry_at（时间戳）之后发送的错误，如超过机器人的发送频率限制
+
+    消息重新排队到 retry_at，不计入发送次数。
+    """
+
+    def __new__(cls, message, retry_at):
+        error = super().__new__(cls, message)
+        error.retry_at = retry_at
+        return error
+
+
+class RetryScheduled(str):
+    """发送未成功，但消息已重新排队，将由发送队列稍后重试
+
+    作为发送结果的错误信息返回，调用方据此区分"稍后重试"与"发送失败"，
+    message_log_id 为重新排队的消息日志，scheduled_at 为计划重试时间。
+    """
+
+    def __new__(cls, message, message_log_id, scheduled_at):
+        error = super().__new__(cls, message)
+        error.message_log_id = message_log_id
+        error.scheduled_at = scheduled_at
+        return error
+
+
+# 各平台返回的可重试错误码：系统繁忙、发送频率超过限制
+RETRYABLE_ERROR_CODES = {
+    'wechat': {-1, 45009},
+    'feishu': {9499, 11232},
+    'dingtalk': {-1, 130101, 410100},
+}
+
+
+def classify_request_error(exc):
+    """将请求异常转换为错误信息，超时、连接失败和服务端错误可重试"""
+    message = str(exc)
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return RetryableError(message)
+    response = getattr(exc, 'response', None)
+    if isinstance(exc, requests.HTTPError) and response is not None:
+        if response.status_code >= 500 or response.status_code == 429:
+            return RetryableError(message)
+    return message
+
+
+def vendor_error(robot_type, code, message):
+    """将平台返回的错误码转换为错误信息"""
+    if code in RETRYABLE_ERROR_CODES.get(robot_type, ()):
+        return RetryableError(message or f"错误码: {code}")
+    return message
+
+
+class RetryPolicy:
+    """发送失败的重试策略
+
+    按机器人类型限制最大发送次数（包含首次发送），重试间隔按指数退避增长并加入随机抖动，
+    避免平台恢复时大量消息同时重试。
+    """
+
+    def __init__(self, max_attempts=None, base_delay=5, max_delay=300):
+        self.max_attempts = max_attempts or {}
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_max_attempts(self, robot_type):
+        """机器人类型的最大发送次数，未配置时不重试"""
+        return self.max_attempts.get(robot_type, 1)
+
+    def should_retry(self, robot_type, attempts, error_msg):
+        """已发送 attempts 次后是否继续重试"""
+        return isinstance(error_msg, RetryableError) and attempts < self.get_max_attempts(robot_type)
+
+    def get_delay(self, attempts):
+        """第 attempts 次发送失败后的重试间隔（秒），一半固定、一半随机"""
+        delay = min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+retry_policy = RetryPolicy(
+    max_attempts=getattr(settings, 'DELIVERY_MAX_ATTEMPTS', None),
+    base_delay=getattr(settings, 'DELIVERY_RETRY_BASE_DELAY', 5),
+    max_delay=getattr(settings, 'DELIVERY_RETRY_MAX_DELAY', 300),
+)
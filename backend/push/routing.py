@@ -0,0 +1,125 @@
+import time
+import threading
+
+from django.conf import settings
+from django.http import Http404
+
+from .cache import get_versions, bump_version, ROBOTS_VERSION, TEMPLATES_VERSION
+
+
+class Routes:
+    """某一版本的路由数据，构建完成后不再修改，可在多个线程间共享"""
+
+    def __init__(self, templates, robots):
+        self.templates = {template.pk: template for template in templates}
+        self.robots = {}
+        self.robots_by_name = {}
+        self.default_by_creator = {}
+        self.global_default = None
+        self.by_type_and_creator = {}
+        self.by_type = {}
+
+        # robots 按更新时间倒序排列，与原查询的 first() 取同一个机器人
+        for robot in robots:
+            self.robots[robot.pk] = robot
+            if robot.english_name:
+                self.robots_by_name[robot.english_name] = robot
+            if robot.is_default:
+                self.default_by_creator.setdefault(robot.created_by_id, robot)
+                if self.global_default is None:
+                    self.global_default = robot
+            self.by_type_and_creator.setdefault((robot.robot_type, robot.created_by_id), robot)
+            self.by_type.setdefault(robot.robot_type, robot)
+
+
+class RoutingTable:
+    """公共推送接口的进程内路由表
+
+    缓存模板和机器人，将机器人英文名称、创建者的默认机器人、全局默认机器人、
+    模板类型匹配的机器人解析为字典查找。模板或机器人变化时更新版本戳，
+    各进程在下一次请求时重新加载。
+
+    版本戳只在保存模型时由信号更新，且只有共享缓存中的版本戳对其他进程可见，
+    因此路由表最多使用 max_age 秒后也会重新加载，queryset.update() 等不触发信号的修改
+    以及使用进程内缓存的多进程部署最多延迟 max_age 秒生效。
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self._version = None
+        self._routes = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def _is_stale(self, version):
+        if version != self._version:
+            return True
+        return bool(self.max_age) and time.monotonic() - self._loaded_at > self.max_age
+
+    def get_routes(self):
+        """获取当前版本的路由数据"""
+        from .models import Template, Robot
+
+        version = tuple(get_versions([ROBOTS_VERSION, TEMPLATES_VERSION]))
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._routes = Routes(
+                        Template.objects.select_related('created_by'),
+                        Robot.objects.order_by('-updated_at', '-id')
+                    )
+                    self._version = version
+                    self._loaded_at = time.monotonic()
+                    self.rebuilds += 1
+        return self._routes
+
+    def get_template(self, template_id):
+        """按ID获取模板，不存在时抛出404"""
+        template = self.get_routes().templates.get(template_id)
+        if template is None:
+            raise Http404("模板不存在")
+        return template
+
+    def get_robot(self, robot_id):
+        """按ID获取机器人，不存在时抛出404"""
+        robot = self.get_routes().robots.get(robot_id)
+        if robot is None:
+            raise Http404("机器人不存在")
+        return robot
+
+    def get_robot_by_name(self, english_name):
+        """按英文名称获取机器人，不存在时返回None"""
+        return self.get_routes().robots_by_name.get(english_name)
+
+    def get_default_robot(self, creator_id):
+        """获取默认机器人：优先使用创建者的默认机器人，其次为全局默认机器人"""
+        routes = self.get_routes()
+        return routes.default_by_creator.get(creator_id) or routes.global_default
+
+    def get_matching_robot(self, template):
+        """获取与模板类型匹配的机器人：优先使用模板创建者的机器人"""
+        routes = self.get_routes()
+        return (
+            routes.by_type_and_creator.get((template.robot_type, template.created_by_id))
+            or routes.by_type.get(template.robot_type)
+        )
+
+    def stats(self):
+        routes = self._routes
+        return {
+            'templates': len(routes.templates) if routes else 0,
+            'robots': len(routes.robots) if routes else 0,
+            'rebuilds': self.rebuilds,
+        }
+
+    @staticmethod
+    def invalidate_robots():
+        bump_version(ROBOTS_VERSION)
+
+    @staticmethod
+    def invalidate_templates():
+        bump_version(TEMPLATES_VERSION)
+
+
+routing_table = RoutingTable(max_age=getattr(settings, 'PROCESS_CACHE_MAX_AGE', 30))
@@ -0,0 +1,375 @@
+import re
+import json
+import time
+import logging
+import threading
+
+from django.conf import settings
+
+from .cache import get_version, bump_version
+
+logger = logging.getLogger(__name__)
+
+RULES_VERSION = 'distribution_rules'
+
+# 表示调用方没有提供已解析的JSON文档
+NOT_PARSED = object()
+# 表示JSON路径在文档中不存在
+MISSING = object()
+
+
+def parse_json_data(data):
+    """解析JSON数据，兼容被转义过的字符串"""
+    if not isinstance(data, str):
+        return data
+    try:
+        return json.loads(data)
+    except json.JSONDecodeError:
+        # 如果解析失败，尝试先进行一次反转义
+        try:
+            # 尝试解码可能被双重转义的字符串
+            return json.loads(data.encode().decode('unicode_escape'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # 如果还是失败，尝试替换常见的转义字符
+            return json.loads(data.replace('\\.', '.'))
+
+
+def parse_alert_document(raw_data):
+    """解析告警数据供所有JSON规则共用，无法解析时返回None"""
+    try:
+        return parse_json_data(raw_data)
+    except (ValueError, TypeError):
+        return None
+
+
+class JsonPath:
+    """预编译的JSON提取路径
+
+    路径在构造时编译为步骤序列，求值时对文档只遍历一次并惰性产出结果。支持的语法：
+
+    - ``labels.instance``：逐级取字段，末端为数组时展开数组元素
+    - ``alerts[].labels.instance`` / ``alerts[*]``：遍历数组，可以出现多次，如 ``alerts[].targets[].host``
+    - ``alerts[0]`` / ``alerts[-1]``：按下标取数组元素
+    - ``alerts[?status==firing]`` / ``alerts[?labels.severity!='info']``：按字段值过滤数组元素，
+      未加引号的值按JSON解析（如 ``true``、``3``、``null``），无法解析时作为字符串，比较时区分类型
+    """
+
+    FILTER_REGEX = re.compile(r'^@?\.?([\w\-.]+)\s*(==|!=)\s*(.*)$')
+    INDEX_REGEX = re.compile(r'^-?\d+$')
+
+    def __init__(self, path):
+        self.path = path
+        self.steps = self._compile(path.strip())
+        # _simple_tail[i] 表示从第 i 步开始是否只剩字段和下标步骤
+        # _tail_keys[i] 为从第 i 步开始只剩字段步骤时的字段序列，否则为None
+        step_count = len(self.steps)
+        self._simple_tail = [True] * (step_count + 1)
+        self._tail_keys = [None] * step_count + [()]
+        for index in range(step_count - 1, -1, -1):
+            kind = self.steps[index][0]
+            self._simple_tail[index] = self._simple_tail[index + 1] and kind in ('keys', 'index')
+            if kind == 'keys' and self._tail_keys[index + 1] is not None:
+                self._tail_keys[index] = self.steps[index][1] + self._tail_keys[index + 1]
+
+    @classmethod
+    def _compile(cls, path):
+        """将路径编译为步骤元组，语法错误时抛出ValueError"""
+        if path.startswith('$'):
+            path = path[1:]
+
+        steps = []
+        position = 0
+        length = len(path)
+        while position < length:
+            char = path[position]
+            if char == '.':
+                position += 1
+            elif char == '[':
+                end = cls._find_closing_bracket(path, position)
+                steps.append(cls._compile_selector(path[position + 1:end].strip()))
+                position = end + 1
+            else:
+                end = position
+                while end < length and path[end] not in '.[':
+                    end += 1
+                steps.append(('key', path[position:end]))
+                position = end
+
+        if not steps:
+            raise ValueError('提取路径不能为空')
+
+        # 连续的字段步骤合并为一步，求值时一次循环取完，减少生成器层数
+        merged = []
+        for step in steps:
+            if step[0] == 'key':
+                if merged and merged[-1][0] == 'keys':
+                    merged[-1] = ('keys', merged[-1][1] + (step[1],))
+                else:
+                    merged.append(('keys', (step[1],)))
+            else:
+                merged.append(step)
+        return tuple(merged)
+
+    @staticmethod
+    def _find_closing_bracket(path, start):
+        """查找与 start 处 '[' 匹配的 ']'，忽略引号内的字符"""
+        quote = None
+        for index in range(start + 1, len(path)):
+            char = path[index]
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ('"', "'"):
+                quote = char
+            elif char == ']':
+                return index
+        raise ValueError(f"路径中的 '[' 缺少匹配的 ']': {path}")
+
+    @classmethod
+    def _compile_selector(cls, selector):
+        """编译方括号中的选择器"""
+        if selector in ('', '*'):
+            return ('each',)
+        if cls.INDEX_REGEX.match(selector):
+            return ('index', int(selector))
+        if selector.startswith('?'):
+            expression = selector[1:].strip()
+            if expression.startswith('(') and expression.endswith(')'):
+                expression = expression[1:-1].strip()
+            match = cls.FILTER_REGEX.match(expression)
+            if match:
+                field, operator, value = match.groups()
+                return ('filter', tuple(field.split('.')), operator == '==', cls._parse_literal(value.strip()))
+        raise ValueError(f"无法识别的路径选择器: [{selector}]")
+
+    @staticmethod
+    def _parse_literal(value):
+        """解析过滤条件中的值：引号内为字符串，否则按JSON解析，无法解析时作为字符串"""
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'"):
+            return value[1:-1]
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    @staticmethod
+    def _get_field(obj, keys):
+        """按路径逐级取值，路径不存在时返回 MISSING"""
+        current = obj
+        for key in keys:
+            if isinstance(current, dict) and key in current:
+                current = current[key]
+            else:
+                return MISSING
+        return current
+
+    @classmethod
+    def _matches(cls, item, step):
+        """判断元素是否满足过滤条件，布尔值只与布尔值相等（True 不等于 1）"""
+        _, field_keys, equal, value = step
+        field_value = cls._get_field(item, field_keys)
+        matched = (
+            field_value is not MISSING
+            and isinstance(field_value, bool) == isinstance(value, bool)
+            and field_value == value
+        )
+        return matched if equal else not matched
+
+    def _resolve(self, node, index):
+        """依次执行从 index 开始的字段和下标步骤，遇到通配或过滤步骤时停止
+
+        返回 (节点, 停止处的步骤序号)，路径不匹配时节点为 MISSING。
+        """
+        steps = self.steps
+        last = len(steps)
+        while index < last:
+            step = steps[index]
+            kind = step[0]
+            if kind == 'keys':
+                for key in step[1]:
+                    if isinstance(node, dict) and key in node:
+                        node = node[key]
+                    else:
+                        return MISSING, index
+            elif kind == 'index':
+                if isinstance(node, list) and -len(node) <= step[1] < len(node):
+                    node = node[step[1]]
+                else:
+                    return MISSING, index
+            else:
+                break
+            index += 1
+        return node, index
+
+    def iter_values(self, json_data):
+        """惰性产出路径匹配到的所有值
+
+        使用显式栈代替递归生成器，文档只遍历一次，结果按文档顺序产出。
+        """
+        steps = self.steps
+        last = len(steps)
+        stack = [(json_data, 0)]
+        while stack:
+            node, index = stack.pop()
+            node, index = self._resolve(node, index)
+            if node is MISSING:
+                continue
+
+            if index == last:
+                if isinstance(node, list):
+                    yield from node
+                elif node is not None:
+                    yield node
+                continue
+
+            step = steps[index]
+            if step[0] == 'each':
+                items = node if isinstance(node, list) else ()
+            elif isinstance(node, list):
+                items = [item for item in node if self._matches(item, step)]
+            else:
+                items = (node,) if self._matches(node, step) else ()
+
+            tail_keys = self._tail_keys[index + 1]
+            if tail_keys is not None:
+                # 剩余步骤只有字段访问时直接在当前循环中取值，这是最常见的 alerts[].labels.instance 形式
+                for item in items:
+                    value = item
+                    for key in tail_keys:
+                        if isinstance(value, dict) and key in value:
+                            value = value[key]
+                        else:
+                            break
+                    else:
+                        if isinstance(value, list):
+                            yield from value
+                        elif value is not None:
+                            yield value
+            elif self._simple_tail[index + 1]:
+                # 剩余步骤没有分支时直接求值，无需入栈
+                for item in items:
+                    value, _ = self._resolve(item, index + 1)
+                    if value is MISSING:
+                        continue
+                    if isinstance(value, list):
+                        yield from value
+                    elif value is not None:
+                        yield value
+            else:
+                stack.extend((item, index + 1) for item in reversed(items))
+
+    def extract(self, json_data):
+        """从已解析的JSON对象中提取值，返回去重后的字符串列表"""
+        return list(dict.fromkeys(map(str, self.iter_values(json_data))))
+
+
+class StringPattern:
+    """预编译的字符串提取模式，{{variable}} 处匹配非空白字符"""
+
+    VARIABLE_REGEX = re.compile(r'\{\{(\w+)\}\}')
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regexes = []
+        for var in self.VARIABLE_REGEX.findall(pattern):
+            # 构建正则表达式来提取值
+            regex_pattern = pattern.replace(f'{{{{{var}}}}}', r'([^\s]+)')
+            try:
+                self.regexes.append(re.compile(regex_pattern))
+            except re.error as e:
+                logger.error(f"String pattern compile error: {str(e)}")
+
+    def extract(self, text):
+        """从字符串中提取值，返回去重后的列表"""
+        results = {}
+        for regex in self.regexes:
+            for match in regex.findall(text):
+                results[match] = None
+        return list(results)
+
+
+class CompiledRule:
+    """预编译的分发规则"""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.matcher = None
+        try:
+            if rule.type == 'json':
+                self.matcher = JsonPath(rule.extract_path)
+            else:  # string
+                self.matcher = StringPattern(rule.extract_pattern)
+        except ValueError as e:
+            # 路径有误的规则不会匹配任何数据
+            logger.error(f"Rule {rule.name} compile error: {str(e)}")
+
+    @property
+    def name(self):
+        return self.rule.name
+
+    @property
+    def type(self):
+        return self.rule.type
+
+    def extract(self, raw_data, document=NOT_PARSED):
+        """从告警数据中提取实例名称
+
+        document 为调用方已解析好的JSON对象，多条规则共用同一次解析结果。
+        """
+        if self.matcher is None:
+            return []
+        try:
+            if self.rule.type == 'json':
+                if document is NOT_PARSED:
+                    document = parse_json_data(raw_data)
+                return self.matcher.extract(document)
+            return self.matcher.extract(raw_data)
+        except Exception as e:
+            logger.error(f"Rule {self.rule.name} extraction error: {str(e)}")
+            return []
+
+
+class RuleRegistry:
+    """启用规则的进程内缓存
+
+    规则只在版本戳变化时重新加载和编译，每次告警只需执行匹配。
+    与路由表相同，最多使用 max_age 秒后也会重新加载，不触发信号的修改不会一直不生效。
+    """
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        self._version = None
+        self._rules = []
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _is_stale(self, version):
+        if version != self._version:
+            return True
+        return bool(self.max_age) and time.monotonic() - self._loaded_at > self.max_age
+
+    @staticmethod
+    def get_queryset():
+        """启用的分发规则"""
+        from .models import DistributionRule
+
+        return DistributionRule.objects.filter(is_active=True)
+
+    def get_active_rules(self):
+        """获取编译后的启用规则列表"""
+        version = get_version(RULES_VERSION)
+        if self._is_stale(version):
+            with self._lock:
+                if self._is_stale(version):
+                    self._rules = [CompiledRule(rule) for rule in self.get_queryset()]
+                    self._version = version
+                    self._loaded_at = time.monotonic()
+        return self._rules
+
+    @staticmethod
+    def invalidate():
+        """规则变化后更新版本戳"""
+        bump_version(RULES_VERSION)
+
+
+rule_registry = RuleRegistry(max_age=getattr(settings, 'PROCESS_CACHE_MAX_AGE', 30))
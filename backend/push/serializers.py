@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Template, Robot, MessageLog, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel
+from .models import (
+    Template, Robot, MessageLog, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel,
+    DeliveryAttempt, DeadLetter
+)
+from .rules import JsonPath
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -53,6 +57,9 @@ class MessageLogSerializer(serializers.ModelSerializer):
     template_name = serializers.CharField(source='template.name', read_only=True)
     robot_name = serializers.CharField(source='robot.name', read_only=True)
     created_by_username = serializers.CharField(source='created_by.username', read_only=True)
+    # 发送内容和原始数据保存在Payload表中
+    content = serializers.CharField(read_only=True)
+    raw_data = serializers.CharField(read_only=True, allow_null=True)
     created_at = serializers.SerializerMethodField()
 
     def get_created_at(self, obj):
@@ -60,7 +67,7 @@ class MessageLogSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = MessageLog
-        fields = '__all__'
+        exclude = ['content_payload', 'raw_payload']
         read_only_fields = ['created_by', 'created_at', 'status', 'error_message', 'formatted_content', 'template_name', 'robot_name', 'created_by_username']
 
     def create(self, validated_data):
@@ -68,6 +75,21 @@ class MessageLogSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class MessageLogListSerializer(MessageLogSerializer):
+    """消息日志列表序列化器，不包含发送内容、原始数据等大字段，完整内容通过详情接口获取"""
+
+    # 列表查询通过 defer() 跳过的字段，发送内容和原始数据在Payload表中，列表不关联查询
+    deferred_fields = ('formatted_content',)
+
+    class Meta:
+        model = MessageLog
+        fields = [
+            'id', 'template', 'template_name', 'robot', 'robot_name', 'status', 'delivery_status',
+            'error_message', 'created_by', 'created_by_username', 'created_at'
+        ]
+        read_only_fields = fields
+
+
 class MessagePushSerializer(serializers.Serializer):
     """消息推送序列化器"""
     content = serializers.JSONField(help_text="消息内容，JSON格式")
@@ -128,6 +150,10 @@ class DistributionRuleSerializer(serializers.ModelSerializer):
         if rule_type == 'json':
             if not data.get('extract_path'):
                 raise serializers.ValidationError({'extract_path': 'JSON模式下必须指定提取路径'})
+            try:
+                JsonPath(data['extract_path'])
+            except ValueError as e:
+                raise serializers.ValidationError({'extract_path': f'提取路径格式错误: {str(e)}'})
         elif rule_type == 'string':
             if not data.get('extract_pattern'):
                 raise serializers.ValidationError({'extract_pattern': '字符串模式下必须指定提取模式'})
@@ -175,9 +201,14 @@ class InstanceMappingSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """自定义序列化输出"""
         data = super().to_representation(instance)
-        # 在输出时添加channel_ids和robot_ids（保持向后兼容）
-        data['channel_ids'] = list(instance.distribution_channels.values_list('id', flat=True))
-        data['robot_ids'] = list(instance.distribution_channels.values_list('robot__id', flat=True))
+        # 在输出时添加channel_ids和robot_ids（保持向后兼容），优先使用预取的分发通道
+        channels = instance._prefetched_channels()
+        if channels is not None:
+            data['channel_ids'] = [channel.id for channel in channels]
+            data['robot_ids'] = [channel.robot_id for channel in channels]
+        else:
+            data['channel_ids'] = list(instance.distribution_channels.values_list('id', flat=True))
+            data['robot_ids'] = list(instance.distribution_channels.values_list('robot__id', flat=True))
         return data
     
     def update(self, instance, validated_data):
@@ -211,6 +242,8 @@ class InstanceMappingSerializer(serializers.ModelSerializer):
 class AlertRecordSerializer(serializers.ModelSerializer):
     """告警记录序列化器"""
     instance_name = serializers.CharField(source='instance_mapping.instance_name', read_only=True)
+    alert_content = serializers.CharField(read_only=True)
+    raw_data = serializers.CharField(read_only=True)
     alert_time = serializers.SerializerMethodField()
 
     def get_alert_time(self, obj):
@@ -218,10 +251,36 @@ class AlertRecordSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AlertRecord
-        fields = '__all__'
+        exclude = ['raw_payload']
         read_only_fields = ['alert_time']
 
 
+class DeliveryAttemptSerializer(serializers.ModelSerializer):
+    """发送记录序列化器"""
+    created_at = serializers.SerializerMethodField()
+
+    def get_created_at(self, obj):
+        return obj.created_at.strftime('%Y-%m-%d %H:%M:%S') if obj.created_at else None
+
+    class Meta:
+        model = DeliveryAttempt
+        fields = ['id', 'attempt', 'success', 'retryable', 'error_message', 'latency_ms', 'created_at']
+
+
+class DeadLetterSerializer(serializers.ModelSerializer):
+    """死信消息序列化器"""
+    robot_name = serializers.CharField(source='robot.name', read_only=True, default=None)
+    template_name = serializers.CharField(source='message_log.template.name', read_only=True, default=None)
+    created_at = serializers.SerializerMethodField()
+
+    def get_created_at(self, obj):
+        return obj.created_at.strftime('%Y-%m-%d %H:%M:%S') if obj.created_at else None
+
+    class Meta:
+        model = DeadLetter
+        fields = ['id', 'message_log', 'robot', 'robot_name', 'template_name', 'attempts', 'last_error', 'created_at']
+
+
 class RuleTestSerializer(serializers.Serializer):
     """规则测试序列化器"""
     type = serializers.ChoiceField(choices=['json', 'string'])
@@ -234,6 +293,10 @@ class RuleTestSerializer(serializers.Serializer):
         if rule_type == 'json':
             if not data.get('extract_path'):
                 raise serializers.ValidationError({'extract_path': 'JSON模式下必须指定提取路径'})
+            try:
+                JsonPath(data['extract_path'])
+            except ValueError as e:
+                raise serializers.ValidationError({'extract_path': f'提取路径格式错误: {str(e)}'})
         elif rule_type == 'string':
             if not data.get('extract_pattern'):
                 raise serializers.ValidationError({'extract_pattern': '字符串模式下必须指定提取模式'})
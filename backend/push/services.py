@@ -1,23 +1,114 @@
 import json
+import time
+import hashlib
+import threading
 import requests
 import logging
 import jinja2
-from jinja2 import Template as JinjaTemplate
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
 from django.utils import timezone
 
-from .models import RobotType, MessageLog
+from .models import RobotType, MessageLog, DeliveryStatus, DeliveryAttempt, DeadLetter
+from .transport import webhook_pool
+from .breaker import CircuitOpenError
+from .ratelimit import rate_limiter, RateLimitExceeded
+from .retry import RetryableError, DeferredError, RetryScheduled, classify_request_error, vendor_error, retry_policy
+from .stats import StatsService
+from .rules import CompiledRule, JsonPath, StringPattern, NOT_PARSED, parse_json_data
 
 logger = logging.getLogger(__name__)
 
 
+class TemplateCache:
+    """已编译jinja2模板的LRU缓存
+
+    以 (模板ID, 内容哈希) 作为键，所有模板共用同一个长期存在的 Environment，
+    避免每次推送都重新词法分析、解析并编译同一份模板源码。
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.environment = jinja2.Environment()
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(template_content, template_id=None):
+        """生成缓存键，内容哈希保证模板修改后不会命中旧的编译结果"""
+        digest = hashlib.sha1(template_content.encode('utf-8')).hexdigest()
+        return template_id, digest
+
+    def get(self, template_content, template_id=None):
+        """获取已编译的模板，未命中时编译并放入缓存"""
+        key = self.make_key(template_content, template_id)
+        with self._lock:
+            compiled = self._templates.get(key)
+            if compiled is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+
+        # 编译放在锁外进行，模板语法错误会直接抛出给调用方
+        compiled = self.environment.from_string(template_content)
+
+        with self._lock:
+            self._templates[key] = compiled
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+                self.evictions += 1
+        return compiled
+
+    def invalidate(self, template_id):
+        """移除指定模板的全部编译结果"""
+        with self._lock:
+            for key in [key for key in self._templates if key[0] == template_id]:
+                del self._templates[key]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._templates.clear()
+
+    def stats(self):
+        """缓存统计信息，用于监控"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._templates),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+template_cache = TemplateCache(max_size=getattr(settings, 'TEMPLATE_CACHE_SIZE', 256))
+
+
 class MessagePushService:
     """消息推送服务"""
     
+    # 合并发送时各条消息之间的分隔线
+    BATCH_SEPARATOR = '\n\n---\n\n'
+    # 单条消息超过平台大小限制时，截断内容后追加的提示
+    TRUNCATED_SUFFIX = '\n...（内容过长，已截断）'
+    
     @staticmethod
-    def format_message(template_content, data):
+    def format_message(template_content, data, template_id=None):
         """使用jinja2格式化消息"""
         try:
-            jinja_template = JinjaTemplate(template_content)
+            jinja_template = template_cache.get(template_content, template_id)
             formatted_content = jinja_template.render(**data)
             return formatted_content, None
         except jinja2.exceptions.TemplateError as e:
@@ -39,15 +130,15 @@ class MessagePushService:
                     "content": content
                 }
             }
-            response = requests.post(webhook_url, headers=headers, data=json.dumps(payload))
+            response = webhook_pool.post(webhook_url, headers=headers, data=json.dumps(payload))
             response.raise_for_status()
             result = response.json()
             if result.get('errcode') == 0:
                 return True, None
-            return False, result.get('errmsg')
+            return False, vendor_error(RobotType.WECHAT, result.get('errcode'), result.get('errmsg'))
         except requests.RequestException as e:
             logger.error(f"Wechat push error: {str(e)}")
-            return False, str(e)
+            return False, classify_request_error(e)
     
     @staticmethod
     def push_feishu_message(webhook_url, content):
@@ -69,15 +160,17 @@ class MessagePushService:
                     ]
                 }
             }
-            response = requests.post(webhook_url, headers=headers, data=json.dumps(payload))
+            response = webhook_pool.post(webhook_url, headers=headers, data=json.dumps(payload))
             response.raise_for_status()
             result = response.json()
             if result.get('StatusCode') == 0:
                 return True, None
-            return False, result.get('StatusMessage')
+            # 新版接口使用 code/msg 返回错误
+            code = result.get('StatusCode', result.get('code'))
+            return False, vendor_error(RobotType.FEISHU, code, result.get('StatusMessage') or result.get('msg'))
         except requests.RequestException as e:
             logger.error(f"Feishu push error: {str(e)}")
-            return False, str(e)
+            return False, classify_request_error(e)
     
     @staticmethod
     def push_dingtalk_message(webhook_url, content):
@@ -92,61 +185,303 @@ class MessagePushService:
                     "text": content
                 }
             }
-            response = requests.post(webhook_url, headers=headers, data=json.dumps(payload))
+            response = webhook_pool.post(webhook_url, headers=headers, data=json.dumps(payload))
             response.raise_for_status()
             result = response.json()
             if result.get('errcode') == 0:
                 return True, None
-            return False, result.get('errmsg')
+            return False, vendor_error(RobotType.DINGTALK, result.get('errcode'), result.get('errmsg'))
         except requests.RequestException as e:
             logger.error(f"Dingtalk push error: {str(e)}")
-            return False, str(e)
+            return False, classify_request_error(e)
     
     @classmethod
-    def push_message(cls, template, robot, data, user=None):
-        """推送消息主方法"""
-        # 创建消息日志
-        message_log = MessageLog.objects.create(
+    def send_to_robot(cls, robot, content):
+        """根据机器人类型推送已格式化的消息
+
+        先检查熔断器，熔断中的机器人不消耗发送频率配额；超过发送频率限制且需要等待较长时间时
+        不发送，返回 DeferredError，由调用方将消息重新排队到下一个可用时间。
+        """
+        try:
+            webhook_pool.check(robot.webhook_url)
+            rate_limiter.acquire(robot)
+        except CircuitOpenError as e:
+            logger.warning(f"Robot {robot.name} push rejected: {str(e)}")
+            return False, classify_request_error(e)
+        except RateLimitExceeded as e:
+            return False, DeferredError(
+                f"{str(e)}，{max(e.retry_at - time.time(), 0):.0f} 秒后重新发送", e.retry_at
+            )
+        if robot.robot_type == RobotType.WECHAT:
+            return cls.push_wechat_message(robot.webhook_url, content)
+        elif robot.robot_type == RobotType.FEISHU:
+            return cls.push_feishu_message(robot.webhook_url, content)
+        elif robot.robot_type == RobotType.DINGTALK:
+            return cls.push_dingtalk_message(robot.webhook_url, content)
+        return False, f"不支持的机器人类型: {robot.robot_type}"
+    
+    @staticmethod
+    def create_message_log(template, robot, data, user=None, queued=False, channel=None, scheduled_at=None):
+        """创建消息日志，异步模式下日志处于排队状态"""
+        raw_data = json.dumps(data)
+        # 发送内容与原始数据相同，保存时只写入一份Payload
+        return MessageLog.objects.create(
             template=template,
             robot=robot,
-            content=json.dumps(data),
-            raw_data=json.dumps(data),
+            content=raw_data,
+            raw_data=raw_data,
+            delivery_status=DeliveryStatus.QUEUED if queued else DeliveryStatus.PROCESSING,
+            channel=channel,
+            scheduled_at=scheduled_at,
             created_by=user
         )
-        
+    
+    @classmethod
+    def deliver(cls, message_log, template, robot, data):
+        """格式化并发送消息，同时更新消息日志"""
         # 格式化消息内容
-        formatted_content, error = cls.format_message(template.content, data)
+        formatted_content, error = cls.format_message(template.content, data, template_id=template.pk)
         if error:
-            message_log.status = False
-            message_log.error_message = f"模板格式化错误: {error}"
-            message_log.save()
+            cls.complete_message_log(message_log, False, f"模板格式化错误: {error}")
             return False, error
         
         # 根据机器人类型推送消息
-        message_log.formatted_content = formatted_content
-        success = False
-        error_msg = None
+        webhook_pool.pop_latency()
+        success, error_msg = cls.send_to_robot(robot, formatted_content)
         
-        if robot.robot_type == RobotType.WECHAT:
-            success, error_msg = cls.push_wechat_message(robot.webhook_url, formatted_content)
-        elif robot.robot_type == RobotType.FEISHU:
-            success, error_msg = cls.push_feishu_message(robot.webhook_url, formatted_content)
-        elif robot.robot_type == RobotType.DINGTALK:
-            success, error_msg = cls.push_dingtalk_message(robot.webhook_url, formatted_content)
-        else:
-            error_msg = f"不支持的机器人类型: {robot.robot_type}"
+        # 更新消息日志，消息重新排队时返回 RetryScheduled，调用方据此区分稍后重试与发送失败
+        requeued = cls.complete_message_log(
+            message_log, success, error_msg, formatted_content=formatted_content, latency_ms=webhook_pool.pop_latency()
+        )
+        if requeued:
+            return False, RetryScheduled(error_msg, message_log.pk, message_log.scheduled_at)
         
-        # 更新消息日志
-        message_log.status = success
-        if not success and error_msg:
+        return success, error_msg
+    
+    @staticmethod
+    def complete_message_log(message_log, success, error_msg, formatted_content=None, latency_ms=None):
+        """记录本次发送结果
+        
+        可重试的错误在未达到最大发送次数时按退避间隔重新排队，由发送队列在请求之外重试；
+        重试次数用尽后写入死信表。发送完成（成功或不再重试）时更新仪表盘计数。
+        因发送频率限制推迟的消息没有发送，重新排队到可发送的时间，不计入发送次数。
+        返回消息是否重新排队。
+        """
+        if formatted_content is not None:
+            message_log.formatted_content = formatted_content
+        
+        if isinstance(error_msg, DeferredError):
+            from .delivery import delivery_queue
+            
+            message_log.delivery_status = DeliveryStatus.QUEUED
+            message_log.scheduled_at = timezone.now() + timedelta(seconds=max(error_msg.retry_at - time.time(), 0))
             message_log.error_message = error_msg
+            message_log.save()
+            delivery_queue.notify()
+            return True
+        
+        message_log.attempts += 1
+        DeliveryAttempt.objects.create(
+            message_log=message_log,
+            attempt=message_log.attempts,
+            success=success,
+            retryable=isinstance(error_msg, RetryableError),
+            error_message=None if success else error_msg,
+            latency_ms=latency_ms
+        )
+        
+        if success:
+            message_log.error_message = None
+        elif error_msg:
+            message_log.error_message = error_msg
+        
+        robot = message_log.robot
+        if not success and robot is not None and retry_policy.should_retry(
+            robot.robot_type, message_log.attempts, error_msg
+        ):
+            from .delivery import delivery_queue
+            
+            delay = retry_policy.get_delay(message_log.attempts)
+            message_log.delivery_status = DeliveryStatus.QUEUED
+            message_log.scheduled_at = timezone.now() + timedelta(seconds=delay)
+            message_log.save()
+            delivery_queue.notify()
+            logger.info(f"消息 {message_log.pk} 第 {message_log.attempts} 次发送失败，{delay:.1f} 秒后重试")
+            return True
+        
+        message_log.delivery_status = DeliveryStatus.DONE
+        message_log.status = success
         message_log.save()
+        StatsService.record_message(message_log)
         
-        return success, error_msg
+        if not success and isinstance(error_msg, RetryableError):
+            DeadLetter.objects.update_or_create(
+                message_log=message_log,
+                defaults={
+                    'robot': robot,
+                    'attempts': message_log.attempts,
+                    'last_error': error_msg,
+                    'created_by_id': message_log.created_by_id,
+                }
+            )
+        return False
+    
+    @staticmethod
+    def get_size_limit(robot):
+        """机器人平台单条消息内容的最大字节数，0 表示不限制"""
+        return getattr(settings, 'ROBOT_MESSAGE_SIZE_LIMITS', {}).get(robot.robot_type, 0)
+    
+    @classmethod
+    def combine_messages(cls, channel, contents, alerts):
+        """将多条消息合并为一条：使用通道的批量模板，未配置时用分隔线连接"""
+        if not channel.batch_template:
+            return cls.BATCH_SEPARATOR.join(contents), None
+        return cls.format_message(channel.batch_template, {
+            'messages': contents,
+            'alerts': alerts,
+            'count': len(contents),
+        })
+    
+    @classmethod
+    def truncate_content(cls, content, max_bytes):
+        """按UTF-8字节数截断消息内容并加上截断提示，不拆开多字节字符"""
+        encoded = content.encode('utf-8')
+        if len(encoded) <= max_bytes:
+            return content
+        keep = max(max_bytes - len(cls.TRUNCATED_SUFFIX.encode('utf-8')), 0)
+        return encoded[:keep].decode('utf-8', errors='ignore') + cls.TRUNCATED_SUFFIX
+    
+    @classmethod
+    def combine_group(cls, channel, group):
+        """合并一组 (消息日志, 格式化内容, 数据)，返回 (分组, 合并内容, 错误信息)"""
+        text, error = cls.combine_messages(
+            channel, [content for _, content, _ in group], [data for _, _, data in group]
+        )
+        return group, text, f"批量模板格式化错误: {error}" if error else None
+    
+    @classmethod
+    def fit_group(cls, channel, group, limit):
+        """合并渲染一组消息，超过大小限制时对半拆分；单条消息超过限制时截断内容，截断后仍超过则发送失败"""
+        group, text, error = cls.combine_group(channel, group)
+        if error or len(text.encode('utf-8')) <= limit:
+            return [(group, text, error)]
+        if len(group) > 1:
+            middle = len(group) // 2
+            return cls.fit_group(channel, group[:middle], limit) + cls.fit_group(channel, group[middle:], limit)
+        
+        message_log, content, data = group[0]
+        excess = len(text.encode('utf-8')) - limit
+        truncated = cls.truncate_content(content, len(content.encode('utf-8')) - excess)
+        _, text, error = cls.combine_group(channel, [(message_log, truncated, data)])
+        if error is None and len(text.encode('utf-8')) > limit:
+            return [(group, None, f"消息超过平台大小限制（{limit} 字节）")]
+        logger.warning(f"消息 {message_log.pk} 超过平台大小限制（{limit} 字节），已截断")
+        return [(group, text, error)]
+    
+    @classmethod
+    def split_batches(cls, channel, robot, items):
+        """按平台的消息大小限制分组合并
+        
+        items 为 (消息日志, 格式化内容, 数据) 列表。每条消息只单独渲染一次，估算其在合并内容中的字节数，
+        按估算依次分组后每组合并渲染一次，估算偏小导致超过限制时再拆分该组。
+        返回 (分组, 合并内容, 错误信息) 列表。
+        """
+        if not items:
+            return []
+        limit = cls.get_size_limit(robot)
+        if not limit:
+            return [cls.combine_group(channel, items)]
+        
+        def size(text):
+            return len(text.encode('utf-8'))
+        
+        if channel.batch_template:
+            # 单条消息的渲染结果减去不含消息时的渲染结果，即该消息所占的字节数
+            empty, error = cls.combine_messages(channel, [], [])
+            overhead = 0 if error else size(empty)
+            costs = []
+            for _, content, data in items:
+                text, error = cls.combine_messages(channel, [content], [data])
+                costs.append(size(content) if error else size(text) - overhead)
+        else:
+            separator = size(cls.BATCH_SEPARATOR)
+            overhead = -separator
+            costs = [size(content) + separator for _, content, _ in items]
+        
+        batches = []
+        group, total = [], overhead
+        for item, cost in zip(items, costs):
+            if group and total + cost > limit:
+                batches.extend(cls.fit_group(channel, group, limit))
+                group, total = [], overhead
+            group.append(item)
+            total += cost
+        batches.extend(cls.fit_group(channel, group, limit))
+        return batches
+    
+    @classmethod
+    def deliver_batch(cls, message_logs, channel):
+        """合并发送同一分发通道的多条排队消息
+        
+        每条消息先用各自的模板格式化，再按平台的消息大小限制分组合并发送，
+        同一组的消息日志记录相同的发送结果。返回 (全部发送成功, 最后一个错误信息)，
+        最后一组消息全部重新排队时错误信息为 RetryScheduled。
+        """
+        items = []
+        all_success, last_error = True, None
+        for message_log in message_logs:
+            if message_log.template is None or message_log.robot is None:
+                error = "模板或机器人已被删除"
+            else:
+                try:
+                    data = json.loads(message_log.raw_data or '{}')
+                    content, error = cls.format_message(
+                        message_log.template.content, data, template_id=message_log.template_id
+                    )
+                except json.JSONDecodeError as e:
+                    error = f"消息数据解析失败: {str(e)}"
+                else:
+                    if error is None:
+                        items.append((message_log, content, data))
+                        continue
+                    error = f"模板格式化错误: {error}"
+            cls.complete_message_log(message_log, False, error)
+            all_success, last_error = False, error
+        
+        robot = channel.robot
+        for group, combined, error in cls.split_batches(channel, robot, items):
+            latency_ms = None
+            if error:
+                success, error_msg = False, error
+            else:
+                webhook_pool.pop_latency()
+                success, error_msg = cls.send_to_robot(robot, combined)
+                latency_ms = webhook_pool.pop_latency()
+            requeued = [
+                cls.complete_message_log(message_log, success, error_msg, formatted_content=content, latency_ms=latency_ms)
+                for message_log, content, _ in group
+            ]
+            if not success:
+                all_success, last_error = False, error_msg
+                if all(requeued):
+                    last_error = RetryScheduled(error_msg, group[-1][0].pk, group[-1][0].scheduled_at)
+        
+        return all_success, last_error
+    
+    @classmethod
+    def push_message(cls, template, robot, data, user=None):
+        """推送消息主方法"""
+        # 创建消息日志
+        message_log = cls.create_message_log(template, robot, data, user=user)
+        return cls.deliver(message_log, template, robot, data)
     
     @classmethod
     def test_robot(cls, robot, test_message, user=None):
-        """测试机器人接口"""
+        """测试机器人接口
+
+        测试消息没有模板，不能由发送队列重新发送。超过发送频率限制时不记录消息日志，
+        返回 DeferredError，由调用方拒绝请求并告知可重新发送的时间。
+        """
         # 创建消息日志
         message_log = MessageLog.objects.create(
             robot=robot,
@@ -156,168 +491,169 @@ class MessagePushService:
         )
         
         # 根据机器人类型推送消息
-        success = False
-        error_msg = None
-        
-        if robot.robot_type == RobotType.WECHAT:
-            success, error_msg = cls.push_wechat_message(robot.webhook_url, test_message)
-        elif robot.robot_type == RobotType.FEISHU:
-            success, error_msg = cls.push_feishu_message(robot.webhook_url, test_message)
-        elif robot.robot_type == RobotType.DINGTALK:
-            success, error_msg = cls.push_dingtalk_message(robot.webhook_url, test_message)
-        else:
-            error_msg = f"不支持的机器人类型: {robot.robot_type}"
+        success, error_msg = cls.send_to_robot(robot, test_message)
+        if isinstance(error_msg, DeferredError):
+            message_log.delete()
+            return success, error_msg
         
         # 更新消息日志
         message_log.status = success
         if not success and error_msg:
             message_log.error_message = error_msg
         message_log.save()
+        StatsService.record_message(message_log)
         
         return success, error_msg
 
-
 class DistributionService:
     """分发服务"""
     
+    # 进程内按机器人限制并发发送数，避免单个机器人被并发请求打满
+    _robot_semaphores = {}
+    _robot_semaphores_lock = threading.Lock()
+    
     @classmethod
-    def extract_json_values(cls, data, path):
-        """从JSON数据中提取值"""
+    def _get_robot_semaphore(cls, robot_id):
+        """获取机器人对应的并发信号量"""
+        with cls._robot_semaphores_lock:
+            semaphore = cls._robot_semaphores.get(robot_id)
+            if semaphore is None:
+                limit = getattr(settings, 'DISTRIBUTION_ROBOT_CONCURRENCY', 2)
+                semaphore = threading.BoundedSemaphore(max(limit, 1))
+                cls._robot_semaphores[robot_id] = semaphore
+            return semaphore
+    
+    @classmethod
+    def _push_with_robot_limit(cls, template, robot, data, user):
+        """在机器人并发限制内推送消息，出错时返回错误信息，不影响其他消息的推送"""
         try:
-            # 解析JSON数据
-            if isinstance(data, str):
-                # 尝试处理可能的转义字符问题
-                try:
-                    json_data = json.loads(data)
-                except json.JSONDecodeError as e:
-                    # 如果解析失败，尝试先进行一次反转义
-                    try:
-                        # 尝试解码可能被双重转义的字符串
-                        decoded_data = data.encode().decode('unicode_escape')
-                        json_data = json.loads(decoded_data)
-                    except (json.JSONDecodeError, UnicodeDecodeError):
-                        # 如果还是失败，尝试替换常见的转义字符
-                        cleaned_data = data.replace('\\.', '.')
-                        json_data = json.loads(cleaned_data)
-            else:
-                json_data = data
-            
-            results = set()
-            
-            # 支持数组语法的路径解析，如 alerts[].labels.instance
-            if '[].' in path:
-                # 解析数组路径
-                parts = path.split('[].')
-                if len(parts) == 2:
-                    array_path = parts[0]  # alerts
-                    field_path = parts[1]  # labels.instance
-                    
-                    # 获取数组
-                    current = json_data
-                    for key in array_path.split('.'):
-                        if isinstance(current, dict) and key in current:
-                            current = current[key]
-                        else:
-                            return []
-                    
-                    # 遍历数组元素
-                    if isinstance(current, list):
-                        for item in current:
-                            # 在每个数组元素中查找字段
-                            field_value = cls._extract_field_from_object(item, field_path)
-                            if field_value is not None:
-                                results.add(str(field_value))
-            else:
-                # 简单的路径解析（不含数组）
-                field_value = cls._extract_field_from_object(json_data, path)
-                if field_value is not None:
-                    if isinstance(field_value, list):
-                        results.update(str(item) for item in field_value)
-                    else:
-                        results.add(str(field_value))
-            
-            return list(results)
+            with cls._get_robot_semaphore(robot.pk):
+                return MessagePushService.push_message(template=template, robot=robot, data=data, user=user)
         except Exception as e:
-            logger.error(f"JSON extraction error: {str(e)}")
+            logger.error(f"Distribution push error: {str(e)}")
+            return False, str(e)
+    
+    @classmethod
+    def _push_in_worker(cls, template, robot, data, user):
+        """在工作线程中推送消息"""
+        try:
+            return cls._push_with_robot_limit(template, robot, data, user)
+        finally:
+            # 工作线程结束前释放本线程的数据库连接
+            connections.close_all()
+    
+    @classmethod
+    def push_concurrently(cls, deliveries, max_workers=None):
+        """并发推送多条消息
+        
+        deliveries 为 (template, robot, data, user) 列表，返回与之顺序一致的 (success, error_msg) 列表
+        """
+        if not deliveries:
             return []
+        
+        if max_workers is None:
+            max_workers = getattr(settings, 'DISTRIBUTION_PUSH_CONCURRENCY', 8)
+        max_workers = min(max(max_workers, 1), len(deliveries))
+        
+        # 并发数为1时直接在当前线程中顺序推送
+        if max_workers == 1:
+            return [
+                cls._push_with_robot_limit(template, robot, data, user)
+                for template, robot, data, user in deliveries
+            ]
+        
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='distribution-push') as executor:
+            futures = [
+                executor.submit(cls._push_in_worker, template, robot, data, user)
+                for template, robot, data, user in deliveries
+            ]
+            return [future.result() for future in futures]
     
     @staticmethod
-    def _extract_field_from_object(obj, field_path):
-        """从对象中提取字段值"""
+    def extract_json_values(data, path):
+        """从JSON数据中提取值"""
         try:
-            current = obj
-            for key in field_path.split('.'):
-                if isinstance(current, dict) and key in current:
-                    current = current[key]
-                else:
-                    return None
-            return current
-        except Exception:
-            return None
+            return JsonPath(path).extract(parse_json_data(data))
+        except Exception as e:
+            logger.error(f"JSON extraction error: {str(e)}")
+            return []
     
     @staticmethod
     def extract_string_values(data, pattern):
         """从字符串中提取值"""
-        import re
         try:
-            # 查找所有 {{variable}} 模式
-            variables = re.findall(r'\{\{(\w+)\}\}', pattern)
-            results = []
-            
-            for var in variables:
-                # 构建正则表达式来提取值
-                regex_pattern = pattern.replace(f'{{{{{var}}}}}', r'([^\s]+)')
-                matches = re.findall(regex_pattern, data)
-                results.extend(matches)
-            
-            return list(set(results))  # 去重
+            return StringPattern(pattern).extract(data)
         except Exception as e:
             logger.error(f"String extraction error: {str(e)}")
             return []
     
     @classmethod
-    def process_alert_data(cls, rule, raw_data):
-        """处理告警数据，提取实例信息"""
+    def process_alert_data(cls, rule, raw_data, document=NOT_PARSED):
+        """处理告警数据，提取实例信息
+        
+        raw_data 为原始文本，用于存储和字符串规则；document 为已解析的JSON对象，
+        由调用方解析一次后传给所有规则。
+        提取失败时视为没有匹配的实例；写入告警记录失败时抛出异常，由调用方撤销告警去重登记。
+        """
         try:
-            if rule.type == 'json':
-                extracted_values = cls.extract_json_values(raw_data, rule.extract_path)
-            else:  # string
-                extracted_values = cls.extract_string_values(raw_data, rule.extract_pattern)
-            
-            # 更新或创建实例映射
-            from .models import InstanceMapping
-            from django.utils import timezone
+            # 支持直接传入预编译规则，避免每次请求重新解析提取路径
+            compiled_rule = rule if isinstance(rule, CompiledRule) else CompiledRule(rule)
+            extracted_values = compiled_rule.extract(raw_data, document)
+        except Exception as e:
+            logger.error(f"Alert processing error: {str(e)}")
+            return []
+        
+        if extracted_values:
+            cls.record_alerts(compiled_rule.rule, raw_data, extracted_values)
+        
+        return extracted_values
+    
+    @staticmethod
+    def record_alerts(rule, raw_data, extracted_values):
+        """批量更新实例映射并写入告警记录
+        
+        在一个事务内完成：一次查询解析全部实例、批量创建缺失的实例映射、
+        用 F() 表达式原子地累加告警次数、批量插入告警记录。
+        所有告警记录共用同一份原始数据。
+        """
+        from .models import InstanceMapping, AlertRecord, Payload
+        
+        now = timezone.now()
+        with transaction.atomic():
+            payload = Payload.store(raw_data)
             
-            for value in extracted_values:
-                instance, created = InstanceMapping.objects.get_or_create(
-                    instance_name=value,
-                    defaults={
-                        'source_rule': rule,
-                        'alert_count': 0
-                    }
+            # 批量创建缺失的实例映射，并发写入时忽略唯一约束冲突
+            existing_names = set(InstanceMapping.objects.filter(
+                instance_name__in=extracted_values
+            ).values_list('instance_name', flat=True))
+            missing_names = [value for value in extracted_values if value not in existing_names]
+            if missing_names:
+                InstanceMapping.objects.bulk_create(
+                    [InstanceMapping(instance_name=value, source_rule=rule, alert_count=0) for value in missing_names],
+                    ignore_conflicts=True
                 )
-                
-                # 更新告警统计
-                instance.alert_count += 1
-                instance.last_alert_time = timezone.now()
-                if not instance.source_rule:
-                    instance.source_rule = rule
-                instance.save()
-                
-                # 创建告警记录
-                from .models import AlertRecord
-                AlertRecord.objects.create(
-                    instance_mapping=instance,
+            
+            instances = InstanceMapping.objects.filter(instance_name__in=extracted_values)
+            
+            # 更新告警统计，F() 表达式避免并发请求之间的更新丢失
+            instances.update(
+                alert_count=F('alert_count') + 1,
+                last_alert_time=now,
+                updated_at=now
+            )
+            instances.filter(source_rule__isnull=True).update(source_rule=rule)
+            
+            # 创建告警记录
+            instance_ids = dict(instances.values_list('instance_name', 'id'))
+            AlertRecord.objects.bulk_create([
+                AlertRecord(
+                    instance_mapping_id=instance_ids[value],
                     rule_name=rule.name,
-                    alert_content=raw_data[:1000],  # 限制长度
-                    raw_data=raw_data,
+                    raw_payload=payload,
                     extracted_values=extracted_values
                 )
-            
-            return extracted_values
-        except Exception as e:
-            logger.error(f"Alert processing error: {str(e)}")
-            return []
+                for value in extracted_values if value in instance_ids
+            ])
     
     @classmethod
     def test_rule(cls, rule_type, extract_path, extract_pattern, test_data):
@@ -0,0 +1,46 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Template, Robot, DistributionRule
+from .services import template_cache
+from .rules import rule_registry
+from .stats import StatsService
+from .cache import bump_version, TEMPLATE_VERSION
+from .routing import routing_table
+
+
+@receiver([post_save, post_delete], sender=Template)
+def invalidate_template_cache(sender, instance, **kwargs):
+    """模板修改或删除后清理已编译的模板缓存、模板信息接口的响应缓存和路由表"""
+    template_cache.invalidate(instance.pk)
+    bump_version(TEMPLATE_VERSION.format(instance.pk))
+    routing_table.invalidate_templates()
+
+
+@receiver([post_save, post_delete], sender=Robot)
+def invalidate_robot_cache(sender, instance, **kwargs):
+    """机器人修改或删除后使路由表和依赖机器人列表的响应缓存失效"""
+    routing_table.invalidate_robots()
+
+
+@receiver([post_save, post_delete], sender=DistributionRule)
+def invalidate_rule_registry(sender, instance, **kwargs):
+    """分发规则变化后使已编译的规则集失效"""
+    rule_registry.invalidate()
+
+
+@receiver(post_save, sender=Template)
+@receiver(post_save, sender=Robot)
+def count_created_resource(sender, instance, created, **kwargs):
+    """新建模板或机器人后增加创建者的资源计数"""
+    if created:
+        field = 'template_count' if sender is Template else 'robot_count'
+        StatsService.record_resource(instance.created_by_id, field, 1)
+
+
+@receiver(post_delete, sender=Template)
+@receiver(post_delete, sender=Robot)
+def count_deleted_resource(sender, instance, **kwargs):
+    """删除模板或机器人后减少创建者的资源计数"""
+    field = 'template_count' if sender is Template else 'robot_count'
+    StatsService.record_resource(instance.created_by_id, field, -1)
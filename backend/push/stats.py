@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .cache import bump_version, DASHBOARD_VERSION
+from .models import UserStats, UserDailyStats
+
+
+class StatsService:
+    """仪表盘计数服务
+
+    模板数、机器人数和每日消息数在写入时增量更新，仪表盘统计只读取计数表，
+    耗时与消息日志的数量无关。计数变化时更新用户的仪表盘版本戳，使仪表盘响应缓存失效。
+    """
+
+    @staticmethod
+    def _increment(model, lookup, create=True, **deltas):
+        """按 lookup 累加计数，记录不存在且 create 为真时创建"""
+        updates = {field: F(field) + delta for field, delta in deltas.items()}
+        if model.objects.filter(**lookup).update(**updates) or not create:
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(**lookup, **deltas)
+        except IntegrityError:
+            # 并发请求已创建该记录
+            model.objects.filter(**lookup).update(**updates)
+
+    @classmethod
+    def record_message(cls, message_log):
+        """消息发送完成后累加当天的成功或失败数"""
+        if message_log.created_by_id is None:
+            return
+        created_at = message_log.created_at or timezone.now()
+        cls._increment(
+            UserDailyStats,
+            {'user_id': message_log.created_by_id, 'date': timezone.localdate(created_at)},
+            **{'success_count' if message_log.status else 'fail_count': 1}
+        )
+        bump_version(DASHBOARD_VERSION.format(message_log.created_by_id))
+
+    @classmethod
+    def revert_failures(cls, message_logs):
+        """失败的消息重新发送前扣减对应日期的失败数，重新发送完成后再按结果累加"""
+        counts = Counter(
+            (user_id, timezone.localdate(created_at))
+            for user_id, created_at in message_logs.values_list('created_by_id', 'created_at')
+            if user_id is not None
+        )
+        for (user_id, date), count in counts.items():
+            cls._increment(UserDailyStats, {'user_id': user_id, 'date': date}, create=False, fail_count=-count)
+        for user_id in {user_id for user_id, _ in counts}:
+            bump_version(DASHBOARD_VERSION.format(user_id))
+
+    @classmethod
+    def record_resource(cls, user_id, field, delta):
+        """模板或机器人创建、删除后更新用户的资源计数"""
+        if user_id is None:
+            return
+        # 删除用户时会级联删除其模板和机器人，此时不再创建计数记录
+        cls._increment(UserStats, {'user_id': user_id}, create=delta > 0, **{field: delta})
+        bump_version(DASHBOARD_VERSION.format(user_id))
+
+    @staticmethod
+    def get_monthly_stats(user):
+        """用户本月每日的消息计数"""
+        first_day = timezone.localdate().replace(day=1)
+        return UserDailyStats.objects.filter(user=user, date__gte=first_day)
+
+    @classmethod
+    def get_dashboard_stats(cls, user):
+        """仪表盘统计数据"""
+        stats = UserStats.objects.filter(user=user).values('template_count', 'robot_count').first() or {}
+        monthly = cls.get_monthly_stats(user).aggregate(
+            success=Sum('success_count'), fail=Sum('fail_count')
+        )
+        return {
+            "template_count": stats.get('template_count', 0),
+            "robot_count": stats.get('robot_count', 0),
+            "current_month_messages": (monthly['success'] or 0) + (monthly['fail'] or 0)
+        }
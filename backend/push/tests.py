@@ -1,3 +1,1390 @@
-from django.test import TestCase
+import datetime
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import requests
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    Template, Robot, MessageLog, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel, Payload,
+    MessageLogDailyRollup, UserDailyStats, DeliveryAttempt, DeadLetter
+)
+from .cache import store_captcha
+from .breaker import CircuitBreaker, CircuitOpenError, circuit_breaker
+from .cache_backends import StatsFileBasedCache, cache_stats
+from .dedup import AlertDeduplicator, alert_deduplicator
+from .delivery import delivery_queue
+from .fields import CompressedTextField
+from .ratelimit import RateLimitExceeded, rate_limiter
+from .retention import RetentionService
+from .retry import DeferredError, RetryableError, RetryScheduled, retry_policy
+from .routing import routing_table
+from .rules import CompiledRule, JsonPath, parse_alert_document, parse_json_data, rule_registry
+from .services import DistributionService, MessagePushService, TemplateCache, template_cache
+from .transport import WebhookSessionPool
+
+
+class PushTestCase(TestCase):
+    """测试基类：已登录的用户、一条分发规则，以及创建分发通道和消息日志的辅助方法"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.rule = DistributionRule.objects.create(name='实例规则', type='json', extract_path='alerts[].labels.instance')
+
+    def create_channel(self, index):
+        robot = Robot.objects.create(
+            name=f'机器人{index}',
+            webhook_url=f'https://example.com/robot/{index}',
+            robot_type='wechat',
+            created_by=self.user
+        )
+        template = Template.objects.create(
+            name=f'模板{index}',
+            content='{{ instance_name }}',
+            robot_type='wechat',
+            created_by=self.user
+        )
+        return DistributionChannel.objects.create(
+            name=f'通道{index}', robot=robot, template=template, created_by=self.user
+        )
+
+    def create_logs(self, count):
+        channel = DistributionChannel.objects.first() or self.create_channel(0)
+        for _ in range(MessageLog.objects.count(), count):
+            MessageLog.objects.create(
+                template=channel.template,
+                robot=channel.robot,
+                content='{}',
+                raw_data='{}',
+                formatted_content='消息',
+                status=True,
+                created_by=self.user
+            )
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class QueryBudgetTestCase(PushTestCase):
+    """列表接口查询次数测试的基类
+
+    分别在少量和较多数据下请求同一接口，要求查询次数相同且不超过预算。
+    """
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()
+
+    def assertQueryBudget(self, url, create_objects, budget):
+        """数据量从2条增加到8条时，查询次数保持为 budget（不使用响应缓存）"""
+        create_objects(2)
+        cache.clear()
+        small_count, _ = self.count_queries(url)
+        create_objects(8)
+        cache.clear()
+        large_count, data = self.count_queries(url)
+
+        self.assertEqual(small_count, large_count, f'{url} 的查询次数随数据量增长')
+        self.assertEqual(large_count, budget, f'{url} 的查询次数超出预算')
+        return data
+
+
+class InstanceMappingListQueryTests(QueryBudgetTestCase):
+    """实例映射列表接口的查询次数不随实例数量增长"""
+
+    def setUp(self):
+        super().setUp()
+        self.channels = [self.create_channel(index) for index in range(3)]
+
+    def create_instances(self, count):
+        for index in range(InstanceMapping.objects.count(), count):
+            instance = InstanceMapping.objects.create(instance_name=f'node-{index}', source_rule=self.rule)
+            instance.distribution_channels.set(self.channels)
+
+    def test_query_count_is_constant(self):
+        # 分页计数、实例列表（含来源规则）、分发通道（含机器人）
+        data = self.assertQueryBudget('/api/distribution/instances/', self.create_instances, 3)
+        self.assertEqual(data['count'], 8)
+
+    def test_list_payload(self):
+        self.create_instances(1)
+        item = self.get_json('/api/distribution/instances/')['results'][0]
+
+        self.assertEqual(item['source_rule_name'], '实例规则')
+        self.assertEqual(item['channel_count'], 3)
+        self.assertEqual(item['robot_count'], 3)
+        self.assertEqual(sorted(item['channel_ids']), sorted(channel.id for channel in self.channels))
+        self.assertEqual(sorted(item['robot_ids']), sorted(channel.robot_id for channel in self.channels))
+        self.assertEqual(sorted(item['robot_names']), ['机器人0', '机器人1', '机器人2'])
+
+
+class ListEndpointQueryBudgetTests(QueryBudgetTestCase):
+    """各列表接口的查询次数不随分页大小增长"""
+
+    def create_channels(self, count):
+        for index in range(DistributionChannel.objects.count(), count):
+            self.create_channel(index)
+
+    def create_rules(self, count):
+        for index in range(DistributionRule.objects.count(), count):
+            DistributionRule.objects.create(name=f'规则{index}', type='json', extract_path='alerts[].labels.instance')
+
+    def test_templates(self):
+        # 分页计数、模板列表（含创建者）
+        self.assertQueryBudget('/api/templates/', self.create_channels, 2)
+
+    def test_robots(self):
+        self.assertQueryBudget('/api/robots/', self.create_channels, 2)
+
+    def test_channels(self):
+        # 分页计数、分发通道列表（含机器人、模板、创建者）
+        self.assertQueryBudget('/api/distribution/channels/', self.create_channels, 2)
+
+    def test_message_logs(self):
+        # 分页计数、消息日志列表（含模板、机器人、创建者）
+        data = self.assertQueryBudget('/api/logs/', self.create_logs, 2)
+        self.assertEqual(data['results'][0]['template_name'], '模板0')
+        self.assertEqual(data['results'][0]['robot_name'], '机器人0')
+        self.assertEqual(data['results'][0]['created_by_username'], 'tester')
+
+    def test_rules(self):
+        self.assertQueryBudget('/api/distribution/rules/', self.create_rules, 2)
+
+    def test_dashboard_recent_logs(self):
+        self.assertQueryBudget('/api/dashboard/recent-logs/', self.create_logs, 1)
+
+    def test_instance_alerts(self):
+        instance = InstanceMapping.objects.create(instance_name='node-0', source_rule=self.rule)
+        instance.distribution_channels.set([self.create_channel(0)])
+
+        def create_alerts(count):
+            for _ in range(AlertRecord.objects.count(), count):
+                AlertRecord.objects.create(
+                    instance_mapping=instance, rule_name='实例规则', raw_data='{}'
+                )
+
+        # 获取实例及其分发通道、告警记录（含实例）
+        self.assertQueryBudget(f'/api/distribution/instances/{instance.pk}/alerts/', create_alerts, 3)
+
+
+class MessageLogPaginationTests(QueryBudgetTestCase):
+    """消息日志列表的游标分页与摘要字段"""
+
+    def test_list_omits_payload_fields(self):
+        self.create_logs(1)
+        data = self.get_json('/api/logs/')
+        item = data['results'][0]
+        for field in ('content', 'raw_data', 'formatted_content'):
+            self.assertNotIn(field, item)
+
+        detail = self.get_json(f"/api/logs/{item['id']}/")
+        self.assertEqual(detail['formatted_content'], '消息')
+        self.assertEqual(detail['raw_data'], '{}')
+
+    def test_cursor_pagination(self):
+        self.create_logs(25)
+        # 所有日志的创建时间相同，依靠 id 保证翻页不重复不遗漏
+        MessageLog.objects.update(created_at=timezone.now())
+
+        seen = []
+        url = '/api/logs/?pagination=cursor&size=10'
+        while url:
+            query_count, data = self.count_queries(url)
+            # 游标分页不执行 COUNT(*)
+            self.assertEqual(query_count, 1)
+            self.assertNotIn('count', data)
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+
+        expected = list(MessageLog.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_pagination_query_budget(self):
+        self.assertQueryBudget('/api/logs/?pagination=cursor', self.create_logs, 1)
+
+
+class PayloadStorageTests(PushTestCase):
+    """原始数据按内容去重保存"""
+
+    def test_alert_records_share_payload(self):
+        raw_data = '{"alerts": [{"labels": {"instance": "a"}}, {"labels": {"instance": "b"}}]}'
+        DistributionService.record_alerts(self.rule, raw_data, ['a', 'b'])
+        DistributionService.record_alerts(self.rule, raw_data, ['a'])
+
+        self.assertEqual(AlertRecord.objects.count(), 3)
+        self.assertEqual(Payload.objects.count(), 1)
+        record = AlertRecord.objects.select_related('raw_payload').first()
+        self.assertEqual(record.raw_data, raw_data)
+        self.assertEqual(record.alert_content, raw_data[:1000])
+
+    def test_message_log_content_and_raw_data_share_payload(self):
+        self.create_logs(3)
+
+        self.assertEqual(Payload.objects.count(), 1)
+        log = MessageLog.objects.first()
+        self.assertEqual(log.content_payload_id, log.raw_payload_id)
+
+        data = self.get_json(f'/api/logs/{log.pk}/')
+        self.assertEqual(data['content'], '{}')
+        self.assertEqual(data['raw_data'], '{}')
+
+
+class CompressedTextFieldTests(PushTestCase):
+    """格式化内容超过阈值时压缩保存，读取时透明解压"""
+
+    def stored_value(self, log):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT formatted_content FROM push_messagelog WHERE id = %s', [log.pk])
+            return cursor.fetchone()[0]
+
+    def test_round_trip(self):
+        self.create_logs(1)
+        log = MessageLog.objects.get()
+        large = '## 告警通知\n' + '实例 node-1 状态异常，请及时处理。\n' * 200
+
+        for value in ('短消息', large, 'zlib:以前缀开头的短消息'):
+            log.formatted_content = value
+            log.save()
+            self.assertEqual(MessageLog.objects.get(pk=log.pk).formatted_content, value)
+
+            stored = self.stored_value(log)
+            if value == '短消息':
+                self.assertEqual(stored, value)
+            else:
+                self.assertTrue(stored.startswith(CompressedTextField.PREFIX))
+                self.assertLess(len(stored), max(len(value), 100))
+
+        data = self.get_json(f'/api/logs/{log.pk}/')
+        self.assertEqual(data['formatted_content'], 'zlib:以前缀开头的短消息')
+
+
+class RetentionTests(PushTestCase):
+    """过期数据分批清理，消息日志删除前按天汇总"""
+
+    def test_purge_keeps_dashboard_history(self):
+        self.create_logs(5)
+        old_time = timezone.now() - datetime.timedelta(days=100)
+        old_ids = list(MessageLog.objects.order_by('id').values_list('id', flat=True)[:3])
+        MessageLog.objects.filter(id__in=old_ids).update(created_at=old_time)
+        MessageLog.objects.filter(id=old_ids[0]).update(status=False)
+        old_date = timezone.localdate(old_time).isoformat()
+        url = f'/api/dashboard/charts/?time_range=custom&start_date={old_date}&end_date={old_date}'
+        before = self.get_json(url)
+
+        purged = RetentionService.purge_message_logs(days=90, batch_size=2)
+
+        self.assertEqual(purged, 3)
+        self.assertEqual(MessageLog.objects.count(), 2)
+        self.assertEqual(MessageLogDailyRollup.objects.aggregate(total=Sum('count'))['total'], 3)
+        cache.clear()
+        after = self.get_json(url)
+        self.assertEqual(after['trend_data'], before['trend_data'])
+        self.assertEqual(after['trend_data']['series'][0]['data'], [2])
+        self.assertEqual(after['trend_data']['series'][1]['data'], [1])
+
+    def test_refresh_purges_alerts_and_orphan_payloads(self):
+        DistributionService.record_alerts(self.rule, '{"old": true}', ['node-1'])
+        DistributionService.record_alerts(self.rule, '{"new": true}', ['node-1'])
+        AlertRecord.objects.filter(raw_payload__digest=Payload.compute_digest('{"old": true}')).update(
+            alert_time=timezone.now() - datetime.timedelta(days=40)
+        )
+        Payload.objects.update(
+            created_at=timezone.now() - datetime.timedelta(days=40), last_used_at=timezone.now() - datetime.timedelta(days=40)
+        )
+
+        response = self.client.post('/api/distribution/refresh-instances/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['purged']['alert_records'], 1)
+        self.assertEqual(response.data['purged']['payloads'], 1)
+        self.assertEqual(AlertRecord.objects.get().raw_data, '{"new": true}')
+        self.assertEqual(InstanceMapping.objects.get().alert_count, 2)
+
+    def test_recent_orphan_payloads_are_kept(self):
+        # 刚写入、尚未被引用的原始数据在宽限期内不清理
+        Payload.store('{"pending": true}')
+        Payload.store('{"stale": true}')
+        Payload.objects.filter(digest=Payload.compute_digest('{"stale": true}')).update(
+            created_at=timezone.now() - datetime.timedelta(hours=2), last_used_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+
+        self.assertEqual(RetentionService.purge_orphan_payloads(), 1)
+        self.assertEqual(list(Payload.objects.values_list('digest', flat=True)), [Payload.compute_digest('{"pending": true}')])
+
+    def test_payload_referenced_during_purge_is_kept(self):
+        payload = Payload.store('{"reused": true}')
+        Payload.objects.update(
+            created_at=timezone.now() - datetime.timedelta(hours=2), last_used_at=timezone.now() - datetime.timedelta(hours=2)
+        )
+
+        def reference(ids):
+            # 选出待删除的数据后，另一个请求写入了引用相同内容的告警记录
+            DistributionService.record_alerts(self.rule, '{"reused": true}', ['node-1'])
+
+        self.assertEqual(RetentionService.delete_in_batches(RetentionService.orphan_payloads(), 10, reference), 0)
+        self.assertTrue(Payload.objects.filter(pk=payload.pk).exists())
+
+    def test_reused_old_payload_is_kept(self):
+        payload = Payload.store('{"reused": true}')
+        old = timezone.now() - datetime.timedelta(hours=2)
+        Payload.objects.update(created_at=old, last_used_at=old)
+
+        # 复用很久以前写入的内容，在写入引用它的记录之前不会被清理
+        self.assertEqual(Payload.store('{"reused": true}').pk, payload.pk)
+        self.assertEqual(RetentionService.purge_orphan_payloads(), 0)
+        payload.refresh_from_db()
+        self.assertEqual(payload.created_at, old)
+        self.assertGreater(payload.last_used_at, old)
+
+        # 更新间隔内再次复用不写数据库
+        with CaptureQueriesContext(connection) as context:
+            Payload.store('{"reused": true}')
+        self.assertEqual(len(context.captured_queries), 1)
+
+
+class DashboardStatsTests(QueryBudgetTestCase):
+    """仪表盘统计读取增量维护的计数"""
+
+    def test_counters_follow_writes(self):
+        channel = self.create_channel(0)
+        self.create_channel(1).template.delete()
+        with mock.patch.object(MessagePushService, 'send_to_robot', side_effect=[(True, None), (False, '发送失败')]):
+            MessagePushService.push_message(channel.template, channel.robot, {'instance_name': 'a'}, user=self.user)
+            MessagePushService.push_message(channel.template, channel.robot, {'instance_name': 'b'}, user=self.user)
+
+        query_count, data = self.count_queries('/api/dashboard/stats/')
+        self.assertEqual(query_count, 2)
+        self.assertEqual(data, {'template_count': 1, 'robot_count': 2, 'current_month_messages': 2})
+        self.assertEqual(UserDailyStats.objects.get().fail_count, 1)
+
+        # 缓存命中时不查询数据库
+        query_count, _ = self.count_queries('/api/dashboard/stats/')
+        self.assertEqual(query_count, 0)
+
+
+class DashboardTrendTests(PushTestCase):
+    """仪表盘趋势图按时间段分组统计发送结果"""
+
+    def trend(self, granularity):
+        today = timezone.localdate().isoformat()
+        data = self.get_json(
+            f'/api/dashboard/charts/?time_range=custom&start_date={today}&end_date={today}&granularity={granularity}'
+        )
+        series = data['trend_data']['series']
+        return sum(series[0]['data']), sum(series[1]['data']), len(data['trend_data']['categories'])
+
+    def test_only_finished_messages_are_counted(self):
+        self.create_logs(5)
+        success, failed, queued, processing, _ = MessageLog.objects.order_by('id')
+        MessageLog.objects.filter(pk=failed.pk).update(status=False)
+        MessageLog.objects.filter(pk=queued.pk).update(status=False, delivery_status='queued')
+        MessageLog.objects.filter(pk=processing.pk).update(status=False, delivery_status='processing')
+        # 已清理日志的日汇总只在按天统计时合并
+        MessageLogDailyRollup.objects.create(
+            date=timezone.localdate(), user=self.user, robot=success.robot, template=success.template, status=False, count=2
+        )
+
+        self.assertEqual(self.trend('day'), (2, 3, 1))
+        self.assertEqual(self.trend('hour'), (2, 1, 24))
+
+
+class ResponseCacheTests(PushTestCase):
+    """模板信息接口的响应缓存与ETag"""
+
+    def test_template_info_etag(self):
+        channel = self.create_channel(0)
+        url = f'/api/templates/{channel.template_id}/info/'
+        client = APIClient()
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(response.json()['variables'], ['instance_name'])
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        # 机器人变化后缓存失效
+        self.create_channel(1)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['matching_robots']), 2)
+
+
+class RoutingTableTests(PushTestCase):
+    """公共推送接口通过路由表解析模板和机器人"""
+
+    def push(self, url):
+        with mock.patch.object(MessagePushService, 'send_to_robot', return_value=(True, None)) as send:
+            with CaptureQueriesContext(connection) as context:
+                response = APIClient().post(url, {'instance_name': 'node-1'}, format='json')
+        lookups = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and ('"push_robot"' in query['sql'] or '"push_template"' in query['sql'])
+        ]
+        return response, send.call_args[0][0] if send.called else None, lookups
+
+    def test_resolve_by_name_and_default(self):
+        channel = self.create_channel(0)
+        named = channel.robot
+        named.english_name = 'ops'
+        named.save()
+        default = self.create_channel(1).robot
+        default.is_default = True
+        default.save()
+        url = f'/api/public/push/{channel.template_id}/'
+
+        routing_table.get_routes()
+        response, robot, lookups = self.push(f'{url}?robot_english_name=ops')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(robot.pk, named.pk)
+        self.assertEqual(lookups, [])
+
+        response, robot, lookups = self.push(url)
+        self.assertEqual(robot.pk, default.pk)
+        self.assertEqual(lookups, [])
+
+        # 机器人变化后路由表重新加载
+        default.is_default = False
+        default.save()
+        response, _, _ = self.push(url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_template_direct_push(self):
+        channel = self.create_channel(0)
+        response, robot, lookups = self.push(f'/api/templates/{channel.template_id}/send/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(robot.pk, channel.robot_id)
+
+        response, _, _ = self.push('/api/templates/999/send/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_changes_without_version_bump_expire(self):
+        channel = self.create_channel(0)
+        url = f'/api/public/push/{channel.template_id}/?robot_english_name=ops'
+        routing_table.get_routes()
+
+        # queryset.update() 不触发信号，路由表在最长使用时间内继续使用旧数据
+        Robot.objects.filter(pk=channel.robot_id).update(english_name='ops')
+        response, _, _ = self.push(url)
+        self.assertEqual(response.status_code, 404)
+
+        with mock.patch('push.routing.time.monotonic', return_value=time.monotonic() + routing_table.max_age + 1):
+            response, robot, _ = self.push(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(robot.pk, channel.robot_id)
+
+    def test_rule_registry_reloads(self):
+        self.assertEqual([rule.name for rule in rule_registry.get_active_rules()], ['实例规则'])
+
+        DistributionRule.objects.update(is_active=False)
+        self.assertEqual(len(rule_registry.get_active_rules()), 1)
+        with mock.patch('push.rules.time.monotonic', return_value=time.monotonic() + rule_registry.max_age + 1):
+            self.assertEqual(rule_registry.get_active_rules(), [])
+
+        # 缓存被清空（或其他进程的缓存中没有版本戳）时立即重新加载
+        DistributionRule.objects.update(is_active=True)
+        cache.clear()
+        self.assertEqual(len(rule_registry.get_active_rules()), 1)
+
+
+class SharedCacheTests(PushTestCase):
+    """验证码和缓存统计使用共享缓存"""
+
+    def test_captcha_is_single_use(self):
+        store_captcha('key', 'abcd')
+        client = APIClient()
+
+        response = client.post('/api/captcha/', {'captcha_key': 'key', 'captcha_input': 'ABCD'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = client.post('/api/captcha/', {'captcha_key': 'key', 'captcha_input': 'abcd'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_metrics_report_cache_stats(self):
+        cache_stats.reset()
+        cache.get('missing')
+        cache.set('present', 1)
+        cache.get('present')
+
+        data = self.get_json('/api/metrics/')
+        stats = data['cache']
+        self.assertIn('hit_rate', stats)
+        self.assertGreaterEqual(stats['hits'], 1)
+        self.assertGreaterEqual(stats['misses'], 1)
+
+
+class FileCacheAtomicTests(TestCase):
+    """文件缓存的 add 和 incr 在并发时保持原子性"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def run_threads(self, target, count=8):
+        # 每个线程使用独立的后端实例，与不同工作进程一样分别读写缓存文件
+        results = []
+        barrier = threading.Barrier(count)
+
+        def run():
+            backend = StatsFileBasedCache(self.location, {})
+            barrier.wait()
+            results.append(target(backend))
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_add_succeeds_once(self):
+        results = self.run_threads(lambda backend: backend.add('lock', 1, 60))
+        self.assertEqual(results.count(True), 1)
+
+    def test_incr_does_not_lose_updates(self):
+        StatsFileBasedCache(self.location, {}).set('counter', 0, None)
+        self.run_threads(lambda backend: [backend.incr('counter') for _ in range(25)])
+
+        backend = StatsFileBasedCache(self.location, {})
+        self.assertEqual(backend.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            backend.incr('missing')
+
+
+class RateLimitTests(PushTestCase):
+    """机器人发送频率限制"""
+
+    def setUp(self):
+        super().setUp()
+        self.channel = self.create_channel(0)
+        self.robot = self.channel.robot
+        self.robot.rate_limit = 2
+        rate_limiter.reset(self.robot.pk)
+        patcher = mock.patch.object(delivery_queue, 'notify')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_short_wait_sleeps(self):
+        with mock.patch.object(rate_limiter, 'max_wait', 120), \
+                mock.patch('push.ratelimit.time.sleep') as sleep, \
+                mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            for _ in range(3):
+                self.assertEqual(MessagePushService.send_to_robot(self.robot, 'hello'), (True, None))
+
+        # 前两条立即发送，第三条等待最早一条发送60秒后再发送
+        self.assertEqual(push.call_count, 3)
+        sleep.assert_called_once()
+        self.assertAlmostEqual(sleep.call_args[0][0], 60, delta=1)
+
+        stats = rate_limiter.stats()[self.robot.pk]
+        self.assertEqual(stats['limit'], 2)
+        self.assertEqual(stats['delayed'], 1)
+        self.assertEqual(stats['available'], 0)
+        self.assertEqual(stats['queued'], 1)
+
+    def test_long_wait_requeues_message(self):
+        with mock.patch('push.ratelimit.time.sleep') as sleep, \
+                mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            outcomes = [
+                MessagePushService.push_message(self.channel.template, self.robot, {'instance_name': 'node-0'})
+                for _ in range(3)
+            ]
+
+        # 第三条不在发送线程中等待，而是重新排队到下一个可用时间，不计入发送次数
+        sleep.assert_not_called()
+        self.assertEqual(push.call_count, 2)
+        self.assertIsInstance(outcomes[2][1], RetryScheduled)
+        message_log = MessageLog.objects.order_by('id').last()
+        self.assertEqual(outcomes[2][1].message_log_id, message_log.pk)
+        self.assertEqual(message_log.delivery_status, 'queued')
+        self.assertEqual(message_log.attempts, 0)
+        self.assertAlmostEqual((message_log.scheduled_at - timezone.now()).total_seconds(), 60, delta=2)
+        self.assertFalse(DeliveryAttempt.objects.filter(message_log=message_log).exists())
+
+        stats = rate_limiter.stats()[self.robot.pk]
+        self.assertEqual((stats['acquired'], stats['deferred'], stats['queued']), (2, 1, 0))
+
+        # 到计划发送时间后由发送队列发送
+        MessageLog.objects.filter(pk=message_log.pk).update(scheduled_at=timezone.now())
+        rate_limiter.reset(self.robot.pk)
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)):
+            delivery_queue.drain()
+        message_log.refresh_from_db()
+        self.assertEqual((message_log.delivery_status, message_log.status, message_log.attempts), ('done', True, 1))
+
+    def test_rate_limited_robot_test_is_rejected(self):
+        self.robot.save()
+        payload = {'robot_id': self.robot.pk, 'content': {}, 'test_mode': True, 'direct_content': 'hello'}
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            for _ in range(2):
+                self.assertEqual(self.client.post('/api/push/', payload, format='json').status_code, 200)
+            response = self.client.post('/api/push/', payload, format='json')
+
+        # 测试消息不能由发送队列重新发送，超过频率限制时拒绝请求并返回可重新发送的时间
+        self.assertEqual(push.call_count, 2)
+        self.assertEqual(response.status_code, 429)
+        self.assertAlmostEqual(int(response['Retry-After']), 60, delta=2)
+        self.assertEqual(MessageLog.objects.count(), 2)
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)):
+            self.assertIsInstance(MessagePushService.test_robot(self.robot, 'hello')[1], DeferredError)
+
+    def test_lock_timeout_does_not_reserve(self):
+        cache.set(f'ratelimit_lock_{self.robot.pk}', 'other', 5)
+        with mock.patch.object(rate_limiter, 'lock_wait', 0), self.assertRaises(RateLimitExceeded):
+            rate_limiter.reserve(self.robot)
+        self.assertEqual(rate_limiter.bucket(self.robot.pk, 2)['available'], 2)
+
+    def test_open_breaker_does_not_consume_token(self):
+        cache.set(f'breaker_state_{circuit_breaker.get_key(self.robot.webhook_url, "https://example.com")}', time.time())
+        with mock.patch.object(MessagePushService, 'push_wechat_message') as push:
+            success, error_msg = MessagePushService.send_to_robot(self.robot, 'hello')
+
+        self.assertFalse(success)
+        self.assertIsInstance(error_msg, RetryableError)
+        push.assert_not_called()
+        self.assertEqual(rate_limiter.bucket(self.robot.pk, 2)['available'], 2)
+
+    def test_robot_type_default_limit(self):
+        robot = Robot.objects.get(pk=self.robot.pk)
+        self.assertEqual(rate_limiter.get_limit(robot), 20)
+        robot.rate_limit = 0
+        self.assertEqual(rate_limiter.reserve(robot), 0.0)
+
+
+class CoalescingTests(PushTestCase):
+    """分发通道的消息合并发送"""
+
+    def setUp(self):
+        super().setUp()
+        self.channel = self.create_channel(0)
+        self.channel.coalesce_window = 30
+        self.channel.coalesce_max_batch = 3
+        self.channel.save()
+        rate_limiter.reset(self.channel.robot.pk)
+
+    def enqueue(self, count, start=0):
+        with mock.patch.object(delivery_queue, 'notify'):
+            for index in range(start, start + count):
+                delivery_queue.enqueue(
+                    self.channel.template, self.channel.robot, {'instance_name': f'实例{index}'},
+                    user=self.user, channel=self.channel
+                )
+
+    def test_flush_when_batch_is_full(self):
+        self.enqueue(2)
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            # 合并窗口未结束
+            self.assertEqual(delivery_queue.drain(), 0)
+            self.enqueue(1, start=2)
+            self.assertEqual(delivery_queue.drain(), 1)
+
+        push.assert_called_once()
+        self.assertEqual(push.call_args[0][1], '实例0\n\n---\n\n实例1\n\n---\n\n实例2')
+        logs = MessageLog.objects.filter(channel=self.channel)
+        self.assertEqual(logs.filter(status=True, delivery_status='done').count(), 3)
+        self.assertEqual(logs.get(formatted_content='实例1').status, True)
+
+    def test_batch_template_and_size_limit(self):
+        self.channel.batch_template = '共{{ count }}条\n{{ messages | join("\n") }}'
+        self.channel.save()
+        self.channel.template.content = '{{ instance_name }}' + '#' * 1500
+        self.channel.template.save()
+        self.enqueue(3)
+        MessageLog.objects.update(scheduled_at=timezone.now())
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            delivery_queue.drain()
+
+        # 三条合并后超过企业微信4096字节的限制，拆分为两条发送
+        sent = [call[0][1] for call in push.call_args_list]
+        self.assertEqual([content.split('\n')[0] for content in sent], ['共2条', '共1条'])
+        self.assertTrue(all(len(content.encode('utf-8')) <= 4096 for content in sent))
+
+    def test_each_message_is_rendered_once(self):
+        self.channel.batch_template = '共{{ count }}条\n{{ messages | join("\n") }}'
+        items = [(None, f'实例{index}' + '#' * 500, {}) for index in range(40)]
+
+        with mock.patch.object(MessagePushService, 'combine_messages', wraps=MessagePushService.combine_messages) as combine:
+            batches = MessagePushService.split_batches(self.channel, self.channel.robot, items)
+
+        # 不含消息的渲染1次、每条消息单独渲染1次、每组合并渲染1次
+        self.assertEqual(combine.call_count, 1 + len(items) + len(batches))
+        self.assertEqual(sum(len(group) for group, _, _ in batches), len(items))
+        self.assertTrue(all(error is None and len(text.encode('utf-8')) <= 4096 for _, text, error in batches))
+
+    def test_oversized_message_is_truncated(self):
+        self.channel.template.content = '{{ instance_name }}' + '#' * 5000
+        self.channel.template.save()
+        self.enqueue(1)
+        MessageLog.objects.update(scheduled_at=timezone.now())
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            delivery_queue.drain()
+
+        sent = push.call_args[0][1]
+        self.assertLessEqual(len(sent.encode('utf-8')), 4096)
+        self.assertTrue(sent.startswith('实例0#'))
+        self.assertTrue(sent.endswith(MessagePushService.TRUNCATED_SUFFIX))
+        self.assertTrue(MessageLog.objects.get().status)
+
+    def test_oversized_batch_template_fails(self):
+        self.channel.batch_template = '#' * 5000 + '{{ messages | join("\n") }}'
+        self.channel.save()
+        self.enqueue(1)
+        MessageLog.objects.update(scheduled_at=timezone.now())
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message') as push:
+            delivery_queue.drain()
+
+        push.assert_not_called()
+        message_log = MessageLog.objects.get()
+        self.assertEqual((message_log.status, message_log.delivery_status), (False, 'done'))
+        self.assertIn('超过平台大小限制', message_log.error_message)
+
+
+    def test_waiting_retries_are_not_flushed(self):
+        self.enqueue(2)
+        later = timezone.now() + datetime.timedelta(minutes=5)
+        retrying = MessageLog.objects.order_by('id').first()
+        MessageLog.objects.filter(pk=retrying.pk).update(attempts=1, claimed_at=timezone.now(), scheduled_at=later)
+        # 加入新消息达到最大合并条数，只有未发送过的消息提前发送
+        self.enqueue(2, start=2)
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            self.assertEqual(delivery_queue.drain(), 1)
+
+        self.assertEqual(push.call_args[0][1], '实例1\n\n---\n\n实例2\n\n---\n\n实例3')
+        retrying.refresh_from_db()
+        self.assertEqual((retrying.delivery_status, retrying.scheduled_at), ('queued', later))
+
+
+class AlertDedupTests(PushTestCase):
+    """分发接口的告警去重"""
+
+    def setUp(self):
+        super().setUp()
+        # 告警去重默认关闭
+        patcher = mock.patch.object(alert_deduplicator, 'window', 300)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def alert(self, status='firing'):
+        return {'alerts': [{
+            'status': status, 'fingerprint': 'abc123', 'labels': {'instance': 'node-0', 'alertname': 'Down'}
+        }]}
+
+    def test_repeated_alert_is_counted_but_not_recorded(self):
+        for _ in range(2):
+            response = self.client.post('/api/distribution/alert/', self.alert(), format='json')
+        self.assertEqual(response.json()['duplicate_count'], 1)
+        self.assertEqual(response.json()['count'], 0)
+        self.assertEqual(AlertRecord.objects.count(), 1)
+        self.assertEqual(InstanceMapping.objects.get(instance_name='node-0').alert_count, 1)
+
+        # 恢复通知不是重复告警
+        response = self.client.post('/api/distribution/alert/', self.alert('resolved'), format='json')
+        self.assertEqual(response.json()['duplicate_count'], 0)
+        self.assertEqual(AlertRecord.objects.count(), 2)
+
+    def test_repeated_push_is_not_delivered(self):
+        channel = self.create_channel(0)
+        InstanceMapping.objects.create(instance_name='node-0', source_rule=self.rule).distribution_channels.add(channel)
+
+        with mock.patch.object(MessagePushService, 'send_to_robot', return_value=(True, None)) as send:
+            first = APIClient().post('/api/public/distribution/push/', self.alert(), format='json').json()
+            second = APIClient().post('/api/public/distribution/push/', self.alert(), format='json').json()
+
+        self.assertEqual(send.call_count, 1)
+        self.assertEqual((first['success_count'], first['duplicate_count']), (1, 0))
+        self.assertEqual((second['success_count'], second['duplicate_count']), (0, 1))
+
+    def test_failed_ingestion_is_not_deduplicated(self):
+        with mock.patch.object(DistributionService, 'record_alerts', side_effect=Exception('数据库不可用')):
+            response = self.client.post('/api/distribution/alert/', self.alert(), format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # 副本重发的同一告警重新处理
+        response = self.client.post('/api/distribution/alert/', self.alert(), format='json')
+        self.assertEqual((response.json()['count'], response.json()['duplicate_count']), (1, 0))
+        self.assertEqual(AlertRecord.objects.count(), 1)
+
+    def test_failed_push_is_not_deduplicated(self):
+        channel = self.create_channel(0)
+        InstanceMapping.objects.create(instance_name='node-0', source_rule=self.rule).distribution_channels.add(channel)
+
+        with mock.patch.object(MessagePushService, 'send_to_robot', side_effect=[(False, '机器人不存在'), (True, None)]):
+            first = APIClient().post('/api/public/distribution/push/', self.alert(), format='json').json()
+            second = APIClient().post('/api/public/distribution/push/', self.alert(), format='json').json()
+
+        self.assertEqual((first['error_count'], first['duplicate_count']), (1, 0))
+        self.assertEqual((second['success_count'], second['duplicate_count']), (1, 0))
+
+    def test_disabled_by_default(self):
+        self.assertEqual(AlertDeduplicator().window, 0)
+
+    def test_text_alert_is_not_deduplicated(self):
+        DistributionRule.objects.create(name='主机规则', type='string', extract_pattern='host={{host}}')
+        response = self.client.post(
+            '/api/distribution/alert/', 'alert host=web-1 down', content_type='text/plain'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['duplicate_count'], 0)
+        self.assertEqual(response.json()['processed_instances'], ['web-1'])
+        self.assertTrue(AlertRecord.objects.filter(instance_mapping__instance_name='web-1').exists())
+
+    def test_partial_duplicate_keeps_unicode(self):
+        self.client.post('/api/distribution/alert/', self.alert(), format='json')
+        document = self.alert()
+        document['alerts'].append({'status': 'firing', 'fingerprint': 'def456', 'labels': {'instance': '数据库-1'}})
+        response = self.client.post('/api/distribution/alert/', document, format='json')
+
+        self.assertEqual(response.json()['duplicate_count'], 1)
+        self.assertEqual(response.json()['processed_instances'], ['数据库-1'])
+        record = AlertRecord.objects.get(instance_mapping__instance_name='数据库-1')
+        self.assertIn('数据库-1', record.raw_data)
+
+
+class DeliveryRetryTests(PushTestCase):
+    """发送失败的重试和死信"""
+
+    def setUp(self):
+        super().setUp()
+        self.channel = self.create_channel(0)
+        rate_limiter.reset(self.channel.robot.pk)
+        patcher = mock.patch.object(delivery_queue, 'notify')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def push(self, *results):
+        with mock.patch.object(MessagePushService, 'push_wechat_message', side_effect=results):
+            outcome = MessagePushService.push_message(
+                self.channel.template, self.channel.robot, {'instance_name': 'node-0'}, user=self.user
+            )
+            # 跳过退避等待，立即处理重试
+            while MessageLog.objects.filter(delivery_status='queued').update(scheduled_at=timezone.now()):
+                delivery_queue.drain()
+        return outcome
+
+    def daily_stats(self):
+        stats = UserDailyStats.objects.get(user=self.user)
+        return stats.success_count, stats.fail_count
+
+    def test_transient_error_is_retried(self):
+        self.assertEqual(self.push((False, RetryableError('超时')), (True, None)), (False, '超时'))
+
+        message_log = MessageLog.objects.get()
+        self.assertTrue(message_log.status)
+        self.assertEqual(message_log.attempts, 2)
+        self.assertEqual(
+            list(DeliveryAttempt.objects.values_list('attempt', 'success', 'retryable')),
+            [(1, False, True), (2, True, False)]
+        )
+        self.assertEqual(self.daily_stats(), (1, 0))
+
+    def test_permanent_error_is_not_retried(self):
+        self.push((False, '机器人不存在'))
+        self.assertEqual(MessageLog.objects.get().attempts, 1)
+        self.assertFalse(DeadLetter.objects.exists())
+
+    def test_requeued_push_is_reported_as_retrying(self):
+        url = f'/api/public/push/{self.channel.template_id}/{self.channel.robot_id}/'
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(False, RetryableError('超时'))):
+            response = APIClient().post(url, {'instance_name': 'node-0'}, format='json')
+
+        # 消息已重新排队，接口不返回发送失败
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual((data['status'], data['error']), ('retrying', '超时'))
+        self.assertEqual(MessageLog.objects.get(pk=data['message_log_id']).delivery_status, 'queued')
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(False, '机器人不存在')):
+            response = APIClient().post(url, {'instance_name': 'node-0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_distribution_push_counts_retrying(self):
+        InstanceMapping.objects.create(instance_name='node-0', source_rule=self.rule).distribution_channels.add(
+            self.channel
+        )
+        document = {'alerts': [{'labels': {'instance': 'node-0'}}]}
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(False, RetryableError('超时'))):
+            data = APIClient().post('/api/public/distribution/push/', document, format='json').json()
+
+        self.assertEqual((data['success_count'], data['error_count'], data['retrying_count']), (0, 0, 1))
+        self.assertEqual(data['results'][0]['status'], 'retrying')
+        self.assertEqual(MessageLog.objects.get(pk=data['results'][0]['message_log_id']).delivery_status, 'queued')
+
+    def test_exhausted_message_is_replayed(self):
+        with mock.patch.dict(retry_policy.max_attempts, {'wechat': 2}):
+            self.push((False, RetryableError('超时')), (False, RetryableError('超时')))
+        dead_letter = DeadLetter.objects.get()
+        self.assertEqual(dead_letter.attempts, 2)
+        self.assertEqual(self.daily_stats(), (0, 1))
+
+        data = self.client.post('/api/dead-letters/replay/', {'ids': [dead_letter.pk]}, format='json').json()
+        self.assertEqual(data['replayed_count'], 1)
+        self.assertFalse(DeadLetter.objects.exists())
+        self.assertEqual(self.daily_stats(), (0, 0))
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)):
+            delivery_queue.drain()
+        self.assertTrue(MessageLog.objects.get().status)
+        self.assertEqual(self.daily_stats(), (1, 0))
+
+
+class CircuitBreakerTests(PushTestCase):
+    """Webhook主机熔断"""
+
+    url = 'https://breaker.example.com/webhook'
+
+    def setUp(self):
+        super().setUp()
+        self.breaker = CircuitBreaker(min_requests=2, open_seconds=30)
+        self.pool = WebhookSessionPool(breaker=self.breaker)
+        self.session = self.pool.get_session(self.pool.get_host(self.url))
+
+    def test_open_fail_fast_and_half_open_probe(self):
+        with mock.patch.object(self.session, 'post', side_effect=requests.ConnectTimeout('超时')) as post:
+            for _ in range(2):
+                with self.assertRaises(requests.ConnectTimeout):
+                    self.pool.post(self.url)
+            # 熔断器打开后不再发送请求
+            with self.assertRaises(CircuitOpenError):
+                self.pool.post(self.url)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(self.breaker.status('https://breaker.example.com')['state'], 'open')
+
+        # 打开时长过后放行一个探测请求，成功则关闭
+        later = time.time() + 31
+        with mock.patch('push.breaker.time.time', return_value=later), \
+                mock.patch.object(self.session, 'post', return_value=mock.Mock(status_code=200)):
+            self.pool.post(self.url)
+            self.assertEqual(self.breaker.status('https://breaker.example.com')['state'], 'closed')
+
+    def test_open_breaker_sends_message_to_retry_queue(self):
+        with mock.patch.object(self.session, 'post', side_effect=requests.ConnectTimeout('超时')), \
+                mock.patch('push.services.webhook_pool', self.pool):
+            results = [MessagePushService.push_wechat_message(self.url, 'hello') for _ in range(3)]
+        self.assertTrue(all(isinstance(error, RetryableError) for _, error in results))
+        self.assertIn('熔断', results[-1][1])
+
+    def test_api_lists_and_resets_breakers(self):
+        robot = self.create_channel(0).robot
+        key = 'https://example.com'
+        circuit_breaker._open(key)
+
+        # 熔断器由机器人的Webhook地址得出，未在本进程发送过请求的熔断器同样列出
+        data = self.get_json('/api/circuit-breakers/')
+        self.assertEqual([(item['key'], item['state']) for item in data['breakers']], [(key, 'open')])
+
+        response = self.client.post('/api/circuit-breakers/', {'key': key}, format='json')
+        self.assertEqual(response.json()['reset'], [key])
+        self.assertEqual(circuit_breaker.status(key)['state'], 'closed')
+
+        # 按Webhook地址熔断时每个机器人一个熔断器
+        with mock.patch.object(circuit_breaker, 'scope', 'url'):
+            self.assertEqual(circuit_breaker.get_keys(), [circuit_breaker.get_key(robot.webhook_url, key)])
+
+
+class JsonPathTests(SimpleTestCase):
+    """预编译JSON提取路径的语法"""
+
+    document = {
+        'alerts': [
+            {'status': 'firing', 'silenced': True, 'code': 500, 'labels': {'instance': 'node-0', 'severity': 'critical'},
+             'targets': [{'host': 'a'}, {'host': 'b'}]},
+            {'status': 'firing', 'silenced': False, 'code': '500', 'labels': {'instance': 'node-1', 'severity': 'info'},
+             'targets': [{'host': 'b'}, {'host': 'c'}]},
+            {'status': 'resolved', 'silenced': 1, 'code': 404, 'labels': {'instance': 'node-2'}, 'targets': []},
+        ],
+        'tags': ['x', 'y'],
+    }
+
+    def extract(self, path):
+        return JsonPath(path).extract(self.document)
+
+    def test_wildcards_and_nested_arrays(self):
+        self.assertEqual(self.extract('alerts[].labels.instance'), ['node-0', 'node-1', 'node-2'])
+        self.assertEqual(self.extract('$.alerts[*].labels.instance'), ['node-0', 'node-1', 'node-2'])
+        # 结果按文档顺序去重
+        self.assertEqual(self.extract('alerts[].targets[].host'), ['a', 'b', 'c'])
+        # 末端为数组时展开数组元素
+        self.assertEqual(self.extract('tags'), ['x', 'y'])
+        self.assertEqual(self.extract('alerts[].labels.missing'), [])
+
+    def test_indexes(self):
+        self.assertEqual(self.extract('alerts[0].labels.instance'), ['node-0'])
+        self.assertEqual(self.extract('alerts[-1].labels.instance'), ['node-2'])
+        self.assertEqual(self.extract('alerts[0].targets[-1].host'), ['b'])
+        self.assertEqual(self.extract('alerts[5].labels.instance'), [])
+
+    def test_string_filters(self):
+        self.assertEqual(self.extract('alerts[?status==firing].labels.instance'), ['node-0', 'node-1'])
+        self.assertEqual(self.extract("alerts[?(@.labels.severity!='info')].labels.instance"), ['node-0', 'node-2'])
+        self.assertEqual(self.extract('alerts[?labels.severity=="critical"].targets[].host'), ['a', 'b'])
+
+    def test_typed_filters(self):
+        # 布尔值只与布尔值相等，1 不匹配 true
+        self.assertEqual(self.extract('alerts[?silenced==true].labels.instance'), ['node-0'])
+        self.assertEqual(self.extract('alerts[?silenced==false].labels.instance'), ['node-1'])
+        # 未加引号的数字只匹配数字，加引号后只匹配字符串
+        self.assertEqual(self.extract('alerts[?code==500].labels.instance'), ['node-0'])
+        self.assertEqual(self.extract("alerts[?code=='500'].labels.instance"), ['node-1'])
+        self.assertEqual(self.extract('alerts[?code!=500].labels.instance'), ['node-1', 'node-2'])
+
+    def test_invalid_path(self):
+        for path in ('', 'alerts[', 'alerts[?status]'):
+            with self.assertRaises(ValueError):
+                JsonPath(path)
+
+
+
+class AsyncDeliveryTests(PushTestCase):
+    """异步发送队列"""
+
+    def setUp(self):
+        super().setUp()
+        self.channel = self.create_channel(0)
+        rate_limiter.reset(self.channel.robot.pk)
+        patcher = mock.patch.object(delivery_queue, 'notify')
+        self.notify = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_async_push_is_queued(self):
+        url = f'/api/public/push/{self.channel.template_id}/{self.channel.robot_id}/?async=true'
+        with mock.patch.object(MessagePushService, 'send_to_robot') as send:
+            response = APIClient().post(url, {'instance_name': 'node-0'}, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        send.assert_not_called()
+        self.notify.assert_called_once()
+        message_log = MessageLog.objects.get(pk=response.json()['message_log_id'])
+        self.assertEqual(message_log.delivery_status, 'queued')
+
+        with mock.patch.object(MessagePushService, 'push_wechat_message', return_value=(True, None)) as push:
+            self.assertEqual(delivery_queue.drain(), 1)
+        self.assertEqual(push.call_args[0][1], 'node-0')
+        message_log.refresh_from_db()
+        self.assertEqual((message_log.delivery_status, message_log.status), ('done', True))
+        self.assertIsNotNone(message_log.claimed_at)
+
+    def test_requeue_only_stale_claimed_messages(self):
+        now = timezone.now()
+        for _ in range(3):
+            delivery_queue.enqueue(self.channel.template, self.channel.robot, {}, user=self.user)
+        sync_log = MessagePushService.create_message_log(self.channel.template, self.channel.robot, {}, user=self.user)
+        stale, running, recent = MessageLog.objects.filter(delivery_status='queued').order_by('id')
+        MessageLog.objects.filter(pk=stale.pk).update(
+            delivery_status='processing', claimed_at=now - datetime.timedelta(seconds=delivery_queue.stale_after + 1)
+        )
+        MessageLog.objects.filter(pk=running.pk).update(delivery_status='processing', claimed_at=now)
+        MessageLog.objects.filter(pk=sync_log.pk).update(created_at=now - datetime.timedelta(days=1))
+
+        # 只有认领超时的消息重新排队，其他工作进程正在发送的消息和同步发送的消息不受影响
+        self.assertEqual(delivery_queue.requeue_stale(), 1)
+        self.assertEqual(
+            dict(MessageLog.objects.values_list('pk', 'delivery_status')),
+            {stale.pk: 'queued', running.pk: 'processing', recent.pk: 'queued', sync_log.pk: 'processing'}
+        )
+
+    def test_retention_fails_stuck_sync_messages(self):
+        stuck = MessagePushService.create_message_log(self.channel.template, self.channel.robot, {}, user=self.user)
+        in_flight = MessagePushService.create_message_log(self.channel.template, self.channel.robot, {}, user=self.user)
+        MessageLog.objects.filter(pk=stuck.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+
+        self.assertEqual(RetentionService.run()['stuck_message_logs'], 1)
+        stuck.refresh_from_db()
+        in_flight.refresh_from_db()
+        self.assertEqual((stuck.delivery_status, stuck.status, stuck.error_message), ('done', False, '发送中断'))
+        self.assertEqual(in_flight.delivery_status, 'processing')
+        self.assertEqual(UserDailyStats.objects.get(user=self.user).fail_count, 1)
+
+    def test_async_distribution_push(self):
+        InstanceMapping.objects.create(instance_name='node-0', source_rule=self.rule).distribution_channels.add(self.channel)
+        document = {'alerts': [{'labels': {'instance': 'node-0'}}]}
+        with mock.patch.object(MessagePushService, 'send_to_robot') as send:
+            response = APIClient().post('/api/public/distribution/push/?async=true', document, format='json')
+
+        self.assertEqual(response.status_code, 202)
+        send.assert_not_called()
+        data = response.json()
+        self.assertEqual(data['queued_count'], 1)
+        self.assertEqual(data['results'][0]['status'], 'queued')
+        self.assertEqual(MessageLog.objects.get(pk=data['results'][0]['message_log_id']).delivery_status, 'queued')
+
+
+class TemplateCacheTests(PushTestCase):
+    """已编译jinja2模板的缓存"""
+
+    def test_compiled_template_is_reused(self):
+        templates = TemplateCache(max_size=2)
+        with mock.patch('push.services.template_cache', templates):
+            for name in ('a', 'b'):
+                self.assertEqual(MessagePushService.format_message('你好 {{ name }}', {'name': name}, 1), (f'你好 {name}', None))
+            # 模板内容变化后不会命中旧的编译结果
+            self.assertEqual(MessagePushService.format_message('再见 {{ name }}', {'name': 'c'}, 1), ('再见 c', None))
+            # 超过容量时淘汰最久未使用的模板
+            MessagePushService.format_message('{{ name }}', {'name': 'd'}, 2)
+
+        stats = templates.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (1, 3, 1, 2))
+
+    def test_syntax_error_is_returned(self):
+        content, error = MessagePushService.format_message('{{ name', {'name': 'a'})
+        self.assertIsNone(content)
+        self.assertTrue(error)
+
+    def test_template_change_invalidates_cache(self):
+        template = self.create_channel(0).template
+        MessagePushService.format_message(template.content, {'instance_name': 'a'}, template.pk)
+        self.assertIn(TemplateCache.make_key(template.content, template.pk), template_cache._templates)
+
+        template.content = '实例 {{ instance_name }}'
+        template.save()
+        self.assertFalse(any(key[0] == template.pk for key in template_cache._templates))
+        self.assertEqual(
+            MessagePushService.format_message(template.content, {'instance_name': 'a'}, template.pk), ('实例 a', None)
+        )
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """返回企业微信格式成功响应的本地Webhook，保持长连接"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'errcode': 0, 'errmsg': 'ok'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookSessionPoolTests(SimpleTestCase):
+    """Webhook请求复用按主机维护的长连接"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/webhook'
+        self.pool = WebhookSessionPool(connect_timeout=2, read_timeout=5)
+        self.addCleanup(self.pool.close)
+
+    def test_connections_are_reused(self):
+        with mock.patch('push.services.webhook_pool', self.pool):
+            for _ in range(3):
+                self.assertEqual(MessagePushService.push_wechat_message(self.url, 'hello'), (True, None))
+
+        stats = self.pool.stats()[self.pool.get_host(self.url)]
+        self.assertEqual((stats['requests'], stats['errors']), (3, 0))
+        self.assertEqual((stats['new_connections'], stats['reused_connections']), (1, 2))
+        self.assertIsNotNone(self.pool.pop_latency())
+        self.assertIsNone(self.pool.pop_latency())
+
+    def test_session_per_host_and_default_timeout(self):
+        host = self.pool.get_host(self.url)
+        self.assertIs(self.pool.get_session(host), self.pool.get_session(host))
+        self.assertIsNot(self.pool.get_session(host), self.pool.get_session('https://example.com'))
+
+        with mock.patch.object(self.pool.get_session(host), 'post', return_value=mock.Mock(status_code=200)) as post:
+            self.pool.post(self.url, data='{}')
+        self.assertEqual(post.call_args.kwargs['timeout'], (2, 5))
+
+
+@override_settings(DISTRIBUTION_ROBOT_CONCURRENCY=2)
+class ConcurrentPushTests(SimpleTestCase):
+    """分发推送并发发送，单个机器人的并发数受限"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(DistributionService._robot_semaphores, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def fake_push(self, template, robot, data, user=None):
+        with self.lock:
+            self.active[robot.pk] = self.active.get(robot.pk, 0) + 1
+            self.active['all'] = self.active.get('all', 0) + 1
+            for key in (robot.pk, 'all'):
+                self.peak[key] = max(self.peak.get(key, 0), self.active[key])
+        time.sleep(0.05)
+        with self.lock:
+            self.active[robot.pk] -= 1
+            self.active['all'] -= 1
+        return True, data['index']
+
+    def test_results_keep_order_and_robot_limit(self):
+        robots = [mock.Mock(pk=1), mock.Mock(pk=2), mock.Mock(pk=3)]
+        deliveries = [(None, robots[index % 3], {'index': index}, None) for index in range(9)]
+
+        with mock.patch.object(MessagePushService, 'push_message', side_effect=self.fake_push):
+            results = DistributionService.push_concurrently(deliveries, max_workers=9)
+
+        self.assertEqual(results, [(True, index) for index in range(9)])
+        # 不同机器人之间并发发送，同一机器人最多同时发送2条
+        self.assertGreater(self.peak['all'], 2)
+        self.assertTrue(all(self.peak[robot.pk] <= 2 for robot in robots))
+
+    def test_failed_delivery_does_not_affect_others(self):
+        def push(template, robot, data, user=None):
+            if data['index'] == 1:
+                raise RuntimeError('连接失败')
+            return True, None
+
+        deliveries = [(None, mock.Mock(pk=index), {'index': index}, None) for index in range(3)]
+        # 并发推送和并发数为1时的顺序推送结果相同
+        for max_workers in (3, 1):
+            with self.subTest(max_workers=max_workers), \
+                    mock.patch.object(MessagePushService, 'push_message', side_effect=push):
+                results = DistributionService.push_concurrently(deliveries, max_workers=max_workers)
+                self.assertEqual(results, [(True, None), (False, '连接失败'), (True, None)])
+
+    def test_serial_push_uses_robot_limit(self):
+        deliveries = [(None, mock.Mock(pk=1), {'index': 0}, None)]
+        with mock.patch.object(MessagePushService, 'push_message', return_value=(True, None)):
+            self.assertEqual(DistributionService.push_concurrently(deliveries, max_workers=1), [(True, None)])
+        self.assertIn(1, DistributionService._robot_semaphores)
+
+
+class AlertIngestionTests(PushTestCase):
+    """告警数据批量写入实例映射和告警记录"""
+
+    def ingest(self, names):
+        document = {'alerts': [{'labels': {'instance': name}} for name in names]}
+        with CaptureQueriesContext(connection) as context:
+            extracted = DistributionService.process_alert_data(self.rule, json.dumps(document), document)
+        return extracted, len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_instances(self):
+        _, small_count = self.ingest([f'small-{index}' for index in range(2)])
+        _, large_count = self.ingest([f'large-{index}' for index in range(20)])
+        self.assertEqual(small_count, large_count)
+
+    def test_counts_and_records(self):
+        InstanceMapping.objects.create(instance_name='node-0', alert_count=5)
+
+        extracted, _ = self.ingest(['node-0', 'node-1', 'node-0'])
+
+        self.assertEqual(extracted, ['node-0', 'node-1'])
+        counts = dict(InstanceMapping.objects.values_list('instance_name', 'alert_count'))
+        self.assertEqual(counts, {'node-0': 6, 'node-1': 1})
+        # 没有来源规则的实例记录本次规则
+        self.assertEqual(set(InstanceMapping.objects.values_list('source_rule', flat=True)), {self.rule.pk})
+        self.assertEqual(AlertRecord.objects.count(), 2)
+        # 所有告警记录共用同一份原始数据
+        self.assertEqual(Payload.objects.count(), 1)
+        self.assertEqual(set(AlertRecord.objects.values_list('raw_payload', flat=True)), {Payload.objects.get().pk})
+
+
+class CompiledRuleTests(PushTestCase):
+    """预编译的分发规则和启用规则缓存"""
+
+    def test_extract(self):
+        string_rule = DistributionRule(name='主机', type='string', extract_pattern='host={{host}}')
+        self.assertEqual(CompiledRule(string_rule).extract('host=web-1 down, host=web-2 down, host=web-1'), [
+            'web-1', 'web-2'
+        ])
+        json_rule = CompiledRule(self.rule)
+        self.assertEqual(json_rule.extract('{"alerts": [{"labels": {"instance": "node-0"}}]}'), ['node-0'])
+        # 已解析的文档直接使用，不再解析原始文本
+        self.assertEqual(json_rule.extract('不是JSON', {'alerts': [{'labels': {'instance': 'node-1'}}]}), ['node-1'])
+
+    def test_invalid_rule_matches_nothing(self):
+        rule = CompiledRule(DistributionRule(name='错误', type='json', extract_path='alerts[?'))
+        self.assertIsNone(rule.matcher)
+        self.assertEqual(rule.extract('{"alerts": []}'), [])
+
+    def test_registry_is_rebuilt_only_after_changes(self):
+        DistributionRule.objects.create(name='停用规则', type='json', extract_path='labels.instance', is_active=False)
+        rules = rule_registry.get_active_rules()
+        self.assertEqual([rule.name for rule in rules], ['实例规则'])
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertIs(rule_registry.get_active_rules(), rules)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        self.rule.extract_path = 'alerts[].labels.host'
+        self.rule.save()
+        rules = rule_registry.get_active_rules()
+        self.assertEqual(rules[0].matcher.path, 'alerts[].labels.host')
+
+
+class SingleParseTests(PushTestCase):
+    """同一条告警数据只解析一次，所有JSON规则共用解析结果"""
+
+    def test_alert_is_parsed_once(self):
+        DistributionRule.objects.create(name='主机规则', type='json', extract_path='alerts[].labels.host')
+        DistributionRule.objects.create(name='服务规则', type='json', extract_path='alerts[].labels.service')
+        DistributionRule.objects.create(name='文本规则', type='string', extract_pattern='host={{host}}')
+        document = {'alerts': [{'labels': {'instance': 'node-0', 'host': 'web-1', 'service': 'api'}}]}
+
+        with mock.patch('push.rules.parse_json_data', wraps=parse_json_data) as parse:
+            response = self.client.post('/api/distribution/alert/', document, format='json')
+
+        self.assertEqual(parse.call_count, 1)
+        self.assertEqual(sorted(response.json()['processed_instances']), ['api', 'node-0', 'web-1'])
+
+    def test_escaped_payload(self):
+        # 被转义过的JSON文本同样可以解析
+        self.assertEqual(parse_json_data('{\\"status\\": \\"firing\\"}'), {'status': 'firing'})
+        self.assertIsNone(parse_alert_document('alert host=web-1 down'))
+
+
+
+class HotQueryIndexTests(PushTestCase):
+    """热点查询使用索引，不出现全表扫描"""
+
+    def test_indexes_exist(self):
+        with connection.cursor() as cursor:
+            names = {
+                name
+                for table in ('push_messagelog', 'push_alertrecord', 'push_distributionrule', 'push_robot')
+                for name in connection.introspection.get_constraints(cursor, table)
+            }
+        for name in ('messagelog_user_created_idx', 'alertrecord_instance_time_idx', 'rule_active_idx',
+                     'robot_user_created_idx', 'robot_type_user_idx', 'robot_user_default_idx',
+                     'robot_default_idx'):
+            self.assertIn(name, names)
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('执行计划的检查只适用于 SQLite')
+        output = StringIO()
+        call_command('explain_hot_queries', user=self.user.pk, fail_on_scan=True, stdout=output)
+        self.assertIn('所有热点查询均使用了索引', output.getvalue())
+        # 检查的是视图实际执行的查询
+        self.assertIn('ORDER BY "push_messagelog"."created_at" DESC, "push_messagelog"."id" DESC', output.getvalue())
+        self.assertIn('push_userdailystats', output.getvalue())
@@ -0,0 +1,157 @@
+import time
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .breaker import circuit_breaker
+
+
+class WebhookSessionPool:
+    """Webhook HTTP连接池
+
+    按目标主机维护长连接会话，企业微信、飞书、钉钉三类机器人共用，
+    复用TCP/TLS连接，避免每条消息都重新进行DNS解析和握手。
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=3, read_timeout=10, breaker=None):
+        self.pool_size = pool_size
+        self.breaker = breaker
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._sessions = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def get_host(url):
+        """获取URL对应的主机标识"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def get_session(self, host):
+        """获取主机对应的会话，不存在时创建"""
+        session = self._sessions.get(host)
+        if session is not None:
+            return session
+
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({'Connection': 'keep-alive'})
+                self._sessions[host] = session
+                self._metrics[host] = {
+                    'requests': 0,
+                    'errors': 0,
+                    'total_latency_ms': 0.0,
+                    'max_latency_ms': 0.0,
+                }
+            return session
+
+    def check(self, url):
+        """熔断器打开时抛出 CircuitOpenError，不发送请求"""
+        if self.breaker is not None and self.breaker.enabled:
+            self.breaker.check(self.breaker.get_key(url, self.get_host(url)))
+
+    def post(self, url, **kwargs):
+        """发送POST请求，统计延迟并使用默认超时
+
+        熔断器打开时不发送请求，直接抛出 CircuitOpenError。
+        """
+        host = self.get_host(url)
+        session = self.get_session(host)
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+
+        breaker = self.breaker if self.breaker is not None and self.breaker.enabled else None
+        if breaker is not None:
+            breaker_key = breaker.get_key(url, host)
+            breaker_state = breaker.before_request(breaker_key)
+
+        start = time.monotonic()
+        failed = True
+        try:
+            response = session.post(url, **kwargs)
+            failed = False
+            return response
+        finally:
+            latency_ms = (time.monotonic() - start) * 1000
+            self._local.latency_ms = latency_ms
+            self._record(host, latency_ms, failed)
+            if breaker is not None:
+                # 服务端错误同样计入熔断器的失败数
+                server_error = not failed and response.status_code >= 500
+                breaker.after_request(breaker_key, breaker_state, latency_ms, failed or server_error)
+
+    def pop_latency(self):
+        """取出当前线程最近一次请求的耗时（毫秒），没有请求时返回None"""
+        latency_ms = getattr(self._local, 'latency_ms', None)
+        self._local.latency_ms = None
+        return latency_ms
+
+    def _record(self, host, latency_ms, failed):
+        """记录单次请求的指标"""
+        with self._lock:
+            metrics = self._metrics[host]
+            metrics['requests'] += 1
+            metrics['total_latency_ms'] += latency_ms
+            metrics['max_latency_ms'] = max(metrics['max_latency_ms'], latency_ms)
+            if failed:
+                metrics['errors'] += 1
+
+    def _connection_stats(self, host):
+        """从urllib3连接池读取新建连接数和请求数"""
+        session = self._sessions[host]
+        adapter = session.get_adapter(host)
+        new_connections = 0
+        pooled_requests = 0
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            pooled_requests += pool.num_requests
+        return new_connections, pooled_requests
+
+    def stats(self):
+        """按主机汇总的延迟与连接复用指标"""
+        with self._lock:
+            snapshot = {host: dict(metrics) for host, metrics in self._metrics.items()}
+
+        result = {}
+        for host, metrics in snapshot.items():
+            new_connections, pooled_requests = self._connection_stats(host)
+            requests_count = metrics['requests']
+            reused = max(pooled_requests - new_connections, 0)
+            result[host] = {
+                'requests': requests_count,
+                'errors': metrics['errors'],
+                'avg_latency_ms': round(metrics['total_latency_ms'] / requests_count, 2) if requests_count else 0.0,
+                'max_latency_ms': round(metrics['max_latency_ms'], 2),
+                'new_connections': new_connections,
+                'reused_connections': reused,
+                'reuse_rate': round(reused / pooled_requests, 4) if pooled_requests else 0.0,
+            }
+        return result
+
+    def close(self):
+        """关闭所有会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._metrics.clear()
+
+
+webhook_pool = WebhookSessionPool(
+    pool_size=getattr(settings, 'WEBHOOK_POOL_SIZE', 10),
+    connect_timeout=getattr(settings, 'WEBHOOK_CONNECT_TIMEOUT', 3),
+    read_timeout=getattr(settings, 'WEBHOOK_READ_TIMEOUT', 10),
+    breaker=circuit_breaker,
+)
@@ -7,6 +7,7 @@ router = DefaultRouter()
 router.register(r'templates', views.TemplateViewSet)
 router.register(r'robots', views.RobotViewSet)
 router.register(r'logs', views.MessageLogViewSet)
+router.register(r'dead-letters', views.DeadLetterViewSet)
 router.register(r'distribution/rules', views.DistributionRuleViewSet)
 router.register(r'distribution/instances', views.InstanceMappingViewSet)
 router.register(r'distribution/channels', views.DistributionChannelViewSet)
@@ -20,6 +21,8 @@ urlpatterns = [
     path('public/distribution/push/', views.DistributionPushView.as_view(), name='distribution-push'),
     path('templates/<int:template_id>/send/', views.TemplateDirectPushView.as_view(), name='template-direct-push'),
     path('templates/<int:template_id>/info/', views.TemplateInfoView.as_view(), name='template-info'),
+    path('metrics/', views.ServiceMetricsView.as_view(), name='service-metrics'),
+    path('circuit-breakers/', views.CircuitBreakerView.as_view(), name='circuit-breakers'),
     
     # 仪表盘相关接口
     path('dashboard/stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
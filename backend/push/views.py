@@ -3,11 +3,14 @@ import re
 import logging
 import base64
 import io
+import math
+import time
 import random
 import string
+from django.conf import settings
 from django.utils import timezone
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.core.cache import cache
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from rest_framework import viewsets, status, permissions, serializers
@@ -20,17 +23,63 @@ from PIL import Image
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Template, Robot, MessageLog, RobotType, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel
+from .models import (
+    Template, Robot, MessageLog, RobotType, DistributionRule, InstanceMapping, AlertRecord, DistributionChannel,
+    DeadLetter
+)
 from .serializers import (
-    TemplateSerializer, RobotSerializer, MessageLogSerializer,
+    TemplateSerializer, RobotSerializer, MessageLogSerializer, MessageLogListSerializer,
     MessagePushSerializer, DistributionRuleSerializer, InstanceMappingSerializer,
-    AlertRecordSerializer, RuleTestSerializer, DistributionChannelSerializer
+    AlertRecordSerializer, RuleTestSerializer, DistributionChannelSerializer,
+    DeliveryAttemptSerializer, DeadLetterSerializer
+)
+from .services import MessagePushService, template_cache
+from .transport import webhook_pool
+from .delivery import delivery_queue, use_async_delivery
+from .rules import rule_registry, parse_alert_document
+from .pagination import MessageLogCursorPagination
+from .retention import RetentionService
+from .cache import (
+    cached_response, cache_stats, store_captcha, get_captcha, consume_captcha, TEMPLATE_VERSION, ROBOTS_VERSION
 )
-from .services import MessagePushService
+from .routing import routing_table
+from .ratelimit import rate_limiter
+from .dedup import alert_deduplicator
+from .breaker import circuit_breaker
+from .retry import DeferredError, RetryScheduled
 
 logger = logging.getLogger(__name__)
 
 
+def queued_response(message_log):
+    """异步模式下的响应：消息已加入发送队列"""
+    return Response(
+        {"message": "消息已加入发送队列", "message_log_id": message_log.pk},
+        status=status.HTTP_202_ACCEPTED
+    )
+
+
+def push_response(success, error_msg):
+    """同步发送的响应：发送成功、发送未成功但已重新排队等待重试、超过发送频率限制、发送失败"""
+    if success:
+        return Response({"message": "消息推送成功"}, status=status.HTTP_200_OK)
+    if isinstance(error_msg, RetryScheduled):
+        return Response({
+            "message": "消息发送未成功，已加入重试队列",
+            "status": "retrying",
+            "message_log_id": error_msg.message_log_id,
+            "error": error_msg
+        }, status=status.HTTP_202_ACCEPTED)
+    if isinstance(error_msg, DeferredError):
+        retry_after = max(math.ceil(error_msg.retry_at - time.time()), 0)
+        return Response(
+            {"error": error_msg, "retry_after": retry_after},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(retry_after)}
+        )
+    return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """自定义JWT序列化器，添加上次登录时间和验证码验证"""
     
@@ -45,8 +94,8 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if not captcha_key or not captcha_input:
             raise serializers.ValidationError('验证码参数不完整')
         
-        # 从缓存中获取验证码
-        cached_captcha = cache.get(f'captcha_{captcha_key}')
+        # 从共享缓存中获取验证码
+        cached_captcha = get_captcha(captcha_key)
         
         if not cached_captcha:
             raise serializers.ValidationError('验证码已过期，请重新获取')
@@ -55,8 +104,9 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         if captcha_input != cached_captcha:
             raise serializers.ValidationError('验证码错误')
         
-        # 验证成功后删除缓存
-        cache.delete(f'captcha_{captcha_key}')
+        # 验证成功后删除缓存，已被其他请求使用时视为过期
+        if not consume_captcha(captcha_key):
+            raise serializers.ValidationError('验证码已过期，请重新获取')
         
         # 移除验证码相关字段，避免传递给父类
         attrs_copy = attrs.copy()
@@ -115,7 +165,7 @@ class CaptchaAPIView(APIView):
             captcha_key = ''.join(random.choices(string.ascii_lowercase + string.digits, k=32))
             
             # 将验证码文本存储到缓存中，5分钟过期
-            cache.set(f'captcha_{captcha_key}', captcha_text.lower(), 300)
+            store_captcha(captcha_key, captcha_text.lower(), 300)
             
             return Response({
                 'success': True,
@@ -144,8 +194,8 @@ class CaptchaAPIView(APIView):
                     'message': '验证码参数不完整'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # 从缓存中获取验证码
-            cached_captcha = cache.get(f'captcha_{captcha_key}')
+            # 从共享缓存中获取验证码
+            cached_captcha = get_captcha(captcha_key)
             
             if not cached_captcha:
                 return Response({
@@ -153,10 +203,8 @@ class CaptchaAPIView(APIView):
                     'message': '验证码已过期，请重新获取'
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # 验证码验证
-            if captcha_input == cached_captcha:
-                # 验证成功后删除缓存
-                cache.delete(f'captcha_{captcha_key}')
+            # 验证码正确时删除缓存，删除成功（未被其他请求使用）才算验证通过
+            if captcha_input == cached_captcha and consume_captcha(captcha_key):
                 return Response({
                     'success': True,
                     'message': '验证码验证成功'
@@ -182,7 +230,7 @@ class TemplateViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Template.objects.filter(created_by=self.request.user)
+        return Template.objects.filter(created_by=self.request.user).select_related('created_by')
 
 
 class RobotViewSet(viewsets.ModelViewSet):
@@ -192,17 +240,78 @@ class RobotViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Robot.objects.filter(created_by=self.request.user).order_by('-created_at')
+        return Robot.objects.filter(created_by=self.request.user).select_related('created_by').order_by('-created_at')
 
 
 class MessageLogViewSet(viewsets.ReadOnlyModelViewSet):
-    """消息日志视图集"""
+    """消息日志视图集
+
+    列表只返回摘要字段，发送内容和原始数据通过详情接口获取。
+    列表默认按页码分页，携带 cursor 参数或 pagination=cursor 时使用游标分页。
+    """
     queryset = MessageLog.objects.all()
     serializer_class = MessageLogSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.action == 'list' and MessageLogCursorPagination.is_requested(self.request):
+                self._paginator = MessageLogCursorPagination()
+            else:
+                self._paginator = self.pagination_class() if self.pagination_class else None
+        return self._paginator
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return MessageLogListSerializer
+        return MessageLogSerializer
+
     def get_queryset(self):
-        return MessageLog.objects.filter(created_by=self.request.user)
+        queryset = MessageLog.objects.filter(
+            created_by=self.request.user
+        ).select_related('template', 'robot', 'created_by')
+        if self.action == 'list':
+            # 按 id 排序区分同一时间创建的日志，保证翻页结果稳定
+            queryset = queryset.defer(*MessageLogListSerializer.deferred_fields).order_by('-created_at', '-id')
+        elif self.action == 'retrieve':
+            queryset = queryset.select_related('content_payload', 'raw_payload')
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def attempts(self, request, pk=None):
+        """消息的每次发送记录，包含耗时和错误信息"""
+        message_log = self.get_object()
+        serializer = DeliveryAttemptSerializer(message_log.delivery_attempts.all(), many=True)
+        return Response(serializer.data)
+
+
+class DeadLetterViewSet(viewsets.ReadOnlyModelViewSet):
+    """死信消息视图集
+
+    重试次数用尽仍发送失败的消息，平台恢复后可通过 replay 批量重新发送。
+    """
+    queryset = DeadLetter.objects.all()
+    serializer_class = DeadLetterSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return DeadLetter.objects.filter(
+            created_by=self.request.user
+        ).select_related('robot', 'message_log__template')
+
+    @action(detail=False, methods=['post'])
+    def replay(self, request):
+        """批量重新发送死信消息，未提供ID列表时重新发送全部死信消息"""
+        ids = request.data.get('ids', [])
+        dead_letters = self.get_queryset()
+        if ids:
+            dead_letters = dead_letters.filter(id__in=ids)
+        count = delivery_queue.replay(dead_letters)
+        return Response({
+            'message': f'已重新加入发送队列: {count}',
+            'replayed_count': count
+        })
 
 
 class MessagePushView(APIView):
@@ -234,9 +343,7 @@ class MessagePushView(APIView):
                     user=request.user
                 )
             
-            if success:
-                return Response({"message": "消息推送成功"}, status=status.HTTP_200_OK)
-            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+            return push_response(success, error_msg)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -246,9 +353,9 @@ class PublicMessagePushView(APIView):
     permission_classes = []  # 不需要认证
     
     def post(self, request, template_id, robot_id):
-        # 获取模板和机器人
-        template = get_object_or_404(Template, pk=template_id)
-        robot = get_object_or_404(Robot, pk=robot_id)
+        # 从路由表获取模板和机器人
+        template = routing_table.get_template(template_id)
+        robot = routing_table.get_robot(robot_id)
         
         # 确保模板和机器人类型匹配
         if template.robot_type != robot.robot_type:
@@ -261,6 +368,16 @@ class PublicMessagePushView(APIView):
             # 获取POST中的数据
             content_data = request.data
             
+            # 异步模式：加入发送队列后立即返回
+            if use_async_delivery(request):
+                message_log = delivery_queue.enqueue(
+                    template=template,
+                    robot=robot,
+                    data=content_data,
+                    user=template.created_by
+                )
+                return queued_response(message_log)
+            
             # 推送消息，使用模板创建者作为操作用户
             success, error_msg = MessagePushService.push_message(
                 template=template,
@@ -269,9 +386,7 @@ class PublicMessagePushView(APIView):
                 user=template.created_by  # 使用模板创建者作为操作用户
             )
             
-            if success:
-                return Response({"message": "消息推送成功"}, status=status.HTTP_200_OK)
-            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+            return push_response(success, error_msg)
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -297,7 +412,7 @@ class TemplateDirectPushView(APIView):
         系统会自动选择匹配的机器人发送
         """
         # 获取模板
-        template = get_object_or_404(Template, pk=template_id)
+        template = routing_table.get_template(template_id)
         
         try:
             # 获取POST中的数据
@@ -305,17 +420,8 @@ class TemplateDirectPushView(APIView):
             
             # 找到与模板类型匹配的机器人
             try:
-                # 优先选择模板创建者的机器人
-                robot = Robot.objects.filter(
-                    robot_type=template.robot_type,
-                    created_by=template.created_by
-                ).first()
-                
-                # 如果没有找到，则选择任意匹配类型的机器人
-                if not robot:
-                    robot = Robot.objects.filter(
-                        robot_type=template.robot_type
-                    ).first()
+                # 优先选择模板创建者的机器人，其次选择任意匹配类型的机器人
+                robot = routing_table.get_matching_robot(template)
                 
                 if not robot:
                     return Response(
@@ -328,6 +434,16 @@ class TemplateDirectPushView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
+            # 异步模式：加入发送队列后立即返回
+            if use_async_delivery(request):
+                message_log = delivery_queue.enqueue(
+                    template=template,
+                    robot=robot,
+                    data=content_data,
+                    user=template.created_by
+                )
+                return queued_response(message_log)
+            
             # 推送消息
             success, error_msg = MessagePushService.push_message(
                 template=template,
@@ -336,9 +452,7 @@ class TemplateDirectPushView(APIView):
                 user=template.created_by  # 使用模板创建者作为操作用户
             )
             
-            if success:
-                return Response({"message": "消息推送成功"}, status=status.HTTP_200_OK)
-            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+            return push_response(success, error_msg)
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -349,6 +463,16 @@ class TemplateInfoView(APIView):
     permission_classes = []  # 不需要认证
     
     def get(self, request, template_id):
+        """获取模板信息，响应按模板缓存，模板或机器人变化时失效"""
+        return cached_response(
+            request,
+            f'template_info_{template_id}',
+            [TEMPLATE_VERSION.format(template_id), ROBOTS_VERSION],
+            lambda: self.build_response(template_id),
+            getattr(settings, 'TEMPLATE_INFO_CACHE_TTL', 600)
+        )
+    
+    def build_response(self, template_id):
         """获取模板信息，包括变量列表和示例JSON"""
         template = get_object_or_404(Template, pk=template_id)
         
@@ -412,43 +536,28 @@ class PublicMessagePushByNameView(APIView):
         # 获取robot_english_name参数
         robot_english_name = request.query_params.get('robot_english_name')
         
-        # 获取模板
-        template = get_object_or_404(Template, pk=template_id)
+        # 从路由表获取模板，英文名称唯一，按名称查找最多得到一个机器人
+        template = routing_table.get_template(template_id)
         robot = None
 
         if robot_english_name:
-            robots_by_name = Robot.objects.filter(english_name=robot_english_name)
-            if robots_by_name.count() > 1:
+            robot = routing_table.get_robot_by_name(robot_english_name)
+            # 未找到时 robot 保持为 None, 会进入下面的 if not robot 逻辑
+
+        if not robot: # 如果robot_english_name未提供，或提供了但未找到机器人
+            # 尝试查找默认机器人：优先使用模板创建者的默认机器人，其次为全局默认机器人
+            robot = routing_table.get_default_robot(template.created_by_id)
+            if not robot:
+                # 未找到任何默认机器人
+                error_message = ""
+                if robot_english_name: #提供了robot_english_name但未找到，且无默认
+                    error_message = f"机器人 '{robot_english_name}' 未找到，且未配置默认机器人。"
+                else: # 未提供robot_english_name，且无默认
+                    error_message = "未提供机器人英文名称，且未找到默认机器人。请指定机器人或设置一个默认机器人。"
                 return Response(
-                    {"error": f"存在多个英文名称为'{robot_english_name}'的机器人，请确保英文名称唯一"},
-                    status=status.HTTP_400_BAD_REQUEST
+                    {"error": error_message},
+                    status=status.HTTP_404_NOT_FOUND
                 )
-            elif robots_by_name.count() == 1:
-                robot = robots_by_name.first()
-            # 如果 robots_by_name.count() == 0, robot 保持为 None, 会进入下面的 if not robot 逻辑
-
-        if not robot: # 如果robot_english_name未提供，或提供了但未找到唯一机器人
-            # 尝试查找默认机器人
-            # 1. 优先查找模板创建者的默认机器人
-            default_robots_by_creator = Robot.objects.filter(is_default=True, created_by=template.created_by)
-            if default_robots_by_creator.exists():
-                robot = default_robots_by_creator.first() # 如果找到多个，取第一个
-            else:
-                # 2. 如果模板创建者没有默认机器人，则查找全局默认机器人
-                global_default_robots = Robot.objects.filter(is_default=True)
-                if global_default_robots.exists():
-                    robot = global_default_robots.first() # 如果找到多个，取第一个
-                else:
-                    # 未找到任何默认机器人
-                    error_message = ""
-                    if robot_english_name: #提供了robot_english_name但未找到，且无默认
-                        error_message = f"机器人 '{robot_english_name}' 未找到，且未配置默认机器人。"
-                    else: # 未提供robot_english_name，且无默认
-                        error_message = "未提供机器人英文名称，且未找到默认机器人。请指定机器人或设置一个默认机器人。"
-                    return Response(
-                        {"error": error_message},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
         
         # 此时，如果robot仍然是None，说明逻辑有误，或者确实没有任何可用的机器人
         if not robot:
@@ -466,6 +575,16 @@ class PublicMessagePushByNameView(APIView):
             # 获取POST中的数据
             content_data = request.data
             
+            # 异步模式：加入发送队列后立即返回
+            if use_async_delivery(request):
+                message_log = delivery_queue.enqueue(
+                    template=template,
+                    robot=robot,
+                    data=content_data,
+                    user=template.created_by
+                )
+                return queued_response(message_log)
+            
             # 推送消息，使用模板创建者作为操作用户
             success, error_msg = MessagePushService.push_message(
                 template=template,
@@ -474,14 +593,46 @@ class PublicMessagePushByNameView(APIView):
                 user=template.created_by  # 使用模板创建者作为操作用户
             )
             
-            if success:
-                return Response({"message": "消息推送成功"}, status=status.HTTP_200_OK)
-            return Response({"error": error_msg}, status=status.HTTP_400_BAD_REQUEST)
+            return push_response(success, error_msg)
             
         except Exception as e:
             return Response({"error": f"消息推送失败: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ServiceMetricsView(APIView):
+    """服务运行指标视图"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """获取当前进程的运行指标"""
+        return Response({
+            'template_cache': template_cache.stats(),
+            'webhook_hosts': webhook_pool.stats(),
+            'delivery_queue': delivery_queue.stats(),
+            'routing_table': routing_table.stats(),
+            'rate_limits': rate_limiter.stats(),
+            'alert_dedup': alert_deduplicator.stats(),
+            'cache': cache_stats(),
+        })
+
+
+class CircuitBreakerView(APIView):
+    """Webhook熔断器视图"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """获取所有熔断器的状态"""
+        return Response(circuit_breaker.stats())
+
+    def post(self, request):
+        """重置熔断器，请求体 key 为空时重置全部熔断器"""
+        keys = circuit_breaker.reset(request.data.get('key'))
+        return Response({
+            'message': f'已重置 {len(keys)} 个熔断器',
+            'reset': keys
+        })
+
+
 class DistributionRuleViewSet(viewsets.ModelViewSet):
     """分发规则视图集"""
     queryset = DistributionRule.objects.all()
@@ -519,6 +670,12 @@ class InstanceMappingViewSet(viewsets.ModelViewSet):
     serializer_class = InstanceMappingSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        # 预取分发通道及其机器人，序列化时不再按实例逐条查询
+        return InstanceMapping.objects.select_related('source_rule').prefetch_related(
+            Prefetch('distribution_channels', queryset=DistributionChannel.objects.select_related('robot'))
+        )
+
     @action(detail=False, methods=['post'])
     def batch_configure(self, request):
         """批量配置实例映射 - 支持分发通道"""
@@ -601,14 +758,22 @@ class InstanceMappingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @staticmethod
+    def get_alert_records(instance_mapping_id):
+        """实例最近20条告警记录"""
+        from .models import AlertRecord
+        
+        return AlertRecord.objects.filter(
+            instance_mapping_id=instance_mapping_id
+        ).select_related('instance_mapping', 'raw_payload').order_by('-alert_time')[:20]
+
     @action(detail=True, methods=['get'])
     def alerts(self, request, pk=None):
         """获取实例的告警记录"""
-        from .models import AlertRecord
         from .serializers import AlertRecordSerializer
         
         instance = self.get_object()
-        alerts = AlertRecord.objects.filter(instance_mapping=instance).order_by('-alert_time')[:20]
+        alerts = self.get_alert_records(instance.pk)
         serializer = AlertRecordSerializer(alerts, many=True)
         return Response(serializer.data)
 
@@ -619,28 +784,47 @@ class DistributionAlertView(APIView):
     
     def post(self, request):
         """处理告警数据"""
-        from .models import DistributionRule
         from .services import DistributionService
         
+        # 已登记去重的告警，处理失败时撤销登记
+        registered = None
         try:
             raw_data = request.body.decode('utf-8')
             
-            # 获取所有启用的分发规则
-            active_rules = DistributionRule.objects.filter(is_active=True)
+            # 获取所有启用的分发规则（预编译并缓存）
+            active_rules = rule_registry.get_active_rules()
+            
+            # 告警数据只解析一次，所有JSON规则共用解析结果
+            document = parse_alert_document(raw_data)
+            
+            # 窗口期内重复的告警不再写入告警记录
+            document, duplicate_count = alert_deduplicator.filter(document, 'alert')
+            registered = document
+            if duplicate_count and not document['alerts']:
+                return Response({
+                    'message': '告警均为重复告警，已忽略',
+                    'processed_instances': [],
+                    'count': 0,
+                    'duplicate_count': duplicate_count
+                })
+            if duplicate_count:
+                raw_data = json.dumps(document, ensure_ascii=False)
             
             processed_instances = []
             for rule in active_rules:
                 # 处理告警数据
-                extracted_values = DistributionService.process_alert_data(rule, raw_data)
+                extracted_values = DistributionService.process_alert_data(rule, raw_data, document)
                 if extracted_values:
                     processed_instances.extend(extracted_values)
             
             return Response({
                 'message': '告警数据处理成功',
                 'processed_instances': list(set(processed_instances)),
-                'count': len(set(processed_instances))
+                'count': len(set(processed_instances)),
+                'duplicate_count': duplicate_count
             })
         except Exception as e:
+            alert_deduplicator.release(registered, 'alert')
             return Response(
                 {'error': f'告警处理失败: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -652,16 +836,12 @@ class RefreshInstancesView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
-        """手动刷新实例数据"""
-        # 这里可以添加定期任务或手动触发的实例数据更新逻辑
+        """手动刷新实例数据：按保留策略清理过期的告警记录和消息日志，并汇总统计信息"""
         try:
-            # 可以添加更复杂的刷新逻辑，比如：
-            # 1. 清理过期的实例数据
-            # 2. 更新统计信息
-            # 3. 触发重新扫描等
-            
+            result = RetentionService.run()
             return Response({
-                'message': '实例数据刷新成功'
+                'message': '实例数据刷新成功',
+                'purged': result
             })
         except Exception as e:
             return Response(
@@ -694,25 +874,47 @@ class DistributionPushView(APIView):
     
     def post(self, request):
         """处理分发推送请求"""
-        from .models import DistributionRule, InstanceMapping
-        from .services import DistributionService, MessagePushService
+        from .models import InstanceMapping
+        from .services import DistributionService
         
+        # 已登记去重的告警，写入或推送失败时撤销登记
+        registered = None
         try:
-            raw_data = json.dumps(request.data)
-            content_data = request.data
+            # request.data 已由解析器解码，直接交给各规则使用；原始文本仅用于存储
+            # 窗口期内重复的告警不再写入告警记录，也不再推送
+            content_data, duplicate_count = alert_deduplicator.filter(request.data, 'push')
+            registered = content_data
+            if duplicate_count and not content_data['alerts']:
+                return Response({
+                    'message': '告警均为重复告警，已忽略',
+                    'success_count': 0,
+                    'error_count': 0,
+                    'retrying_count': 0,
+                    'duplicate_count': duplicate_count,
+                    'processed_instances': [],
+                    'total_instances': 0,
+                    'results': []
+                })
+            raw_data = json.dumps(content_data, ensure_ascii=False)
             
-            # 获取所有启用的分发规则
-            active_rules = DistributionRule.objects.filter(is_active=True)
+            # 获取所有启用的分发规则（预编译并缓存）
+            active_rules = rule_registry.get_active_rules()
             
+            async_mode = use_async_delivery(request)
             processed_instances = []
             success_count = 0
             error_count = 0
+            failed_rules = 0
+            retrying_count = 0
+            queued_count = 0
             results = []
+            # 待发送的消息，先收集再统一并发推送: (结果序号, template, robot, data, user)
+            deliveries = []
             
             for rule in active_rules:
                 try:
                     # 处理告警数据，提取实例信息
-                    extracted_values = DistributionService.process_alert_data(rule, raw_data)
+                    extracted_values = DistributionService.process_alert_data(rule, raw_data, content_data)
                     
                     for instance_name in extracted_values:
                         # 查找实例映射
@@ -722,9 +924,11 @@ class DistributionPushView(APIView):
                             )
                             
                             # 获取实例配置的所有分发通道
-                            channels = instance_mapping.distribution_channels.filter(is_active=True)
+                            channels = list(instance_mapping.distribution_channels.filter(
+                                is_active=True
+                            ).select_related('robot', 'template', 'created_by'))
                             
-                            if channels.exists():
+                            if channels:
                                 # 向所有配置的分发通道推送消息
                                 for channel in channels:
                                     # 在消息数据中添加实例信息
@@ -732,33 +936,31 @@ class DistributionPushView(APIView):
                                     enhanced_data['instance_name'] = instance_name
                                     enhanced_data['rule_name'] = rule.name
                                     
-                                    # 推送消息
-                                    success, error_msg = MessagePushService.push_message(
-                                        template=channel.template,
-                                        robot=channel.robot,
-                                        data=enhanced_data,
-                                        user=channel.created_by
-                                    )
+                                    result = {
+                                        'instance': instance_name,
+                                        'channel': channel.name,
+                                        'robot': channel.robot.name,
+                                        'template': channel.template.name,
+                                    }
                                     
-                                    if success:
-                                        success_count += 1
-                                        results.append({
-                                            'instance': instance_name,
-                                            'channel': channel.name,
-                                            'robot': channel.robot.name,
-                                            'template': channel.template.name,
-                                            'status': 'success'
-                                        })
+                                    # 异步模式或通道开启了消息合并：加入发送队列，结果中返回消息日志ID
+                                    if async_mode or channel.coalesce_window:
+                                        message_log = delivery_queue.enqueue(
+                                            template=channel.template,
+                                            robot=channel.robot,
+                                            data=enhanced_data,
+                                            user=channel.created_by,
+                                            channel=channel
+                                        )
+                                        queued_count += 1
+                                        result['status'] = 'queued'
+                                        result['message_log_id'] = message_log.pk
                                     else:
-                                        error_count += 1
-                                        results.append({
-                                            'instance': instance_name,
-                                            'channel': channel.name,
-                                            'robot': channel.robot.name,
-                                            'template': channel.template.name,
-                                            'status': 'error',
-                                            'error': error_msg
-                                        })
+                                        deliveries.append((
+                                            len(results), channel.template, channel.robot,
+                                            enhanced_data, channel.created_by
+                                        ))
+                                    results.append(result)
                             else:
                                 # 实例没有配置任何分发通道，记录但不推送
                                 results.append({
@@ -785,19 +987,57 @@ class DistributionPushView(APIView):
                         
                 except Exception as e:
                     logger.error(f"处理规则 {rule.name} 时出错: {str(e)}")
+                    failed_rules += 1
                     continue
             
-            return Response({
+            # 并发推送所有消息，结果按收集顺序回填
+            outcomes = DistributionService.push_concurrently(
+                [delivery[1:] for delivery in deliveries]
+            )
+            for delivery, (success, error_msg) in zip(deliveries, outcomes):
+                result = results[delivery[0]]
+                if success:
+                    success_count += 1
+                    result['status'] = 'success'
+                elif isinstance(error_msg, RetryScheduled):
+                    # 发送未成功但已重新排队，由发送队列稍后重试，不计为失败
+                    retrying_count += 1
+                    result['status'] = 'retrying'
+                    result['message_log_id'] = error_msg.message_log_id
+                    result['error'] = error_msg
+                else:
+                    error_count += 1
+                    result['status'] = 'error'
+                    result['error'] = error_msg
+            
+            if failed_rules or error_count:
+                # 部分告警未能写入或推送，副本或 Alertmanager 重发时重新处理
+                alert_deduplicator.release(registered, 'push')
+            
+            response_data = {
                 'message': f'分发推送完成，成功: {success_count}, 失败: {error_count}',
                 'success_count': success_count,
                 'error_count': error_count,
+                'retrying_count': retrying_count,
+                'duplicate_count': duplicate_count,
                 'processed_instances': list(set(processed_instances)),
                 'total_instances': len(set(processed_instances)),
                 'results': results
-            })
+            }
+            if async_mode:
+                response_data['message'] = f'分发推送已加入发送队列，排队: {queued_count}'
+                response_data['queued_count'] = queued_count
+                return Response(response_data, status=status.HTTP_202_ACCEPTED)
+            if retrying_count:
+                response_data['message'] += f', 等待重试: {retrying_count}'
+            if queued_count:
+                response_data['message'] += f', 合并发送排队: {queued_count}'
+                response_data['queued_count'] = queued_count
+            return Response(response_data)
             
         except Exception as e:
             logger.error(f"分发推送失败: {str(e)}")
+            alert_deduplicator.release(registered, 'push')
             return Response(
                 {'error': f'分发推送失败: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -811,4 +1051,6 @@ class DistributionChannelViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return DistributionChannel.objects.filter(created_by=self.request.user).order_by('-updated_at')
+        return DistributionChannel.objects.filter(
+            created_by=self.request.user
+        ).select_related('robot', 'template', 'created_by').order_by('-updated_at')
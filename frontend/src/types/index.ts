@@ -44,6 +44,7 @@ export interface Robot {
   webhook_url: string;
   robot_type: RobotType;
   is_default: boolean;
+  rate_limit?: number | null;
   description: string;
   created_by: User;
   created_at: string;
@@ -61,6 +62,7 @@ export interface MessageLog {
   raw_data: string;
   formatted_content: string;
   status: boolean;
+  delivery_status?: 'queued' | 'processing' | 'done';
   error_message: string;
   created_by: number;
   created_by_username: string;
@@ -106,6 +108,9 @@ export interface DistributionChannel {
   template_robot_type: RobotType;
   description: string;
   is_active: boolean;
+  coalesce_window: number;
+  coalesce_max_batch: number;
+  batch_template: string;
   created_by: number;
   created_by_name: string;
   created_at: string;